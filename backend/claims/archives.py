@@ -0,0 +1,256 @@
+"""
+ZIP archives of a claim's documents, streamed straight from storage.
+
+Entries are stored uncompressed (scans and photos don't deflate anyway) with their CRC-32 in a
+data descriptor after the bytes, so the whole layout, and the archive size, is known before
+anything is read. Any byte range of the archive can then be produced on its own: that is what
+lets a client resume a multi-gigabyte download with an HTTP Range request.
+"""
+import hashlib
+import os
+import re
+import struct
+import zlib
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .models import DocumentBlob
+
+READ_BLOCK = 256 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+
+LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+END_RECORD = struct.Struct('<4s4H2LH')
+ZIP64_END_RECORD = struct.Struct('<4sQ2H2L4Q')
+ZIP64_LOCATOR = struct.Struct('<4sLQL')
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+UNIX_FILE = 0o100644 << 16
+
+
+class ArchiveEntry:
+    __slots__ = ('document', 'name', 'path', 'size', 'blob_id', 'crc32', 'offset', 'dos_time', 'dos_date')
+
+    def __init__(self, document, name, path, size):
+        self.document = document
+        self.name = name.encode('utf-8')
+        self.path = path
+        self.size = size
+        self.blob_id = document.blob_id
+        self.crc32 = document.blob.crc32 if document.blob_id else None
+        self.offset = 0
+        self.dos_time, self.dos_date = dos_timestamp(document.uploaded_at)
+
+    @property
+    def zip64(self):
+        return self.size >= ZIP64_LIMIT
+
+    @property
+    def local_header_size(self):
+        return LOCAL_HEADER.size + len(self.name) + (20 if self.zip64 else 0)
+
+    @property
+    def descriptor_size(self):
+        return 24 if self.zip64 else 16
+
+    @property
+    def central_extra(self):
+        extra = b''
+        if self.zip64:
+            extra += struct.pack('<2Q', self.size, self.size)
+        if self.offset >= ZIP64_LIMIT:
+            extra += struct.pack('<Q', self.offset)
+        return struct.pack('<2H', 1, len(extra)) + extra if extra else b''
+
+    @property
+    def central_header_size(self):
+        return CENTRAL_HEADER.size + len(self.name) + len(self.central_extra)
+
+
+def dos_timestamp(moment):
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    if moment.year < 1980:
+        return 0, (1 << 5) | 1
+    return (
+        (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2),
+        ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day,
+    )
+
+
+def entry_name(document, path):
+    # blob files are named after their hash, the archive names documents after what they are
+    extension = os.path.splitext(path)[1].lower()
+    return f'{document.document_type}/{document.pk}{extension}'
+
+
+class DocumentArchive:
+    """
+    the archive of `documents` (ClaimDocuments with their blob loaded), laid out up front.
+    `size` and `etag` describe the archive before a single byte of it is produced
+    """
+
+    def __init__(self, documents):
+        self.entries = []
+        for document in documents:
+            if document.blob_id:
+                size = document.blob.size
+            else:
+                try:
+                    size = default_storage.size(document.file.name)
+                except OSError:
+                    # a legacy document whose file is gone, leave it out rather than break the archive
+                    continue
+            self.entries.append(ArchiveEntry(document, entry_name(document, document.file.name), document.file.name, size))
+
+        offset = 0
+        for entry in self.entries:
+            entry.offset = offset
+            offset += entry.local_header_size + entry.size + entry.descriptor_size
+        self.central_offset = offset
+        self.central_size = sum(entry.central_header_size for entry in self.entries)
+        self.zip64 = (
+            len(self.entries) >= 0xFFFF
+            or self.central_offset >= ZIP64_LIMIT
+            or self.central_size >= ZIP64_LIMIT
+        )
+        end_size = END_RECORD.size + (ZIP64_END_RECORD.size + ZIP64_LOCATOR.size if self.zip64 else 0)
+        self.size = self.central_offset + self.central_size + end_size
+
+    @property
+    def etag(self):
+        manifest = hashlib.sha256()
+        for entry in self.entries:
+            manifest.update(f'{entry.name!r}:{entry.path}:{entry.size}:{entry.offset};'.encode())
+        return f'"{manifest.hexdigest()[:32]}"'
+
+    def segments(self):
+        """(length, producer) of every part of the archive in order, producer(skip, count) yields its bytes"""
+        for entry in self.entries:
+            yield entry.local_header_size, self._bytes(self.local_header, entry)
+            yield entry.size, lambda skip, count, entry=entry: self.read_data(entry, skip, count)
+            yield entry.descriptor_size, self._bytes(self.descriptor, entry)
+        for entry in self.entries:
+            yield entry.central_header_size, self._bytes(self.central_header, entry)
+        yield self.size - self.central_offset - self.central_size, self._bytes(self.end_records)
+
+    def iter_bytes(self, start=0, end=None):
+        """yield the bytes [start, end) of the archive, reading a block of a document at a time"""
+        end = self.size if end is None else end
+        position = 0
+        for length, producer in self.segments():
+            if position >= end:
+                break
+            if position + length > start:
+                skip = max(start - position, 0)
+                count = min(position + length, end) - position - skip
+                if count > 0:
+                    yield from producer(skip, count)
+            position += length
+
+    @staticmethod
+    def _bytes(build, *args):
+        def producer(skip, count):
+            yield build(*args)[skip:skip + count]
+        return producer
+
+    def local_header(self, entry):
+        # with a data descriptor the local header leaves CRC and sizes to it and to the central directory
+        size_field = ZIP64_LIMIT if entry.zip64 else 0
+        extra = struct.pack('<2H2Q', 1, 16, 0, 0) if entry.zip64 else b''
+        return LOCAL_HEADER.pack(
+            b'PK\x03\x04', 45 if entry.zip64 else 20, 0, FLAG_DATA_DESCRIPTOR | FLAG_UTF8, 0,
+            entry.dos_time, entry.dos_date, 0, size_field, size_field, len(entry.name), len(extra),
+        ) + entry.name + extra
+
+    def descriptor(self, entry):
+        size_format = 'Q' if entry.zip64 else 'L'
+        return struct.pack(f'<4sL2{size_format}', b'PK\x07\x08', self.crc32(entry), entry.size, entry.size)
+
+    def central_header(self, entry):
+        extra = entry.central_extra
+        size = min(entry.size, ZIP64_LIMIT)
+        version = 45 if extra else 20
+        return CENTRAL_HEADER.pack(
+            b'PK\x01\x02', version, 3, version, 0, FLAG_DATA_DESCRIPTOR | FLAG_UTF8, 0,
+            entry.dos_time, entry.dos_date, self.crc32(entry), size, size,
+            len(entry.name), len(extra), 0, 0, 0, UNIX_FILE, min(entry.offset, ZIP64_LIMIT),
+        ) + entry.name + extra
+
+    def end_records(self):
+        count = len(self.entries)
+        records = b''
+        if self.zip64:
+            zip64_offset = self.central_offset + self.central_size
+            records += ZIP64_END_RECORD.pack(
+                b'PK\x06\x06', ZIP64_END_RECORD.size - 12, 45, 45, 0, 0,
+                count, count, self.central_size, self.central_offset,
+            )
+            records += ZIP64_LOCATOR.pack(b'PK\x06\x07', 0, zip64_offset, 1)
+        return records + END_RECORD.pack(
+            b'PK\x05\x06', 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(self.central_size, ZIP64_LIMIT), min(self.central_offset, ZIP64_LIMIT), 0,
+        )
+
+    def read_data(self, entry, skip, count):
+        # a document sent whole gets its CRC-32 computed on the way, a resumed one needs it read separately
+        checksum = 0 if skip == 0 and count == entry.size and entry.crc32 is None else None
+        with default_storage.open(entry.path, 'rb') as file:
+            file.seek(skip)
+            while count > 0:
+                block = file.read(min(READ_BLOCK, count))
+                if not block:
+                    raise OSError(f'{entry.path} is shorter than expected')
+                if checksum is not None:
+                    checksum = zlib.crc32(block, checksum)
+                count -= len(block)
+                yield block
+        if checksum is not None:
+            self.remember_crc32(entry, checksum)
+
+    def crc32(self, entry):
+        if entry.crc32 is None:
+            checksum = 0
+            with default_storage.open(entry.path, 'rb') as file:
+                for block in iter(lambda: file.read(READ_BLOCK), b''):
+                    checksum = zlib.crc32(block, checksum)
+            self.remember_crc32(entry, checksum)
+        return entry.crc32
+
+    @staticmethod
+    def remember_crc32(entry, checksum):
+        entry.crc32 = checksum
+        if entry.blob_id:
+            # the content behind a blob never changes, the next archive won't read it twice
+            DocumentBlob.objects.filter(sha256=entry.blob_id, crc32=None).update(crc32=checksum)
+
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    (start, end) with `end` exclusive for a single-range `Range` header, None to send the whole
+    archive (no header, several ranges, or a syntax we don't handle). raises ValueError when
+    the range is not satisfiable
+    """
+    match = RANGE_PATTERN.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('empty suffix range')
+        return max(size - length, 0), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        raise ValueError('range starts past the end of the archive')
+    return start, end
@@ -0,0 +1,166 @@
+import heapq
+from decimal import Decimal
+
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from policies.models import Policy
+from users.models import User
+from .models import Claim, ClaimStatusChange, CLOSED_STATUSES
+from .utils import apply_counter_deltas, record_status_changes
+
+# roles claims can be assigned to automatically
+ASSIGNABLE_ROLES = ['adjuster', 'senior_adjuster']
+
+# every open claim weighs 1 plus 1 per LOAD_AMOUNT_UNIT of claimed amount
+LOAD_AMOUNT_UNIT = Decimal('10000')
+
+# most claims a single auto-assign call handles
+AUTO_ASSIGN_LIMIT = 5000
+
+
+def claim_weight(claim_amount):
+    return 1 + (claim_amount or 0) / LOAD_AMOUNT_UNIT
+
+
+def eligible_workloads(exclude_user_id=None):
+    """
+    {user_id: load} for every active adjuster/senior adjuster, load being the weighted sum of their
+    open claims. the open claims are summed on their own, an index only scan of the
+    claim_open_workload_idx partial index, and merged with the users afterwards
+    """
+    users = User.objects.filter(role__in=ASSIGNABLE_ROLES, is_active=True)
+    if exclude_user_id is not None:
+        users = users.exclude(pk=exclude_user_id)
+    workloads = {user_id: Decimal('0') for user_id in users.values_list('id', flat=True)}
+    if not workloads:
+        return workloads
+    loads = Claim.objects.exclude(status__in=CLOSED_STATUSES).filter(
+        assigned_to__in=list(workloads),
+    ).values('assigned_to').annotate(
+        open_count=models.Count('*'),
+        open_amount=Coalesce(models.Sum('claim_amount'), Decimal('0')),
+    ).order_by().values_list('assigned_to', 'open_count', 'open_amount')
+    for user_id, count, amount in loads:
+        workloads[user_id] = count + amount / LOAD_AMOUNT_UNIT
+    return workloads
+
+
+def balance(claims, workloads):
+    """
+    spread `claims` ([(claim_id, claim_amount)]) over `workloads` ({user_id: load}):
+    biggest claims first, each one to the currently least loaded user. returns {claim_id: user_id}
+    """
+    heap = [(load, str(user_id), user_id) for user_id, load in workloads.items()]
+    heapq.heapify(heap)
+    plan = {}
+    for claim_id, claim_amount in sorted(claims, key=lambda claim: claim[1] or 0, reverse=True):
+        load, key, user_id = heapq.heappop(heap)
+        plan[claim_id] = user_id
+        heapq.heappush(heap, (load + claim_weight(claim_amount), key, user_id))
+    return plan
+
+
+def apply_assignment_plan(plan, changed_by=None):
+    """
+    write `plan` ({claim_id: user_id}) with a single UPDATE ... FROM (VALUES ...), then log the
+    reassignments and move the counters with one statement each. returns the ids of the claims updated
+    """
+    if not plan:
+        return []
+
+    table = connection.ops.quote_name(Claim._meta.db_table)
+    policy_table = connection.ops.quote_name(Policy._meta.db_table)
+    values = ', '.join(['(%s::bigint, %s::uuid)'] * len(plan))
+    params = [value for claim_id, user_id in plan.items() for value in (claim_id, str(user_id))]
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS claim
+            SET assigned_to_id = plan.user_id, updated_at = %s, version = claim.version + 1
+            FROM (VALUES {values}) AS plan (claim_id, user_id),
+                 (SELECT c.id, c.assigned_to_id, p.policy_type FROM {table} c
+                  JOIN {policy_table} p ON p.id = c.policy_id
+                  WHERE c.id = ANY(%s)
+                  FOR UPDATE OF c) AS previous
+            WHERE claim.id = plan.claim_id AND previous.id = plan.claim_id
+            RETURNING claim.id, previous.assigned_to_id, claim.assigned_to_id, claim.status, claim.tenant_id, previous.policy_type
+            """,
+            [now, *params, list(plan)],
+        )
+        rows = cursor.fetchall()
+
+    deltas = {}
+    for _, previous_user_id, user_id, status, tenant_id, policy_type in rows:
+        before = (tenant_id, status, previous_user_id, policy_type)
+        after = (tenant_id, status, user_id, policy_type)
+        deltas[before] = deltas.get(before, 0) - 1
+        deltas[after] = deltas.get(after, 0) + 1
+    apply_counter_deltas(deltas)
+    record_status_changes([
+        ClaimStatusChange(
+            claim_id=claim_id,
+            previous_status=status,
+            status=status,
+            assigned_to_id=user_id,
+            changed_by=changed_by,
+            changed_at=now,
+        )
+        for claim_id, _, user_id, status, _, _ in rows
+    ])
+    return [row[0] for row in rows]
+
+
+def _lock_assignments(cursor):
+    # one auto-assignment at a time per tenant, so two batches never balance against the same stale loads
+    cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'claims_auto_assign:{connection.schema_name}'])
+
+
+def auto_assign(claim_ids=None, limit=AUTO_ASSIGN_LIMIT, changed_by=None):
+    """
+    assign `claim_ids` (default: the oldest unassigned reported claims, up to `limit`) to the least
+    loaded eligible users. closed claims are skipped. returns {claim_id: user_id}
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            _lock_assignments(cursor)
+
+        claims = Claim.objects.exclude(status__in=CLOSED_STATUSES)
+        if claim_ids is None:
+            claims = claims.filter(status='reported', assigned_to__isnull=True).order_by('created_at', 'id')
+        else:
+            claims = claims.filter(pk__in=claim_ids)
+        # claims someone else is updating right now are left for the next run
+        claims = list(claims.select_for_update(skip_locked=True).values_list('id', 'claim_amount')[:limit])
+
+        workloads = eligible_workloads()
+        if not claims or not workloads:
+            return {}
+        plan = balance(claims, workloads)
+        apply_assignment_plan(plan, changed_by=changed_by)
+    return plan
+
+
+def reassign_open_claims(from_user_id, changed_by=None):
+    """
+    hand every open claim of `from_user_id` (e.g. someone leaving) over to the other eligible users,
+    balancing as auto_assign does. returns {claim_id: user_id}
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            _lock_assignments(cursor)
+
+        claims = list(
+            Claim.objects.filter(assigned_to_id=from_user_id)
+            .exclude(status__in=CLOSED_STATUSES)
+            .select_for_update()
+            .values_list('id', 'claim_amount')
+        )
+        workloads = eligible_workloads(exclude_user_id=from_user_id)
+        if not claims or not workloads:
+            return {}
+        plan = balance(claims, workloads)
+        apply_assignment_plan(plan, changed_by=changed_by)
+    return plan
@@ -0,0 +1,86 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.db import connection, models, transaction
+
+from .models import ClaimDocument, DocumentBlob
+
+
+def blob_root(schema_name=None):
+    """
+    claim_documents/<schema>/blobs: blobs are reference counted per tenant schema, so each tenant
+    keeps its own copy of a content and freeing it never touches the files of another tenant
+    """
+    return os.path.join('claim_documents', schema_name or connection.schema_name, 'blobs')
+
+
+def blob_name(sha256, filename):
+    """claim_documents/<schema>/blobs/ab/cd/abcd...<ext>, the extension only helps serving the file"""
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return os.path.join(blob_root(), sha256[:2], sha256[2:4], f'{sha256}{extension}')
+
+
+def hash_uploaded_file(uploaded_file):
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    uploaded_file.seek(0)
+    return hasher.hexdigest()
+
+
+def store_uploaded_file(uploaded_file):
+    """
+    store a multipart upload content-addressed: when a blob with the same SHA-256 exists only a
+    reference is added and nothing is written. returns the DocumentBlob's (sha256, file name)
+    """
+    sha256 = hash_uploaded_file(uploaded_file)
+    with transaction.atomic():
+        name, _ = DocumentBlob.acquire(sha256, blob_name(sha256, uploaded_file.name), uploaded_file.size)
+        if not default_storage.exists(name):
+            stored = default_storage.save(name, uploaded_file)
+            if stored != name:
+                # written concurrently by an identical upload, keep a single copy
+                default_storage.delete(stored)
+    return sha256, name
+
+
+def store_local_file(path, sha256, size, filename):
+    """
+    same as store_uploaded_file for bytes already on the storage's disk (chunked uploads):
+    the file is renamed into the blob if it is new, dropped otherwise
+    """
+    with transaction.atomic():
+        name, _ = DocumentBlob.acquire(sha256, blob_name(sha256, filename), size)
+        if default_storage.exists(name):
+            os.remove(path)
+        else:
+            target = default_storage.path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+    return sha256, name
+
+
+def rebuild_blob_refs(fix=True):
+    """
+    recount the references of every blob from the documents pointing at it and, if `fix`,
+    correct the counts and free the blobs nothing points at. returns {sha256: (counted, stored)}
+    """
+    counted = dict(
+        ClaimDocument.objects.exclude(blob=None)
+        .values_list('blob_id')
+        .annotate(total=models.Count('id'))
+        .order_by()
+    )
+    drift = {
+        sha256: (counted.get(sha256, 0), ref_count)
+        for sha256, ref_count in DocumentBlob.objects.values_list('sha256', 'ref_count')
+        if counted.get(sha256, 0) != ref_count
+    }
+    if fix and drift:
+        with transaction.atomic():
+            for sha256, (count, ref_count) in drift.items():
+                # compare-and-set, a document attached or deleted meanwhile keeps its own count
+                DocumentBlob.objects.filter(sha256=sha256, ref_count=ref_count).update(ref_count=count)
+            DocumentBlob.free_unreferenced([sha256 for sha256, (count, _) in drift.items() if count == 0])
+    return drift
@@ -0,0 +1,237 @@
+"""
+Live claim events: status changes, assignments, new notes and new documents, pushed to the
+clients of the tenant over Server-Sent Events (see views.claim_events).
+
+Events are published once the transaction that produced them commits and are fanned out to the
+subscribers of the tenant's channel (its schema name) by the backend named in
+settings.CLAIM_EVENTS_BACKEND:
+
+- LocalBackend delivers within the process, enough for a single node.
+- PostgresBackend goes through NOTIFY/LISTEN so every node sees the events of all the others,
+  each process keeping a single listening connection however many clients it serves.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from collections import defaultdict
+from functools import partial
+
+import psycopg2
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils.module_loading import import_string
+
+from mlt_ins.access import has_object_access
+
+from .models import Claim
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """events of one channel for one client, consumed from the event loop that opened it"""
+
+    def __init__(self, backend, channel, claim_id=None, user=None, maxsize=1000):
+        self.backend = backend
+        self.channel = channel
+        self.claim_id = claim_id
+        # a user who may only see some claims, None for one who sees all of them
+        self.user = user
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.lagged = False
+
+    def put(self, events):
+        # called from any thread
+        events = [
+            event for event in events
+            if (self.claim_id is None or event['claim_id'] == self.claim_id)
+            and (self.user is None or event_visible(self.user, event))
+        ]
+        if events:
+            self.loop.call_soon_threadsafe(self._put, events)
+
+    def _put(self, events):
+        for event in events:
+            if self.queue.full():
+                # a client too slow to keep up is told to reload rather than holding memory
+                self.lagged = True
+                return
+            self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """the next event, {'type': 'resync'} after events were dropped, None on timeout"""
+        if self.lagged:
+            self.lagged = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return {'type': 'resync'}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class LocalBackend:
+    """fan out to the subscribers of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel, claim_id=None, user=None):
+        subscription = Subscription(self, channel, claim_id, user)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def deliver(self, channel, events):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(events)
+
+    def publish(self, channel, events):
+        self.deliver(channel, events)
+
+
+class PostgresBackend(LocalBackend):
+    """
+    publish with pg_notify (one statement for a whole batch of events) and deliver what a
+    background thread LISTENing on a dedicated connection receives, including this node's own events
+    """
+    notify_channel = 'claim_events'
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, channel, events):
+        payloads = [json.dumps({'channel': channel, 'event': event}) for event in events]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                [self.notify_channel, payloads],
+            )
+
+    def subscribe(self, channel, claim_id=None, user=None):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='claim-events-listener', daemon=True)
+                self._listener.start()
+        return super().subscribe(channel, claim_id, user)
+
+    def _listen(self):
+        params = connections['default'].get_connection_params()
+        while True:
+            try:
+                listener = psycopg2.connect(**params)
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.notify_channel}')
+                while True:
+                    if select.select([listener], [], [], 30) == ([], [], []):
+                        continue
+                    listener.poll()
+                    batches = defaultdict(list)
+                    while listener.notifies:
+                        message = json.loads(listener.notifies.pop(0).payload)
+                        batches[message['channel']].append(message['event'])
+                    for channel, events in batches.items():
+                        self.deliver(channel, events)
+            except Exception:
+                logger.exception('claim events listener lost its connection, reconnecting')
+                time.sleep(5)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.CLAIM_EVENTS_BACKEND)()
+        return _backend
+
+
+def publish_claim_events(events):
+    """publish `events` to the current tenant's subscribers once the running transaction commits"""
+    if events:
+        transaction.on_commit(partial(get_backend().publish, connection.schema_name, list(events)))
+
+
+def event_visible(user, event):
+    """
+    may `user` view the claim `event` is about: the 'view' rule of the permission matrix, tested on
+    the claim as the event describes it (every event carries the assignee of its claim)
+    """
+    assigned_to = event.get('assigned_to')
+    claim = Claim(
+        pk=event['claim_id'],
+        status=event.get('status'),
+        assigned_to_id=uuid.UUID(assigned_to) if assigned_to else None,
+    )
+    return has_object_access(user, 'view', 'claim', claim)
+
+
+def status_change_events(changes):
+    """events of ClaimStatusChange rows: claim_created, status_changed or claim_assigned"""
+    events = []
+    for change in changes:
+        if change.previous_status is None:
+            kind = 'claim_created'
+        elif change.previous_status != change.status:
+            kind = 'status_changed'
+        else:
+            kind = 'claim_assigned'
+        events.append({
+            'type': kind,
+            'claim_id': change.claim_id,
+            'status': change.status,
+            'previous_status': change.previous_status,
+            'assigned_to': str(change.assigned_to_id) if change.assigned_to_id else None,
+            'changed_by': str(change.changed_by_id) if change.changed_by_id else None,
+            'at': change.changed_at.isoformat(),
+        })
+    return events
+
+
+def note_event(note):
+    return {
+        'type': 'note_added',
+        'claim_id': note.claim_id,
+        'assigned_to': str(note.claim.assigned_to_id) if note.claim.assigned_to_id else None,
+        'note_id': note.pk,
+        'author': str(note.author_id),
+        'is_internal': note.is_internal,
+        'at': note.created_at.isoformat(),
+    }
+
+
+def document_event(document):
+    return {
+        'type': 'document_added',
+        'claim_id': document.claim_id,
+        'assigned_to': str(document.claim.assigned_to_id) if document.claim.assigned_to_id else None,
+        'document_id': document.pk,
+        'document_type': document.document_type,
+        'uploaded_by': str(document.uploaded_by_id),
+        'at': document.uploaded_at.isoformat(),
+    }
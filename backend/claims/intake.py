@@ -0,0 +1,125 @@
+"""
+Intake-time screening of new claims against precomputed indexes:
+
+- duplicates: every claim carries an `intake_fingerprint`, a hash of (policy, incident date,
+  normalized title), so the claims reporting the same incident are a single index lookup.
+- amount outliers: ClaimAmountStats holds the median and median absolute deviation of the claim
+  amounts of each policy type (refresh_claim_amount_stats), a claim is scored with the robust
+  z-score 0.6745 * (amount - median) / MAD.
+
+A suspicious claim gets a pending ClaimReview, the review queue of the managers.
+"""
+import hashlib
+import re
+import unicodedata
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Claim, ClaimAmountStats, ClaimReview
+
+# above this robust z-score a claim amount is an outlier (Iglewicz and Hoaglin)
+OUTLIER_THRESHOLD = Decimal('3.5')
+# fewer claims than this in a policy type and its statistics mean nothing
+MIN_SAMPLE_SIZE = 30
+
+WORD = re.compile(r'\w+')
+
+
+def normalize_title(title):
+    """casefolded, accent-free, punctuation-free words in sorted order: 'Flooded basement!' == 'basement flooded'"""
+    title = unicodedata.normalize('NFKD', title or '').encode('ascii', 'ignore').decode('ascii').casefold()
+    return ' '.join(sorted(set(WORD.findall(title))))
+
+
+def claim_fingerprint(policy_id, incident_date, title):
+    key = f'{policy_id}|{incident_date.isoformat() if incident_date else ""}|{normalize_title(title)}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def find_duplicates(claim, limit=10):
+    """ids of the other claims with the same fingerprint, newest first"""
+    return list(
+        Claim.objects.filter(intake_fingerprint=claim.intake_fingerprint)
+        .exclude(pk=claim.pk)
+        .order_by('-id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def amount_score(claim, policy_type):
+    """(robust z-score of the claim amount within its policy type, ClaimAmountStats), None without usable statistics"""
+    if claim.claim_amount is None:
+        return None
+    stats = ClaimAmountStats.objects.filter(policy_type=policy_type).first()
+    if stats is None or stats.sample_size < MIN_SAMPLE_SIZE or not stats.mad:
+        return None
+    return (Decimal('0.6745') * (Decimal(claim.claim_amount) - stats.median) / stats.mad).quantize(Decimal('0.01')), stats
+
+
+def screen_claim(claim):
+    """
+    score a newly created claim and queue it for review when suspicious. returns the reasons
+    (empty when the claim looks fine), must run in the transaction that created the claim
+    """
+    reasons = []
+    duplicates = find_duplicates(claim)
+    if duplicates:
+        reasons.append({'kind': 'duplicate', 'claim_ids': duplicates})
+
+    scored = amount_score(claim, claim.policy.policy_type)
+    if scored is not None and scored[0] > OUTLIER_THRESHOLD:
+        score, stats = scored
+        reasons.append({
+            'kind': 'amount_outlier',
+            'score': str(score),
+            'median': str(stats.median),
+            'mad': str(stats.mad),
+        })
+
+    if reasons:
+        ClaimReview.objects.create(claim=claim, reasons=reasons)
+    return reasons
+
+
+def refresh_amount_stats():
+    """
+    recompute the median and median absolute deviation of the claim amounts per policy type
+    in the current schema, in one query. returns the number of policy types
+    """
+    claim_table = connection.ops.quote_name(Claim._meta.db_table)
+    policy_table = connection.ops.quote_name(Claim._meta.get_field('policy').related_model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH amounts AS (
+                SELECT p.policy_type, c.claim_amount AS amount
+                FROM {claim_table} c JOIN {policy_table} p ON p.id = c.policy_id
+                WHERE c.claim_amount IS NOT NULL
+            ),
+            medians AS (
+                SELECT policy_type, percentile_cont(0.5) WITHIN GROUP (ORDER BY amount) AS median, count(*) AS sample_size
+                FROM amounts GROUP BY policy_type
+            )
+            SELECT m.policy_type, m.median, percentile_cont(0.5) WITHIN GROUP (ORDER BY abs(a.amount - m.median)), m.sample_size
+            FROM amounts a JOIN medians m USING (policy_type)
+            GROUP BY m.policy_type, m.median, m.sample_size
+            """
+        )
+        rows = cursor.fetchall()
+
+    now = timezone.now()
+    with transaction.atomic():
+        ClaimAmountStats.objects.exclude(policy_type__in=[row[0] for row in rows]).delete()
+        for policy_type, median, mad, sample_size in rows:
+            ClaimAmountStats.objects.update_or_create(
+                policy_type=policy_type,
+                defaults={
+                    'median': Decimal(str(median)).quantize(Decimal('0.01')),
+                    'mad': Decimal(str(mad)).quantize(Decimal('0.01')),
+                    'sample_size': sample_size,
+                    'computed_at': now,
+                },
+            )
+    return len(rows)
@@ -0,0 +1,219 @@
+"""
+Per-policy coverage ledger: the claimed, approved and paid totals of each policy's claims kept in
+PolicyCoverage, moved by deltas in the transaction of every claim creation, amount change, status
+change and deletion, so remaining coverage is read (and approvals checked) without summing claims.
+
+What a claim adds to its policy's totals depends on its status and amounts (`contribution`):
+- claimed: claim_amount, unless the claim was denied (or closed after a denial)
+- approved: approved_amount once the claim is approved, until it is closed
+- paid: approved_amount once the claim is paid
+A closed claim counts as paid when it carries an approved amount (it went through approval and
+payment), as denied otherwise; approval sets approved_amount to claim_amount when it is empty.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Claim, PolicyCoverage
+from policies.models import Policy
+
+ZERO = Decimal('0.00')
+APPROVED_STATUSES = ['approved', 'payment_processing', 'paid']
+
+# the same rules as `contribution`, as SQL over a claims table aliased `c`
+CONTRIBUTION_SQL = """
+    sum(CASE WHEN c.status = 'denied' OR (c.status = 'closed' AND c.approved_amount IS NULL) THEN 0
+             ELSE coalesce(c.claim_amount, 0) END),
+    sum(CASE WHEN c.status IN ('approved', 'payment_processing', 'paid')
+               OR (c.status = 'closed' AND c.approved_amount IS NOT NULL) THEN coalesce(c.approved_amount, 0)
+             ELSE 0 END),
+    sum(CASE WHEN c.status = 'paid' OR (c.status = 'closed' AND c.approved_amount IS NOT NULL)
+             THEN coalesce(c.approved_amount, 0) ELSE 0 END)
+"""
+
+
+class CoverageExceeded(Exception):
+    def __init__(self, policy_id, remaining):
+        super().__init__(f'policy {policy_id} has {remaining} of coverage left')
+        self.policy_id = policy_id
+        self.remaining = remaining
+
+
+def contribution(status, claim_amount, approved_amount):
+    """(claimed, approved, paid) a claim in `status` with these amounts adds to its policy's totals"""
+    claim_amount = Decimal(claim_amount or 0)
+    approved = Decimal(approved_amount or 0)
+    if status == 'denied' or (status == 'closed' and approved_amount is None):
+        return ZERO, ZERO, ZERO
+    if status == 'closed' or status == 'paid':
+        return claim_amount, approved, approved
+    if status in APPROVED_STATUSES:
+        return claim_amount, approved, ZERO
+    return claim_amount, ZERO, ZERO
+
+
+def claim_contribution(claim):
+    return contribution(claim.status, claim.claim_amount, claim.approved_amount)
+
+
+def apply_coverage_deltas(deltas, enforce=False):
+    """
+    add `deltas` ({policy_id: (claimed, approved, paid)}) to the policies' totals with one upsert,
+    rows in policy order so concurrent updates cannot deadlock. with `enforce`, raise CoverageExceeded
+    (the caller's transaction must then roll back) if a policy whose approved total grew ends up
+    approved past its coverage_amount
+    """
+    rows = sorted((policy_id, delta) for policy_id, delta in deltas.items() if any(delta))
+    if not rows:
+        return
+
+    table = connection.ops.quote_name(PolicyCoverage._meta.db_table)
+    policy_table = connection.ops.quote_name(Policy._meta.db_table)
+    values = ', '.join(['(%s, %s::numeric, %s::numeric, %s::numeric, %s::timestamptz)'] * len(rows))
+    now = timezone.now()
+    params = [value for policy_id, delta in rows for value in (policy_id, *delta, now)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS coverage (policy_id, claimed_amount, approved_amount, paid_amount, updated_at)
+            VALUES {values}
+            ON CONFLICT (policy_id) DO UPDATE SET
+                claimed_amount = coverage.claimed_amount + EXCLUDED.claimed_amount,
+                approved_amount = coverage.approved_amount + EXCLUDED.approved_amount,
+                paid_amount = coverage.paid_amount + EXCLUDED.paid_amount,
+                updated_at = EXCLUDED.updated_at
+            """,
+            params,
+        )
+        grown = [policy_id for policy_id, (_, approved, _) in rows if approved > 0]
+        if enforce and grown:
+            cursor.execute(
+                f"""
+                SELECT coverage.policy_id, p.coverage_amount - coverage.approved_amount
+                FROM {table} coverage JOIN {policy_table} p ON p.id = coverage.policy_id
+                WHERE coverage.policy_id = ANY(%s) AND coverage.approved_amount > p.coverage_amount
+                LIMIT 1
+                """,
+                [grown],
+            )
+            exceeded = cursor.fetchone()
+            if exceeded is not None:
+                raise CoverageExceeded(*exceeded)
+
+
+def track_claim_amounts(claim, previous=None, enforce=True):
+    """
+    move the ledger of `claim`'s policy from the `previous` contribution (None for a new claim) to
+    its current one. must run in the transaction that saved the claim
+    """
+    current = claim_contribution(claim)
+    delta = tuple(a - b for a, b in zip(current, previous or (ZERO, ZERO, ZERO)))
+    apply_coverage_deltas({claim.policy_id: delta}, enforce=enforce)
+
+
+def track_claim_removal(claim):
+    apply_coverage_deltas({claim.policy_id: tuple(-value for value in claim_contribution(claim))})
+
+
+def remaining_coverage(policy_id):
+    """coverage_amount of the policy minus what its claims have been approved for, one row read"""
+    policy = Policy.objects.select_related('coverage').only('coverage_amount', 'coverage__approved_amount').get(pk=policy_id)
+    coverage = getattr(policy, 'coverage', None)
+    return policy.coverage_amount - (coverage.approved_amount if coverage else ZERO)
+
+
+def claims_within_coverage(claim_ids, statuses):
+    """
+    the subset of `claim_ids` currently in one of `statuses` (those approval may move a claim from)
+    that can be approved without taking their policy past its coverage, first come (lowest id)
+    first served within a policy. claims in any other status are left out: an approved or paid
+    claim already counts in approved_amount and would be counted twice.
+    locks the claims then their policies' ledger rows (the order of every other claim change),
+    so the answer holds until the calling transaction ends
+    """
+    table = connection.ops.quote_name(PolicyCoverage._meta.db_table)
+    claim_table = connection.ops.quote_name(Claim._meta.db_table)
+    policy_table = connection.ops.quote_name(Policy._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT id, policy_id, claim_amount, approved_amount FROM {claim_table}
+            WHERE id = ANY(%s) AND status = ANY(%s)
+            ORDER BY id
+            FOR UPDATE
+            """,
+            [list(claim_ids), list(statuses)],
+        )
+        claims = cursor.fetchall()
+        policy_ids = sorted({policy_id for _, policy_id, _, _ in claims})
+        if not policy_ids:
+            return []
+        # policies without a claim change since the ledger was created have no row yet
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (policy_id, claimed_amount, approved_amount, paid_amount, updated_at)
+            SELECT policy_id, 0, 0, 0, %s FROM unnest(%s) AS policy_id
+            ON CONFLICT (policy_id) DO NOTHING
+            """,
+            [timezone.now(), policy_ids],
+        )
+        cursor.execute(
+            f"""
+            SELECT coverage.policy_id, p.coverage_amount - coverage.approved_amount
+            FROM {table} coverage JOIN {policy_table} p ON p.id = coverage.policy_id
+            WHERE coverage.policy_id = ANY(%s)
+            ORDER BY coverage.policy_id
+            FOR UPDATE OF coverage
+            """,
+            [policy_ids],
+        )
+        remaining = dict(cursor.fetchall())
+    return budget_claims(claims, remaining)
+
+
+def budget_claims(claims, remaining):
+    """
+    the ids of `claims` ((id, policy_id, claim_amount, approved_amount) in id order) that fit in the
+    `remaining` coverage of their policy ({policy_id: amount}, spent as claims are taken)
+    """
+    within = []
+    for claim_id, policy_id, claim_amount, approved_amount in claims:
+        amount = approved_amount if approved_amount is not None else (claim_amount or ZERO)
+        if amount <= remaining[policy_id]:
+            remaining[policy_id] -= amount
+            within.append(claim_id)
+    return within
+
+
+def rebuild_policy_coverage(fix=True):
+    """
+    recompute every policy's totals from its claims and, if `fix`, replace the stored ones.
+    returns the drift as {policy_id: (computed, stored)}
+    """
+    claim_table = connection.ops.quote_name(Claim._meta.db_table)
+    table = connection.ops.quote_name(PolicyCoverage._meta.db_table)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # lock before counting, as rebuild_claim_counters does: a claim change committing in
+            # between would otherwise look like drift and be applied a second time by the fix.
+            # a table lock rather than FOR UPDATE, which would not hold back the first ledger row of a policy
+            cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+            stored = {
+                policy_id: tuple(totals)
+                for policy_id, *totals in PolicyCoverage.objects
+                .values_list('policy_id', 'claimed_amount', 'approved_amount', 'paid_amount')
+            }
+            cursor.execute(f'SELECT c.policy_id, {CONTRIBUTION_SQL} FROM {claim_table} c GROUP BY c.policy_id')
+            computed = {policy_id: tuple(totals) for policy_id, *totals in cursor.fetchall()}
+        drift = {
+            policy_id: (computed.get(policy_id, (ZERO,) * 3), stored.get(policy_id, (ZERO,) * 3))
+            for policy_id in computed.keys() | stored.keys()
+            if computed.get(policy_id, (ZERO,) * 3) != stored.get(policy_id, (ZERO,) * 3)
+        }
+        if fix and drift:
+            apply_coverage_deltas({
+                policy_id: tuple(a - b for a, b in zip(should, has))
+                for policy_id, (should, has) in drift.items()
+            })
+    return drift
@@ -0,0 +1,50 @@
+import timeit
+import uuid
+
+from django.core.management.base import BaseCommand
+from claims.models import Claim, ClaimNote
+from mlt_ins.access import has_access, has_object_access, scope_queryset
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request cost of the permission matrix checks (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100000, help='calls timed per check')
+        parser.add_argument('--page-size', type=int, default=25, help='objects of the list compared with the SQL filter')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        manager = User(id=uuid.uuid4(), role='manager')
+        adjuster = User(id=uuid.uuid4(), role='adjuster')
+        claim = Claim(id=1, status='investigation', assigned_to_id=adjuster.id)
+        note = ClaimNote(id=1, claim=claim, author_id=adjuster.id)
+        page = [Claim(id=i, status='investigation', assigned_to_id=adjuster.id) for i in range(options['page_size'])]
+
+        checks = [
+            ('role check (has_permission)', lambda: has_access(adjuster, 'change', 'claim')),
+            ('object check, unrestricted role', lambda: has_object_access(manager, 'change', 'claim', claim)),
+            ('object check, adjuster on own claim', lambda: has_object_access(adjuster, 'change', 'claim', claim)),
+            ('object check, adjuster on own note', lambda: has_object_access(adjuster, 'change', 'note', note)),
+            ('queryset scope, unrestricted role', lambda: scope_queryset(Claim.objects.all(), manager, 'view', 'claim')),
+            ('queryset scope, adjuster', lambda: scope_queryset(Claim.objects.all(), adjuster, 'view', 'claim')),
+            (
+                f'python filter of a {len(page)} claim page, adjuster',
+                lambda: [c for c in page if has_object_access(adjuster, 'view', 'claim', c)],
+            ),
+        ]
+
+        self.stdout.write(f'{"check":<45} {"per call":>12}')
+        costs = {}
+        for name, check in checks:
+            seconds = min(timeit.repeat(check, number=iterations, repeat=3)) / iterations
+            costs[name] = seconds
+            self.stdout.write(f'{name:<45} {seconds * 1e6:>10.2f}us')
+
+        # a detail request runs has_permission then has_object_permission, a list has_permission then the scope
+        detail = costs['role check (has_permission)'] + costs['object check, adjuster on own claim']
+        listing = costs['role check (has_permission)'] + costs['queryset scope, adjuster']
+        self.stdout.write(self.style.SUCCESS(
+            f'per request: detail {detail * 1e6:.2f}us, list {listing * 1e6:.2f}us (the list filter itself runs in SQL)'
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_tenant_model, get_public_schema_name, schema_context
+from claims.utils import create_status_history_partitions
+
+class Command(BaseCommand):
+    help = 'Create the upcoming monthly partitions of the claim status history in every tenant schema (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        for tenant in tenants:
+            with schema_context(tenant.schema_name):
+                created = create_status_history_partitions(options['months_ahead'])
+            for name in created:
+                self.stdout.write(f'{tenant.schema_name}: created {name}')
+        self.stdout.write(self.style.SUCCESS('claim history partitions are up to date'))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django_tenants.utils import get_tenant_model, get_public_schema_name, schema_context
+from claims.models import ClaimDocumentUpload
+
+class Command(BaseCommand):
+    help = 'Delete the chunked document uploads (and their partial files) left unfinished in every tenant'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['older_than_hours'])
+        purged = 0
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        for tenant in tenants:
+            with schema_context(tenant.schema_name):
+                for upload in ClaimDocumentUpload.objects.filter(updated_at__lt=cutoff).iterator():
+                    upload.delete()
+                    purged += 1
+        self.stdout.write(self.style.SUCCESS(f'{purged} stale upload(s) purged'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_tenant_model, get_public_schema_name, schema_context
+from claims.utils import rebuild_claim_counters
+
+class Command(BaseCommand):
+    help = 'Recount the claims of every tenant, report counter drift and rebuild the claim counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='only report the drift, do not rebuild')
+
+    def handle(self, *args, **options):
+        drifted = 0
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        for tenant in tenants:
+            with schema_context(tenant.schema_name):
+                drift = rebuild_claim_counters(fix=not options['check'])
+            for (_, status, assigned_to_id, policy_type), (counted, stored) in sorted(drift.items(), key=str):
+                self.stdout.write(
+                    f'{tenant.schema_name}: {status}/{assigned_to_id or "unassigned"}/{policy_type} '
+                    f'counted {counted}, stored {stored}'
+                )
+            drifted += bool(drift)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('claim counters are in sync'))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(f'claim counters drifted in {drifted} tenant(s)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'claim counters rebuilt in {drifted} tenant(s)'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_tenant_model, get_public_schema_name, schema_context
+from claims.blobs import rebuild_blob_refs
+
+class Command(BaseCommand):
+    help = 'Recount the references of the claim document blobs of every tenant and free the unreferenced ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='only report the drift, do not fix it')
+
+    def handle(self, *args, **options):
+        drifted = 0
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        for tenant in tenants:
+            with schema_context(tenant.schema_name):
+                drift = rebuild_blob_refs(fix=not options['check'])
+            for sha256, (counted, stored) in sorted(drift.items()):
+                self.stdout.write(f'{tenant.schema_name}: blob {sha256} counted {counted}, stored {stored}')
+            drifted += len(drift)
+        self.stdout.write(self.style.SUCCESS(f'{drifted} blob reference count(s) out of sync'))
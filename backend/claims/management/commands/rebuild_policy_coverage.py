@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_tenant_model, get_public_schema_name, schema_context
+from claims.ledger import rebuild_policy_coverage
+
+class Command(BaseCommand):
+    help = 'Recompute the claimed, approved and paid totals of every policy from its claims, report drift and fix it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='only report the drift, do not fix it')
+
+    def handle(self, *args, **options):
+        drifted = 0
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        for tenant in tenants:
+            with schema_context(tenant.schema_name):
+                drift = rebuild_policy_coverage(fix=not options['check'])
+            for policy_id, (computed, stored) in sorted(drift.items()):
+                self.stdout.write(
+                    f'{tenant.schema_name}: policy {policy_id} computed claimed/approved/paid '
+                    f'{"/".join(map(str, computed))}, stored {"/".join(map(str, stored))}'
+                )
+            drifted += bool(drift)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('policy coverage is in sync'))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(f'policy coverage drifted in {drifted} tenant(s)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'policy coverage rebuilt in {drifted} tenant(s)'))
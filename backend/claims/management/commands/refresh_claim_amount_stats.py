@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_tenant_model, get_public_schema_name, schema_context
+from claims.intake import refresh_amount_stats
+
+class Command(BaseCommand):
+    help = 'Recompute the per policy type claim amount statistics the intake outlier check scores new claims against'
+
+    def handle(self, *args, **options):
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        for tenant in tenants:
+            with schema_context(tenant.schema_name):
+                policy_types = refresh_amount_stats()
+            self.stdout.write(f'{tenant.schema_name}: {policy_types} policy type(s)')
+        self.stdout.write(self.style.SUCCESS('claim amount statistics refreshed'))
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0002_initial'),
+        ('policies', '0001_initial'),
+        ('tenants_manager', '0003_admin_username'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['policy', 'created_at', 'id'], name='claim_policy_created_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:58
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+CREATE_TABLE = """
+CREATE TABLE claims_claimstatuschange (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    claim_id bigint NOT NULL REFERENCES claims_claim (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+    previous_status varchar(20) NULL,
+    status varchar(20) NOT NULL,
+    assigned_to_id uuid NULL REFERENCES users_user (id) ON DELETE SET NULL DEFERRABLE INITIALLY DEFERRED,
+    changed_by_id uuid NULL REFERENCES users_user (id) ON DELETE SET NULL DEFERRABLE INITIALLY DEFERRED,
+    changed_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, changed_at)
+) PARTITION BY RANGE (changed_at);
+
+CREATE TABLE claims_claimstatuschange_default PARTITION OF claims_claimstatuschange DEFAULT;
+
+CREATE INDEX claims_statuschange_claim_idx ON claims_claimstatuschange (claim_id, changed_at);
+CREATE INDEX claims_statuschange_assignee_idx ON claims_claimstatuschange (assigned_to_id, changed_at);
+"""
+
+
+def create_partitions(apps, schema_editor):
+    # current month and the next two, later months come from the create_claim_history_partitions command
+    today = django.utils.timezone.now().date()
+    year, month = today.year, today.month
+    with schema_editor.connection.cursor() as cursor:
+        for _ in range(3):
+            next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS claims_claimstatuschange_y{year}m{month:02d} "
+                f"PARTITION OF claims_claimstatuschange "
+                f"FOR VALUES FROM ('{year}-{month:02d}-01') TO ('{next_year}-{next_month:02d}-01')"
+            )
+            year, month = next_year, next_month
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0004_claim_number_sequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('previous_status', models.CharField(blank=True, choices=[('reported', 'Reported'), ('assigned', 'Assigned'), ('under_review', 'Under Review'), ('investigation', 'Investigation'), ('documents_requested', 'Documents Requested'), ('waiting_approval', 'Waiting Approval'), ('approved', 'Approved'), ('denied', 'Denied'), ('payment_processing', 'Payment Processing'), ('paid', 'Paid'), ('closed', 'Closed')], max_length=20, null=True)),
+                ('status', models.CharField(choices=[('reported', 'Reported'), ('assigned', 'Assigned'), ('under_review', 'Under Review'), ('investigation', 'Investigation'), ('documents_requested', 'Documents Requested'), ('waiting_approval', 'Waiting Approval'), ('approved', 'Approved'), ('denied', 'Denied'), ('payment_processing', 'Payment Processing'), ('paid', 'Paid'), ('closed', 'Closed')], max_length=20)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'claims_claimstatuschange',
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(
+            sql=CREATE_TABLE,
+            reverse_sql='DROP TABLE IF EXISTS claims_claimstatuschange CASCADE',
+        ),
+        migrations.RunPython(create_partitions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0005_claimstatuschange'),
+        ('tenants_manager', '0003_admin_username'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('reported', 'Reported'), ('assigned', 'Assigned'), ('under_review', 'Under Review'), ('investigation', 'Investigation'), ('documents_requested', 'Documents Requested'), ('waiting_approval', 'Waiting Approval'), ('approved', 'Approved'), ('denied', 'Denied'), ('payment_processing', 'Payment Processing'), ('paid', 'Paid'), ('closed', 'Closed')], max_length=20)),
+                ('policy_type', models.CharField(choices=[('auto', 'Auto'), ('home', 'Home'), ('life', 'Life'), ('health', 'Health'), ('business', 'Business'), ('travel', 'Travel'), ('other', 'Other')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('assigned_to', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tenants_manager.insurancecompany')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tenant', 'status', 'assigned_to', 'policy_type'), name='claim_counter_key', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunSQL(
+            sql="""
+            INSERT INTO claims_claimcounter (tenant_id, status, assigned_to_id, policy_type, count)
+            SELECT claim.tenant_id, claim.status, claim.assigned_to_id, policy.policy_type, COUNT(*)
+            FROM claims_claim claim
+            JOIN policies_policy policy ON policy.id = claim.policy_id
+            GROUP BY 1, 2, 3, 4
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
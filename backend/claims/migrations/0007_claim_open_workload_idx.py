@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0006_claimcounter'),
+        ('policies', '0002_policy_number_sequence'),
+        ('tenants_manager', '0003_admin_username'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(condition=models.Q(('status__in', ['denied', 'paid', 'closed']), _negated=True), fields=['assigned_to'], include=('claim_amount',), name='claim_open_workload_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:04
+
+import claims.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0008_claimdocumentupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='claimdocument',
+            name='file',
+            field=models.FileField(max_length=255, upload_to=claims.models.get_file_name),
+        ),
+        migrations.AddField(
+            model_name='claimdocument',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='documents', to='claims.documentblob'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0009_documentblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentblob',
+            name='crc32',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0010_documentblob_crc32'),
+        ('policies', '0002_policy_number_sequence'),
+        ('tenants_manager', '0003_admin_username'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claim',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('title', config='english', weight='A'), '||', django.contrib.postgres.search.SearchVector('description', config='english', weight='B'), django.contrib.postgres.search.SearchConfig('english')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddField(
+            model_name='claimdocument',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('description', config='english', weight='C'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddField(
+            model_name='claimnote',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('note', config='english', weight='C'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='claim',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='claim_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='claimdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='claimdocument_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='claimnote',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='claimnote_search_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fingerprint_claims(apps, schema_editor):
+    from claims.intake import claim_fingerprint
+
+    Claim = apps.get_model('claims', 'Claim')
+    batch = []
+    for claim in Claim.objects.only('id', 'policy_id', 'incident_date', 'title').iterator(chunk_size=2000):
+        claim.intake_fingerprint = claim_fingerprint(claim.policy_id, claim.incident_date, claim.title)
+        batch.append(claim)
+        if len(batch) == 2000:
+            Claim.objects.bulk_update(batch, ['intake_fingerprint'])
+            batch = []
+    Claim.objects.bulk_update(batch, ['intake_fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0011_search_vectors'),
+        ('policies', '0002_policy_number_sequence'),
+        ('tenants_manager', '0003_admin_username'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimAmountStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('policy_type', models.CharField(choices=[('auto', 'Auto'), ('home', 'Home'), ('life', 'Life'), ('health', 'Health'), ('business', 'Business'), ('travel', 'Travel'), ('other', 'Other')], max_length=20, unique=True)),
+                ('median', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('mad', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('sample_size', models.IntegerField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ClaimReview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reasons', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('cleared', 'Cleared'), ('confirmed', 'Confirmed')], default='pending', max_length=20)),
+                ('reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='claim',
+            name='intake_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['intake_fingerprint'], name='claim_intake_fingerprint_idx'),
+        ),
+        migrations.AddField(
+            model_name='claimreview',
+            name='claim',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='review', to='claims.claim'),
+        ),
+        migrations.AddField(
+            model_name='claimreview',
+            name='reviewed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='claimreview',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at', 'id'], name='claimreview_pending_idx'),
+        ),
+        migrations.RunPython(fingerprint_claims, migrations.RunPython.noop),
+    ]
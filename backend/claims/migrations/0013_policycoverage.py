@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0012_intake_screening'),
+        ('policies', '0002_policy_number_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicyCoverage',
+            fields=[
+                ('policy', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='coverage', serialize=False, to='policies.policy')),
+                ('claimed_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('approved_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        # totals of the existing claims, same rules as claims.ledger.contribution
+        migrations.RunSQL(
+            """
+            INSERT INTO claims_policycoverage (policy_id, claimed_amount, approved_amount, paid_amount, updated_at)
+            SELECT c.policy_id,
+                sum(CASE WHEN c.status = 'denied' OR (c.status = 'closed' AND c.approved_amount IS NULL) THEN 0
+                         ELSE coalesce(c.claim_amount, 0) END),
+                sum(CASE WHEN c.status IN ('approved', 'payment_processing', 'paid')
+                           OR (c.status = 'closed' AND c.approved_amount IS NOT NULL) THEN coalesce(c.approved_amount, 0)
+                         ELSE 0 END),
+                sum(CASE WHEN c.status = 'paid' OR (c.status = 'closed' AND c.approved_amount IS NOT NULL)
+                         THEN coalesce(c.approved_amount, 0) ELSE 0 END),
+                now()
+            FROM claims_claim c
+            GROUP BY c.policy_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
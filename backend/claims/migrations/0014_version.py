@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0013_policycoverage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claim',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='claimnote',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
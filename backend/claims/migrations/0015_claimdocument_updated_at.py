@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('claims', '0014_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claimdocument',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
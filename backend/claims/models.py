@@ -1,10 +1,16 @@
-from django.db import models
+from django.db import models, connection, transaction
+from collections import Counter
 import uuid
 from tenants_manager.models import InsuranceCompany
 from users.models import User
 from policies.models import Policy
 from users.models import User
 import os
+from django.utils import timezone
+from django.core.files.storage import default_storage
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from mlt_ins.concurrency import VersionedModel
 
 STATUS_CHOICES = [
         ('reported', 'Reported'),           # Initial state - claim created by call center
@@ -19,9 +25,15 @@ STATUS_CHOICES = [
         ('paid', 'Paid'),                   # Payment sent to customer
         ('closed', 'Closed'),               # Final state - claim completed
     ]
+
+# statuses in which a claim no longer counts in its assignee's workload
+CLOSED_STATUSES = ['denied', 'paid', 'closed']
+
+# text search configuration of the search vectors, queries must be parsed with the same one (claims/search.py)
+SEARCH_CONFIG = 'english'
     
 # Create your models here.
-class Claim(models.Model):
+class Claim(VersionedModel):
     claim_number = models.CharField(max_length=50, unique=True)  # Auto-generated
     tenant = models.ForeignKey(InsuranceCompany, on_delete=models.CASCADE)
     policy = models.ForeignKey(Policy, on_delete=models.CASCADE)
@@ -45,6 +57,40 @@ class Claim(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # hash of (policy, incident date, normalized title), the same incident reported twice shares it (claims/intake.py)
+    intake_fingerprint = models.CharField(max_length=40, blank=True, editable=False)
+
+    # maintained by Postgres on every write
+    search_vector = models.GeneratedField(
+        expression=SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='claim_search_idx'),
+            models.Index(fields=['intake_fingerprint'], name='claim_intake_fingerprint_idx'),
+            # keyset pagination of a policy's claims
+            models.Index(fields=['policy', 'created_at', 'id'], name='claim_policy_created_idx'),
+            # open workload per assignee, answered by an index-only scan
+            models.Index(
+                fields=['assigned_to'],
+                include=['claim_amount'],
+                condition=~models.Q(status__in=CLOSED_STATUSES),
+                name='claim_open_workload_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .intake import claim_fingerprint
+        self.intake_fingerprint = claim_fingerprint(self.policy_id, self.incident_date, self.title)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'policy', 'incident_date', 'title'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'intake_fingerprint'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'claim: {self.claim_number} - {self.incident_date}'
@@ -52,13 +98,128 @@ class Claim(models.Model):
 
 
 
-class ClaimNote(models.Model):
+class ClaimStatusChange(models.Model):
+    """
+    append-only log of claim status and assignee changes, one row per change.
+    the table is range partitioned by month on changed_at, so it is created by raw SQL
+    (migrations/0005_claimstatuschange.py) and new months are added by the
+    create_claim_history_partitions command
+    """
+    claim = models.ForeignKey(Claim, on_delete=models.DO_NOTHING, related_name='status_changes')  # ON DELETE CASCADE in the database
+    previous_status = models.CharField(max_length=20, choices=STATUS_CHOICES, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    assigned_to = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='+', null=True, blank=True)  # ON DELETE SET NULL in the database
+    changed_by = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='+', null=True, blank=True)  # ON DELETE SET NULL in the database
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        managed = False
+        db_table = 'claims_claimstatuschange'
+
+    def __str__(self):
+        return f'claim-status-change: {self.claim_id} {self.previous_status} -> {self.status} - {self.changed_at}'
+
+
+class ClaimCounter(models.Model):
+    """
+    number of claims per (tenant, status, assignee, policy type), updated in the same transaction
+    as every claim creation, status change, reassignment and deletion (claims.utils.apply_counter_deltas)
+    so dashboards read a handful of rows instead of counting the claims table.
+    rebuild_claim_counters recomputes it from the claims and reports drift
+    """
+    tenant = models.ForeignKey(InsuranceCompany, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    # no FK constraint: the counters of a deleted user are cleaned up by rebuild_claim_counters
+    assigned_to = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', null=True, blank=True)
+    policy_type = models.CharField(max_length=20, choices=Policy.POLICY_TYPE_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tenant', 'status', 'assigned_to', 'policy_type'],
+                name='claim_counter_key',
+                nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        return f'claim-counter: {self.status} - {self.assigned_to_id} - {self.policy_type}: {self.count}'
+
+
+class PolicyCoverage(models.Model):
+    """
+    running totals of the claims of a policy, moved in the transaction of every claim change
+    (claims/ledger.py) so remaining coverage never needs the claims summed.
+    rebuild_policy_coverage recomputes it from the claims and reports drift
+    """
+    policy = models.OneToOneField(Policy, on_delete=models.CASCADE, primary_key=True, related_name='coverage')
+    claimed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    approved_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'policy-coverage: {self.policy_id} approved {self.approved_amount} paid {self.paid_amount}'
+
+
+class ClaimAmountStats(models.Model):
+    """
+    robust statistics of the claim amounts of a policy type, the baseline of the intake outlier
+    check (claims/intake.py). recomputed by the refresh_claim_amount_stats command
+    """
+    policy_type = models.CharField(max_length=20, choices=Policy.POLICY_TYPE_CHOICES, unique=True)
+    median = models.DecimalField(max_digits=12, decimal_places=2)
+    mad = models.DecimalField(max_digits=12, decimal_places=2)  # median absolute deviation
+    sample_size = models.IntegerField()
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'claim-amount-stats: {self.policy_type} median {self.median} mad {self.mad} (n={self.sample_size})'
+
+
+REVIEW_STATUS_CHOICES = [
+    ('pending', 'Pending'),
+    ('cleared', 'Cleared'),      # looked at, nothing wrong
+    ('confirmed', 'Confirmed'),  # a real duplicate or an amount to dispute
+]
+
+class ClaimReview(models.Model):
+    """a claim flagged at intake as a likely duplicate or an outlying amount, waiting for a manager"""
+    claim = models.OneToOneField(Claim, on_delete=models.CASCADE, related_name='review')
+    # [{"kind": "duplicate", "claim_ids": [...]}, {"kind": "amount_outlier", "score": "5.12", "median": ..., "mad": ...}]
+    reasons = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=REVIEW_STATUS_CHOICES, default='pending')
+    reviewed_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the review queue, oldest first
+            models.Index(fields=['created_at', 'id'], condition=models.Q(status='pending'), name='claimreview_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'claim-review: {self.claim_id} - {self.status}'
+
+
+class ClaimNote(VersionedModel):
     claim = models.ForeignKey(Claim, on_delete=models.CASCADE, related_name='notes')
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     note = models.TextField()
     is_internal = models.BooleanField(default=True)  # Internal note vs customer-facing
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    search_vector = models.GeneratedField(
+        expression=SearchVector('note', weight='C', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='claimnote_search_idx'),
+        ]
 
     def __str__(self):
         return f'claim-note: {self.claim.claim_number} - {self.created_at}'
@@ -66,27 +227,163 @@ class ClaimNote(models.Model):
 def get_file_name(instance,filename):
     return os.path.join('claim_documents',str(instance.claim.claim_number),filename)
 
+class DocumentBlob(models.Model):
+    """
+    the bytes of claim documents, stored once per distinct SHA-256 of the tenant under
+    claim_documents/<schema>/blobs/
+    and shared by every ClaimDocument with the same content. `ref_count` is the number of documents
+    pointing at it; the blob and its file go away with the last one (see claims/blobs.py)
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(max_length=255)
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    # CRC-32 of the content, filled in the first time the blob goes into a ZIP (see claims/archives.py)
+    crc32 = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def acquire(cls, sha256, name, size):
+        """
+        add a reference to the blob of `sha256`, creating it under `name` if it is new.
+        returns (file name of the blob, created); when not created the caller's copy of the bytes is redundant
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} AS blob (sha256, file, size, ref_count, created_at)
+                VALUES (%s, %s, %s, 1, %s)
+                ON CONFLICT (sha256) DO UPDATE SET ref_count = blob.ref_count + 1
+                RETURNING blob.file, (xmax = 0)
+                """,
+                [sha256, name, size, timezone.now()],
+            )
+            return cursor.fetchone()
+
+    @classmethod
+    def release(cls, sha256s):
+        """
+        drop one reference per entry of `sha256s`; blobs left without references are deleted
+        along with their file once the transaction commits
+        """
+        releases = Counter(sha256s)
+        if not releases:
+            return
+        table = connection.ops.quote_name(cls._meta.db_table)
+        values = ', '.join(['(%s, %s)'] * len(releases))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} AS blob SET ref_count = blob.ref_count - released.count
+                FROM (VALUES {values}) AS released (sha256, count)
+                WHERE blob.sha256 = released.sha256
+                """,
+                [value for item in sorted(releases.items()) for value in item],
+            )
+        cls.free_unreferenced(list(releases))
+
+    @classmethod
+    def free_unreferenced(cls, sha256s):
+        """delete the blobs of `sha256s` that have no reference left, and their files once the transaction commits"""
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE sha256 = ANY(%s) AND ref_count <= 0 RETURNING sha256, file',
+                [list(sha256s)],
+            )
+            freed = cursor.fetchall()
+
+        schema_name = connection.schema_name
+
+        def delete_files():
+            from .blobs import blob_root
+            from .renditions import delete_renditions
+            for sha256, name in freed:
+                # the same content may have been uploaded again in the meantime
+                if cls.objects.filter(sha256=sha256).exists():
+                    continue
+                # blobs stored before the files were kept per tenant may still be used by another
+                # tenant's rows, only files under this tenant's root are its own to delete
+                if name.startswith(blob_root(schema_name) + os.sep):
+                    default_storage.delete(name)
+                delete_renditions(sha256, schema_name)
+        transaction.on_commit(delete_files)
+
+    def __str__(self):
+        return f'document-blob: {self.sha256} ({self.ref_count} refs)'
+
+DOCUMENT_TYPE_CHOICES = [
+    ('police_report', 'Police Report'),
+    ('estimate', 'Repair Estimate'),
+    ('photo', 'Photo'),
+    ('medical_bill', 'Medical Bill'),
+    ('invoice', 'Invoice'),
+    ('other', 'Other')
+]
+
 class ClaimDocument(models.Model):
     claim = models.ForeignKey(Claim, on_delete=models.CASCADE, related_name='documents')
-    document_type = models.CharField(max_length=50, choices=[
-        ('police_report', 'Police Report'),
-        ('estimate', 'Repair Estimate'),
-        ('photo', 'Photo'),
-        ('medical_bill', 'Medical Bill'),
-        ('invoice', 'Invoice'),
-        ('other', 'Other')
-    ])
-    file = models.FileField(upload_to=get_file_name)
+    document_type = models.CharField(max_length=50, choices=DOCUMENT_TYPE_CHOICES)
+    file = models.FileField(upload_to=get_file_name, max_length=255)
+    # content-addressed storage, `file` then names the blob's file. null for documents uploaded before it
+    blob = models.ForeignKey(DocumentBlob, on_delete=models.PROTECT, related_name='documents', null=True, blank=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     description = models.CharField(max_length=200, blank=True)
+    search_vector = models.GeneratedField(
+        expression=SearchVector('description', weight='C', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='claimdocument_search_idx'),
+        ]
 
     def delete(self, *args, **kwargs):
         # delete file from storage before deleting the record
-        if self.file:
+        if self.file and not self.blob_id:
+            from .renditions import delete_renditions
             self.file.delete(save=False)
+            delete_renditions(f'document-{self.pk}')
         super().delete(*args, **kwargs)
+        # a blob is shared, only its last reference frees it
+        if self.blob_id:
+            DocumentBlob.release([self.blob_id])
+
+
+    def __str__(self):
+        return f'claim-note: {self.claim.claim_number} - {self.uploaded_at}'
+
+
+class ClaimDocumentUpload(models.Model):
+    """
+    a chunked, resumable upload that becomes a ClaimDocument once every byte has arrived.
+    the bytes are appended to `part_name` in the default storage as the chunks come in
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    claim = models.ForeignKey(Claim, on_delete=models.CASCADE, related_name='uploads')
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    document_type = models.CharField(max_length=50, choices=DOCUMENT_TYPE_CHOICES)
+    description = models.CharField(max_length=200, blank=True)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()                   # announced total size in bytes
+    received = models.BigIntegerField(default=0)      # bytes written so far, the offset of the next chunk
+    sha256 = models.CharField(max_length=64, blank=True)  # digest announced by the client, checked on completion
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
+    @property
+    def part_name(self):
+        return os.path.join('claim_uploads', f'{self.id}.part')
+
+    def delete(self, *args, **kwargs):
+        # drop the partial file along with the upload
+        default_storage.delete(self.part_name)
+        super().delete(*args, **kwargs)
 
     def __str__(self):
-        return f'claim-note: {self.claim.claim_number} - {self.uploaded_at}'
\ No newline at end of file
+        return f'claim-upload: {self.claim_id} - {self.filename} ({self.received}/{self.size})'
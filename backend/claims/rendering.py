@@ -0,0 +1,69 @@
+"""
+Rendition workers. These functions run in the rendition process pool (see claims/renditions.py),
+so they only deal with file paths and never touch Django or the database.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+
+from PIL import Image, ImageOps
+
+# longest side, in pixels, of each rendition
+RENDITION_SIZES = {
+    'thumbnail': 256,
+    'web': 1600,
+    'preview': 1600,
+}
+
+
+def _save_jpeg(image, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write next to the target and rename, readers never see a half written rendition
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        image.save(tmp, 'JPEG', quality=82, optimize=True, progressive=True)
+    os.replace(tmp_path, path)
+
+
+def render_image(source_path, targets):
+    """write a downscaled JPEG of `source_path` for every {kind: path} of `targets`"""
+    largest = max(RENDITION_SIZES[kind] for kind in targets)
+    with Image.open(source_path) as image:
+        # let the JPEG decoder skip the resolution we are about to throw away
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for kind, path in sorted(targets.items(), key=lambda item: -RENDITION_SIZES[item[0]]):
+            size = RENDITION_SIZES[kind]
+            rendition = image.copy()
+            rendition.thumbnail((size, size), Image.Resampling.LANCZOS)
+            _save_jpeg(rendition, path)
+
+
+def render_pdf(source_path, targets):
+    """
+    rasterize the first page of a PDF with poppler's pdftoppm and downscale it for every target.
+    returns False when pdftoppm is not installed
+    """
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        return False
+    with tempfile.TemporaryDirectory() as workdir:
+        prefix = os.path.join(workdir, 'page')
+        subprocess.run(
+            [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-jpeg',
+             '-scale-to', str(RENDITION_SIZES['preview']), source_path, prefix],
+            check=True, timeout=60, capture_output=True,
+        )
+        render_image(f'{prefix}.jpg', targets)
+    return True
+
+
+def render(source_type, source_path, targets):
+    """entry point of the pool: `source_type` is 'image' or 'pdf', `targets` {kind: output path}"""
+    if source_type == 'pdf':
+        return render_pdf(source_path, targets)
+    render_image(source_path, targets)
+    return True
@@ -0,0 +1,123 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from .rendering import render
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+
+# renditions produced for each kind of source document
+RENDITION_KINDS = {
+    'image': ('thumbnail', 'web'),
+    'pdf': ('preview', 'thumbnail'),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# {rendition name: future} of the renditions being rendered on demand, so polling does not queue them again
+_pending = {}
+
+
+def get_executor():
+    """
+    the process pool rendering documents, started on first use. workers come from a forkserver:
+    forking the server itself would copy its threads' locks and its open database connections
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.CLAIM_RENDITION_WORKERS,
+                mp_context=multiprocessing.get_context('forkserver'),
+            )
+        return _executor
+
+
+def source_type(document):
+    """'image', 'pdf' or None when no rendition is made for the document"""
+    extension = os.path.splitext(document.file.name)[1].lower()
+    if extension == '.pdf':
+        return 'pdf'
+    if extension in IMAGE_EXTENSIONS:
+        return 'image'
+    return None
+
+
+def rendition_kinds(document):
+    return RENDITION_KINDS.get(source_type(document), ())
+
+
+def rendition_key(document):
+    # renditions follow the content: documents sharing a blob share their renditions
+    return document.blob_id or f'document-{document.pk}'
+
+
+def rendition_name(key, kind, schema_name=None):
+    """
+    claim_documents/<schema>/renditions/...: document ids and blobs are per tenant schema, so are
+    their renditions (the current schema by default)
+    """
+    schema_name = schema_name or connection.schema_name
+    return os.path.join('claim_documents', schema_name, 'renditions', key[:2], key, f'{kind}.jpg')
+
+
+def delete_renditions(key, schema_name=None):
+    for kinds in RENDITION_KINDS.values():
+        for kind in kinds:
+            default_storage.delete(rendition_name(key, kind, schema_name))
+
+
+def schedule_renditions(document, kinds=None):
+    """
+    queue the missing renditions of `document` on the process pool and return the future,
+    or None when there is nothing to render
+    """
+    source = source_type(document)
+    key = rendition_key(document)
+    targets = {
+        kind: default_storage.path(rendition_name(key, kind))
+        for kind in (kinds or RENDITION_KINDS.get(source, ()))
+        if not default_storage.exists(rendition_name(key, kind))
+    }
+    if source is None or not targets:
+        return None
+
+    future = get_executor().submit(render, source, default_storage.path(document.file.name), targets)
+
+    def log_failure(future):
+        if future.exception() is not None:
+            logger.warning('rendition of %s failed: %s', document.file.name, future.exception())
+    future.add_done_callback(log_failure)
+    return future
+
+
+def ensure_rendition(document, kind):
+    """
+    (name, ready) for the `kind` rendition of `document`. a missing one (never generated, failed or
+    cleaned up) is queued on the process pool and comes back not ready: the caller answers without
+    waiting for it and the client asks again. None when the document has no such rendition
+    """
+    if kind not in rendition_kinds(document):
+        return None
+    name = rendition_name(rendition_key(document), kind)
+    if default_storage.exists(name):
+        return name, True
+
+    with _executor_lock:
+        pending = _pending.get(name)
+    if pending is None or pending.done():
+        future = schedule_renditions(document, kinds=[kind])
+        if future is not None:
+            with _executor_lock:
+                _pending[name] = future
+            future.add_done_callback(lambda future: _pending.pop(name, None))
+    return name, default_storage.exists(name)
@@ -0,0 +1,119 @@
+"""
+Full-text search over claims, their notes and their document descriptions.
+
+Every table carries a generated `search_vector` column with a GIN index (claims/models.py), so
+each source is an index scan of its matching rows; a claim ranks by its best matching row.
+A source only passes on its MAX_SOURCE_HITS best rows among those the user may see, so paging
+never groups more than 3 * MAX_SOURCE_HITS rows, however many notes mention a common word.
+Headlines are only computed for the page being returned, ts_headline re-parses the text.
+"""
+import html
+
+from django.db import connection
+
+from .models import Claim, ClaimNote, ClaimDocument, SEARCH_CONFIG
+
+MAX_SOURCE_HITS = 1000
+
+# \x01 and \x02 never occur in user text: they are swapped for <mark> once the text is escaped
+HEADLINE_OPTIONS = 'StartSel=\x01, StopSel=\x02, MaxFragments=2, MaxWords=25, MinWords=8, FragmentDelimiter=" ... "'
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return {
+        'claim': quote(Claim._meta.db_table),
+        'note': quote(ClaimNote._meta.db_table),
+        'document': quote(ClaimDocument._meta.db_table),
+    }
+
+
+def search_claims(text, after=None, limit=25, claims=None):
+    """
+    [(rank, claim_id)] of the claims matching `text` (websearch syntax: words, "phrases", or, -word),
+    best first. `after` is the (rank, claim_id) of the last row of the previous page, `claims` a
+    Claim queryset the results are restricted to (the claims the user can see)
+    """
+    claims_sql, scope_params = None, []
+    if claims is not None:
+        claims_sql, scope_params = claims.values('id').query.sql_with_params()
+    sources = []
+    params = [SEARCH_CONFIG, text]
+    for alias, table, column in (('c', 'claim', 'c.id'), ('n', 'note', 'n.claim_id'), ('d', 'document', 'd.claim_id')):
+        # the restriction applies before the ranking, and each source keeps its MAX_SOURCE_HITS best rows
+        scope = f'AND {column} IN ({claims_sql})' if claims_sql else ''
+        sources.append(
+            f"""
+            (SELECT {column} AS claim_id, ts_rank({alias}.search_vector, query.q) AS rank
+            FROM {_tables()[table]} {alias}, query
+            WHERE {alias}.search_vector @@ query.q {scope}
+            ORDER BY rank DESC
+            LIMIT %s)
+            """
+        )
+        params.extend([*scope_params, MAX_SOURCE_HITS])
+
+    page = ''
+    if after is not None:
+        page = 'WHERE (rank, claim_id) < (%s::real, %s)'
+        params.extend(after)
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH query AS (SELECT websearch_to_tsquery(%s::regconfig, %s) AS q),
+            hits AS ({' UNION ALL '.join(sources)}),
+            ranked AS (SELECT claim_id, max(rank) AS rank FROM hits GROUP BY claim_id)
+            SELECT rank, claim_id FROM ranked {page}
+            ORDER BY rank DESC, claim_id DESC
+            LIMIT %s
+            """,
+            params,
+        )
+        return cursor.fetchall()
+
+
+def _mark(snippet):
+    return html.escape(snippet).replace('\x01', '<mark>').replace('\x02', '</mark>')
+
+
+def search_highlights(text, claim_ids):
+    """
+    {claim_id: {field: html snippet}} for `claim_ids`: the matched title and description, and the
+    best matching note and document description. the text is escaped, matches are wrapped in <mark>
+    """
+    highlights = {claim_id: {} for claim_id in claim_ids}
+    if not claim_ids:
+        return highlights
+    params = {'config': SEARCH_CONFIG, 'text': text, 'options': HEADLINE_OPTIONS, 'ids': list(claim_ids)}
+    query = 'WITH query AS (SELECT websearch_to_tsquery(%(config)s::regconfig, %(text)s) AS q)'
+    headline = 'ts_headline(%(config)s::regconfig, {}, query.q, %(options)s)'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            {query}
+            SELECT c.id, {headline.format('c.title')}, {headline.format('c.description')}
+            FROM {_tables()['claim']} c, query
+            WHERE c.id = ANY(%(ids)s) AND c.search_vector @@ query.q
+            """,
+            params,
+        )
+        for claim_id, title, description in cursor.fetchall():
+            for field, snippet in (('title', title), ('description', description)):
+                if '\x01' in snippet:
+                    highlights[claim_id][field] = _mark(snippet)
+
+        for field, table, column in (('note', 'note', 'note'), ('document', 'document', 'description')):
+            cursor.execute(
+                f"""
+                {query}
+                SELECT DISTINCT ON (t.claim_id) t.claim_id, t.id, {headline.format('t.' + column)}
+                FROM {_tables()[table]} t, query
+                WHERE t.claim_id = ANY(%(ids)s) AND t.search_vector @@ query.q
+                ORDER BY t.claim_id, ts_rank(t.search_vector, query.q) DESC, t.id DESC
+                """,
+                params,
+            )
+            for claim_id, pk, snippet in cursor.fetchall():
+                highlights[claim_id][field] = {'id': pk, 'snippet': _mark(snippet)}
+    return highlights
@@ -1,14 +1,20 @@
 from rest_framework import serializers
-from .models import Claim, ClaimDocument, ClaimNote
+from .models import Claim, ClaimDocument, ClaimNote, ClaimDocumentUpload, DocumentBlob, ClaimReview
+from .blobs import store_uploaded_file
+from .renditions import rendition_kinds
+from django.urls import reverse
 from policies.serializers import PolicySerializer
 from users.serializers import UserSerializer
+from mlt_ins.serializers import SparseFieldsetMixin
 
 
 class ClaimDocumentSerializer(serializers.ModelSerializer):
+    renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = ClaimDocument
-        fields = '__all__'
-        read_only_fields = ['created_at','uploaded_by','claim']
+        exclude = ['search_vector']
+        read_only_fields = ['created_at','uploaded_by','claim','blob']
         
 
         def update(self, instance, validated_data):
@@ -22,11 +28,56 @@ class ClaimDocumentSerializer(serializers.ModelSerializer):
             instance.save()
             return instance
 
+    def get_renditions(self, document):
+        """{kind: url} of the thumbnails/previews, the urls render missing renditions on demand"""
+        request = self.context.get('request')
+        renditions = {}
+        for kind in rendition_kinds(document):
+            url = reverse('document_rendition', kwargs={'document_id': document.pk, 'kind': kind})
+            renditions[kind] = request.build_absolute_uri(url) if request is not None else url
+        return renditions
+
+    def create(self, validated_data):
+        # identical content is stored once, see claims/blobs.py
+        validated_data['blob_id'], validated_data['file'] = store_uploaded_file(validated_data.pop('file'))
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        if 'file' not in validated_data:
+            return super().update(instance, validated_data)
+        previous_blob_id, previous_file = instance.blob_id, instance.file
+        validated_data['blob_id'], validated_data['file'] = store_uploaded_file(validated_data.pop('file'))
+        instance = super().update(instance, validated_data)
+        if previous_blob_id:
+            DocumentBlob.release([previous_blob_id])
+        elif previous_file:
+            previous_file.delete(save=False)
+        return instance
+
+
+class ClaimDocumentUploadSerializer(serializers.ModelSerializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+    size = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = ClaimDocumentUpload
+        fields = ['id','claim','document_type','description','filename','size','received','sha256','uploaded_by','created_at','updated_at']
+        read_only_fields = ['id','claim','received','uploaded_by','created_at','updated_at']
+
+
+class ClaimReviewSerializer(serializers.ModelSerializer):
+    claim_number = serializers.CharField(source='claim.claim_number', read_only=True)
+
+    class Meta:
+        model = ClaimReview
+        fields = ['id','claim','claim_number','reasons','status','reviewed_by','reviewed_at','created_at']
+        read_only_fields = ['id','claim','claim_number','reasons','reviewed_by','reviewed_at','created_at']
+
 
 class ClaimNoteSerializer(serializers.ModelSerializer):
     class Meta:
         model = ClaimNote
-        fields = '__all__'
+        exclude = ['search_vector']
         read_only_fields = ['created_at','author','claim']
 
         def update(self, instance, validated_data):
@@ -43,16 +94,43 @@ class ClaimNoteSerializer(serializers.ModelSerializer):
             
 
 
-class ClaimSerializer(serializers.ModelSerializer):
+class ClaimSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    supports ?fields= and ?expand=policy,assigned_to,documents,notes;
+    lists render policy and assigned_to nested and leave documents and notes out unless expanded
+    """
+    expandable_fields = ('policy', 'assigned_to', 'documents', 'notes')
+    list_expand = ('policy', 'assigned_to')
+    # version: the ETag of the claim (mlt_ins/concurrency.py)
+    always_load = ('id', 'created_at', 'version')
+
     policy = PolicySerializer(read_only=True)
     assigned_to = UserSerializer(read_only=True)
     documents = ClaimDocumentSerializer(many=True, read_only=True)
     notes = ClaimNoteSerializer(many=True, read_only=True)
     class Meta:
         model = Claim
-        fields = ['id','claim_number','status' ,'tenant' ,'policy','title' ,'description' ,'claim_amount' ,'approved_amount' ,'assigned_to' ,'incident_date' ,'created_at' ,'updated_at','documents', 'notes' ]
+        fields = ['id','claim_number','status' ,'tenant' ,'policy','title' ,'description' ,'claim_amount' ,'approved_amount' ,'assigned_to' ,'incident_date' ,'created_at' ,'updated_at','version','documents', 'notes' ]
         read_only_fields = ['id','claim_number','tenant','policy','assigned_to','created_at' ,'updated_at']
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None, many=False, fields=None, expand=None):
+        """
+        load every relation the nested serializers read in a fixed number of queries
+        (one join for policy/assigned_to, one prefetch each for documents and notes),
+        skipping the relations and columns the request did not ask for
+        """
+        fields, expand = cls.parse_fieldsets(request, many, fields, expand)
+        queryset = super().setup_eager_loading(queryset, fields=fields, expand=expand)
+
+        related = [name for name in ('policy', 'assigned_to') if name in expand]
+        if related:
+            queryset = queryset.select_related(*related)
+        prefetch = [name for name in ('documents', 'notes') if name in expand]
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
     
 
 
@@ -1,3 +1,479 @@
-from django.test import TestCase
+import hashlib
+import io
+import shutil
+import tempfile
+import uuid
+from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, override_settings
+from rest_framework.exceptions import NotFound
+from rest_framework.generics import RetrieveAPIView
+from rest_framework.test import APIRequestFactory, force_authenticate
+from django_tenants.test.cases import TenantTestCase
+
+from mlt_ins.access import has_access, has_object_access, access_filter
+from mlt_ins.conditional import ConditionalGetMixin, Validators
+from mlt_ins.streaming import streaming_content
+
+from policies.tests import create_policy, setup_test_tenant
+from users.models import User
+from .archives import DocumentArchive
+from .events import event_visible
+from .views import bulk_update_claim_status, claim_events, claim_review_queue, update_claim_status
+from .ledger import contribution, budget_claims, claims_within_coverage, rebuild_policy_coverage, remaining_coverage
+from .models import Claim, ClaimNote, ClaimDocumentUpload, ClaimStatusChange
+from .utils import allowed_predecessors, transition_claims, rebuild_claim_counters, track_policy_type_change, track_policy_deletion
+from .serializers import ClaimSerializer
+from .uploads import UploadError, write_chunk, complete_upload, upload_digest
+
+
+class ClaimSerializerQueryBudgetTest(TenantTestCase):
+    """
+    the claim list must cost the same number of queries whatever the page size:
+    one for the claims (policy and assignee joined) and one prefetch each for documents and notes
+    """
+    QUERY_BUDGET = 3
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        setup_test_tenant(tenant)
+
+    def setUp(self):
+        self.adjuster = User.objects.create_user(
+            email='adjuster@test.com',
+            username='adjuster',
+            phone_number='0000000001',
+            password='password',
+            role='adjuster',
+            tenant=self.tenant,
+        )
+        self.policy = create_policy(self.tenant)
+
+    def create_claims(self, start, count):
+        for i in range(start, start + count):
+            claim = Claim.objects.create(
+                claim_number=f'CLM-0000-0000-{i:03d}',
+                tenant=self.tenant,
+                policy=self.policy,
+                title=f'claim {i}',
+                description='rear-ended at a red light',
+                assigned_to=self.adjuster,
+                incident_date=date(2024, 6, 1),
+            )
+            ClaimNote.objects.create(claim=claim, author=self.adjuster, note='called the policyholder')
+
+    def serialize_policy_claims(self):
+        queryset = ClaimSerializer.setup_eager_loading(Claim.objects.filter(policy=self.policy))
+        return ClaimSerializer(queryset, many=True, expand=ClaimSerializer.expandable_fields).data
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        self.create_claims(0, 2)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            self.serialize_policy_claims()
+
+        self.create_claims(2, 25)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            data = self.serialize_policy_claims()
+        self.assertEqual(len(data), 27)
+
+
+class PermissionMatrixTest(SimpleTestCase):
+    """the compiled matrix keeps the ownership rules of the roles, as object checks and as filters"""
+
+    def setUp(self):
+        self.adjuster = User(id=uuid.uuid4(), role='adjuster')
+        self.other = User(id=uuid.uuid4(), role='adjuster')
+        self.call_center = User(id=uuid.uuid4(), role='call_center')
+        self.manager = User(id=uuid.uuid4(), role='manager')
+
+    def test_adjusters_change_only_their_own_notes(self):
+        note = ClaimNote(claim=Claim(assigned_to_id=self.adjuster.id), author_id=self.adjuster.id)
+        self.assertTrue(has_object_access(self.adjuster, 'change', 'note', note))
+        self.assertFalse(has_object_access(self.other, 'change', 'note', note))
+        self.assertTrue(has_object_access(self.manager, 'change', 'note', note))
+        self.assertFalse(has_object_access(self.call_center, 'change', 'note', note))
+
+    def test_reported_claims_belong_to_the_call_center(self):
+        reported = Claim(status='reported', assigned_to_id=self.adjuster.id)
+        assigned = Claim(status='assigned', assigned_to_id=self.adjuster.id)
+        self.assertTrue(has_object_access(self.call_center, 'change', 'claim', reported))
+        self.assertFalse(has_object_access(self.call_center, 'change', 'claim', assigned))
+        self.assertFalse(has_object_access(self.adjuster, 'change', 'claim', reported))
+        self.assertTrue(has_object_access(self.adjuster, 'change', 'claim', assigned))
+
+    def test_role_checks(self):
+        self.assertTrue(has_access(self.call_center, 'create', 'claim'))
+        self.assertFalse(has_access(self.adjuster, 'create', 'claim'))
+        self.assertTrue(has_access(self.adjuster, 'view', 'claim'))
+        self.assertFalse(has_access(self.adjuster, 'export', 'claim'))
+
+    def test_list_filters(self):
+        self.assertIsNone(access_filter(self.manager, 'view', 'claim'))
+        self.assertEqual(
+            str(access_filter(self.adjuster, 'view', 'claim')),
+            str(Q(assigned_to=self.adjuster.id)),
+        )
+        self.assertEqual(str(access_filter(self.adjuster, 'export', 'claim')), str(Q(pk__in=[])))
+
+
+class CoverageContributionTest(SimpleTestCase):
+    """what a claim adds to its policy's claimed / approved / paid totals, by status"""
+
+    def test_open_claims_only_count_as_claimed(self):
+        for status in ('reported', 'investigation', 'waiting_approval'):
+            self.assertEqual(contribution(status, Decimal('500'), None), (Decimal('500'), 0, 0))
+
+    def test_approval_and_payment(self):
+        self.assertEqual(contribution('approved', Decimal('500'), Decimal('400')), (Decimal('500'), Decimal('400'), 0))
+        self.assertEqual(contribution('payment_processing', Decimal('500'), Decimal('400')), (Decimal('500'), Decimal('400'), 0))
+        self.assertEqual(contribution('paid', Decimal('500'), Decimal('400')), (Decimal('500'), Decimal('400'), Decimal('400')))
+
+    def test_denied_and_closed(self):
+        self.assertEqual(contribution('denied', Decimal('500'), None), (0, 0, 0))
+        # closed after a denial counts for nothing, after a payment as paid
+        self.assertEqual(contribution('closed', Decimal('500'), None), (0, 0, 0))
+        self.assertEqual(contribution('closed', Decimal('500'), Decimal('400')), (Decimal('500'), Decimal('400'), Decimal('400')))
+
+    def test_budget_is_first_come_first_served_per_policy(self):
+        claims = [
+            (1, 10, Decimal('300'), None),
+            (2, 10, Decimal('900'), Decimal('150')),   # the approved amount is what approval takes
+            (3, 10, Decimal('100'), None),             # 50 left on policy 10
+            (4, 20, Decimal('100'), None),
+        ]
+        self.assertEqual(budget_claims(claims, {10: Decimal('500'), 20: Decimal('100')}), [1, 2, 4])
+
+
+class ClaimsWithinCoverageTest(TenantTestCase):
+    """bulk approvals only spend the remaining coverage on the claims they actually move"""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        setup_test_tenant(tenant)
+
+    def setUp(self):
+        self.policy = create_policy(self.tenant, coverage_amount=1000)
+
+    def create_claim(self, number, status, claim_amount, approved_amount=None):
+        return Claim.objects.create(
+            claim_number=f'CLM-0000-0001-{number:03d}',
+            tenant=self.tenant,
+            policy=self.policy,
+            title=f'claim {number}',
+            description='hail damage',
+            incident_date=date(2024, 6, 1),
+            status=status,
+            claim_amount=claim_amount,
+            approved_amount=approved_amount,
+        )
+
+    def test_mixed_statuses(self):
+        approved = self.create_claim(1, 'approved', 600, 600)
+        paid = self.create_claim(2, 'paid', 100, 100)
+        first = self.create_claim(3, 'waiting_approval', 250)
+        second = self.create_claim(4, 'waiting_approval', 100)
+        reported = self.create_claim(5, 'reported', 50)
+        rebuild_policy_coverage()
+        self.assertEqual(remaining_coverage(self.policy.id), Decimal('300'))
+
+        ids = [approved.id, paid.id, first.id, second.id, reported.id]
+        # the approved and paid claims are already counted, the reported one cannot be approved
+        self.assertEqual(claims_within_coverage(ids, allowed_predecessors('approved')), [first.id])
+
+        moved = transition_claims(ids, 'approved')
+        self.assertEqual(moved, [(first.id, 'waiting_approval')])
+        self.assertEqual(remaining_coverage(self.policy.id), Decimal('50'))
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        self.create_claim(1, 'approved', 600, 600)
+        drift = rebuild_policy_coverage()
+        self.assertEqual(drift[self.policy.id], ((Decimal('600'), Decimal('600'), 0), (0, 0, 0)))
+        self.assertEqual(rebuild_policy_coverage(fix=False), {})
+
+
+class ClaimTransitionTest(TenantTestCase):
+    """status moves are compare-and-set on the current status, and keep the counters and the history in step"""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        setup_test_tenant(tenant)
+
+    def setUp(self):
+        self.manager = self.create_user('manager', 1)
+        self.adjuster = self.create_user('adjuster', 2)
+        self.other_adjuster = self.create_user('adjuster', 3)
+        self.policy = create_policy(self.tenant)
+        self.claims = 0
+
+    def create_user(self, role, number):
+        return User.objects.create_user(
+            email=f'user{number}@test.com',
+            username=f'user{number}',
+            phone_number=f'000000000{number}',
+            password='password',
+            role=role,
+            tenant=self.tenant,
+        )
+
+    def create_claim(self, status, assigned_to=None):
+        self.claims += 1
+        claim = Claim.objects.create(
+            claim_number=f'CLM-0000-0003-{self.claims:03d}',
+            tenant=self.tenant,
+            policy=self.policy,
+            title=f'claim {self.claims}',
+            description='broken windscreen',
+            incident_date=date(2024, 6, 1),
+            status=status,
+            assigned_to=assigned_to,
+        )
+        rebuild_claim_counters()
+        return claim
+
+    def bulk(self, user, claim_ids, new_status):
+        request = APIRequestFactory().post(
+            '/claims/bulk-update-status/', {'claim_ids': claim_ids, 'new_status': new_status}, format='json',
+        )
+        force_authenticate(request, user=user)
+        return bulk_update_claim_status(request)
+
+    def history(self, claim):
+        return list(ClaimStatusChange.objects.filter(claim=claim).values_list('previous_status', 'status'))
+
+    def test_bulk_partitions_the_claims(self):
+        first = self.create_claim('reported')
+        second = self.create_claim('reported')
+        paid = self.create_claim('paid')
+        missing = paid.id + 1000
+
+        response = self.bulk(self.manager, [first.id, second.id, paid.id, missing], 'assigned')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['moved'], [first.id, second.id])
+        self.assertEqual(response.data['rejected'], [{'id': paid.id, 'status': 'paid'}])
+        self.assertEqual(response.data['not_found'], [missing])
+
+        self.assertEqual(self.history(first), [('reported', 'assigned')])
+        self.assertEqual(self.history(paid), [])
+        self.assertEqual(rebuild_claim_counters(fix=False), {})
+
+    def test_adjusters_only_move_their_own_claims(self):
+        own = self.create_claim('assigned', self.adjuster)
+        other = self.create_claim('assigned', self.other_adjuster)
+
+        response = self.bulk(self.adjuster, [own.id, other.id], 'under_review')
+        self.assertEqual(response.data['moved'], [own.id])
+        self.assertEqual(response.data['rejected'], [])
+        self.assertEqual(response.data['not_found'], [other.id])
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'assigned')
+        self.assertEqual(rebuild_claim_counters(fix=False), {})
+
+    def test_stale_predecessor_is_a_conflict(self):
+        claim = self.create_claim('reported')
+
+        def denied_first(claim_ids, new_status, changed_by=None):
+            # someone else denies the claim between the read and the update
+            transition_claims(claim_ids, 'denied')
+            return transition_claims(claim_ids, new_status, changed_by=changed_by)
+
+        request = APIRequestFactory().put(f'/claims/{claim.id}/update-status/?new_status=assigned')
+        force_authenticate(request, user=self.manager)
+        with mock.patch('claims.views.transition_claims', denied_first):
+            response = update_claim_status(request, claim_id=claim.id)
+        self.assertEqual(response.status_code, 409)
+
+        claim.refresh_from_db()
+        self.assertEqual(claim.status, 'denied')
+        self.assertEqual(self.history(claim), [('reported', 'denied')])
+        self.assertEqual(rebuild_claim_counters(fix=False), {})
+
+
+class DocumentArchiveStreamTest(SimpleTestCase):
+    def test_asgi_streams_the_same_bytes(self):
+        archive = DocumentArchive([])
+        content = streaming_content(AsyncRequestFactory().get('/claims/1/documents.zip'), archive.iter_bytes())
+
+        async def consume():
+            return b''.join([chunk async for chunk in content])
+
+        data = async_to_sync(consume)()
+        self.assertEqual(data, b''.join(archive.iter_bytes()))
+        self.assertEqual(len(data), archive.size)
+        self.assertTrue(data.startswith(b'PK\x05\x06'))
+
+
+class PolicyClaimCountersTest(TenantTestCase):
+    """the claim counters, keyed on the policy type, follow a policy changing type or going away"""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        setup_test_tenant(tenant)
+
+    def setUp(self):
+        self.policy = create_policy(self.tenant)
+        for i, status in enumerate(['reported', 'reported', 'approved']):
+            Claim.objects.create(
+                claim_number=f'CLM-0000-0002-{i:03d}',
+                tenant=self.tenant,
+                policy=self.policy,
+                title=f'claim {i}',
+                description='water damage',
+                incident_date=date(2024, 6, 1),
+                status=status,
+            )
+        rebuild_claim_counters()
+
+    def test_type_change_moves_the_counts(self):
+        self.policy.policy_type = 'home'
+        self.policy.save()
+        track_policy_type_change(self.policy.id, 'auto', 'home')
+        self.assertEqual(rebuild_claim_counters(fix=False), {})
+
+    def test_deletion_uncounts_the_claims(self):
+        track_policy_deletion(self.policy.id, 'auto')
+        self.policy.delete()
+        self.assertEqual(rebuild_claim_counters(fix=False), {})
+
+
+class NotModifiedAccessTest(SimpleTestCase):
+    """a 304 is only answered to a user the full response would be sent to"""
+
+    class HiddenClaim(ConditionalGetMixin, RetrieveAPIView):
+        authentication_classes = []
+        permission_classes = []
+        lookup_field = 'claim_id'
+
+        def get_validators(self):
+            return Validators(['1'], version=1)
+
+        def get_object(self):
+            # out of the user's scope
+            raise NotFound()
+
+    def test_object_checks_run_before_304(self):
+        request = APIRequestFactory().get('/policy/1/claims/2/', headers={'If-None-Match': '*'})
+        response = self.HiddenClaim.as_view()(request, policy_id=1, claim_id=2)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class ClaimEventVisibilityTest(SimpleTestCase):
+    def setUp(self):
+        self.adjuster = User(id=uuid.uuid4(), role='adjuster')
+        self.manager = User(id=uuid.uuid4(), role='manager')
+
+    def test_adjusters_only_hear_of_their_claims(self):
+        own = {'type': 'note_added', 'claim_id': 1, 'assigned_to': str(self.adjuster.id)}
+        other = {'type': 'status_changed', 'claim_id': 2, 'status': 'assigned', 'assigned_to': str(uuid.uuid4())}
+        unassigned = {'type': 'claim_created', 'claim_id': 3, 'status': 'reported', 'assigned_to': None}
+        self.assertTrue(event_visible(self.adjuster, own))
+        self.assertFalse(event_visible(self.adjuster, other))
+        self.assertFalse(event_visible(self.adjuster, unassigned))
+        for event in (own, other, unassigned):
+            self.assertTrue(event_visible(self.manager, event))
+
+
+class ChunkedUploadTest(TenantTestCase):
+    """chunks are written one at a time per upload, so the stored digest always matches the stored bytes"""
+    content = b'0123456789abcdef'
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        setup_test_tenant(tenant)
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.adjuster = User.objects.create_user(
+            email='adjuster@test.com',
+            username='adjuster',
+            phone_number='0000000001',
+            password='password',
+            role='adjuster',
+            tenant=self.tenant,
+        )
+        claim = Claim.objects.create(
+            claim_number='CLM-0000000001',
+            tenant=self.tenant,
+            policy=create_policy(self.tenant),
+            title='stolen bicycle',
+            description='taken from the garage',
+            assigned_to=self.adjuster,
+            incident_date=date(2024, 6, 1),
+        )
+        self.upload = ClaimDocumentUpload.objects.create(
+            claim=claim,
+            uploaded_by=self.adjuster,
+            document_type='photo',
+            filename='garage.jpg',
+            size=len(self.content),
+        )
+
+    def write(self, upload, offset, data):
+        return write_chunk(upload, offset, len(data), io.BytesIO(data))
+
+    def stored_bytes(self):
+        with open(default_storage.path(self.upload.part_name), 'rb') as part:
+            return part.read()
+
+    def test_resume(self):
+        self.assertEqual(self.write(self.upload, 0, self.content[:6]), 6)
+        # the client lost the answer and asks where to resume from
+        upload = ClaimDocumentUpload.objects.get(pk=self.upload.pk)
+        self.assertEqual(self.write(upload, upload.received, self.content[6:]), len(self.content))
+        document = complete_upload(upload)
+        self.assertEqual(document.blob_id, hashlib.sha256(self.content).hexdigest())
+
+    def test_stale_offset(self):
+        self.write(self.upload, 0, self.content[:6])
+        with self.assertRaises(UploadError) as raised:
+            self.write(self.upload, 2, self.content[2:8])
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(self.upload.received, 6)
+        self.assertEqual(self.stored_bytes(), self.content[:6])
+
+    def test_concurrent_puts_at_the_same_offset(self):
+        # both requests read the upload at offset 0, the second one got the row lock once the first committed
+        first = ClaimDocumentUpload.objects.get(pk=self.upload.pk)
+        second = ClaimDocumentUpload.objects.get(pk=self.upload.pk)
+        self.write(first, 0, self.content[:6])
+        with self.assertRaises(UploadError) as raised:
+            self.write(second, 0, b'XXXXXXXX')
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(second.received, 6)
+        self.assertEqual(self.stored_bytes(), self.content[:6])
+
+        self.write(second, 6, self.content[6:])
+        self.assertEqual(self.stored_bytes(), self.content)
+        upload = ClaimDocumentUpload.objects.get(pk=self.upload.pk)
+        self.assertEqual(upload_digest(upload), hashlib.sha256(self.content).hexdigest())
+
+    def test_cut_short_chunk_drops_the_running_hash(self):
+        self.write(self.upload, 0, self.content[:6])
+        with self.assertRaises(UploadError):
+            write_chunk(self.upload, 6, 10, io.BytesIO(b'XX'))
+        self.write(self.upload, 6, self.content[6:])
+        self.assertEqual(upload_digest(self.upload), hashlib.sha256(self.content).hexdigest())
+
+
+class ClaimEventStreamTest(SimpleTestCase):
+    def test_refused_under_wsgi(self):
+        # WSGI would consume the endless stream before sending anything
+        response = async_to_sync(claim_events)(RequestFactory().get('/claims/events/'))
+        self.assertEqual(response.status_code, 501)
+
+
+class ClaimReviewQueueTest(SimpleTestCase):
+    def test_unknown_status(self):
+        request = APIRequestFactory().get('/claims/reviews/', {'status': 'closed'})
+        force_authenticate(request, user=User(role='manager'))
+        self.assertEqual(claim_review_queue(request).status_code, 400)
@@ -0,0 +1,136 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ClaimDocument, ClaimDocumentUpload
+from .blobs import store_local_file
+
+# size of the blocks read from the request body and from disk
+BLOCK_SIZE = 64 * 1024
+
+# running SHA-256 of the uploads this process has been receiving, {upload_id: (offset, hasher)}.
+# a chunk landing on another worker (or after a restart) just means the digest is recomputed from
+# the stored bytes on completion
+_MAX_HASHERS = 256
+_hashers = OrderedDict()
+
+
+class UploadError(Exception):
+    def __init__(self, detail, status):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+
+
+def max_document_size(tenant):
+    limits = settings.CLAIM_DOCUMENT_MAX_SIZE
+    return limits.get(getattr(tenant, 'subscription_plan', None), min(limits.values()))
+
+
+def _remember_hasher(upload_id, offset, hasher):
+    _hashers[upload_id] = (offset, hasher)
+    _hashers.move_to_end(upload_id)
+    while len(_hashers) > _MAX_HASHERS:
+        _hashers.popitem(last=False)
+
+
+def write_chunk(upload, offset, length, stream):
+    """
+    copy `length` bytes of `stream` (the request body) into the upload's part file at `offset`,
+    BLOCK_SIZE at a time, and advance `received`. the upload row stays locked for the whole
+    write: of two clients retrying the same chunk the second one waits, then finds the offset
+    moved and gets a 409 without touching the file. `upload.received` is refreshed from the
+    locked row. returns the new offset
+    """
+    if length <= 0:
+        raise UploadError('the chunk is empty', 400)
+
+    with transaction.atomic():
+        received = (
+            ClaimDocumentUpload.objects.select_for_update()
+            .filter(pk=upload.pk).values_list('received', flat=True).first()
+        )
+        if received is None:
+            raise UploadError('the upload has been cancelled', 404)
+        upload.received = received
+        if offset != received:
+            raise UploadError(f'expected offset {received}', 409)
+        if offset + length > upload.size:
+            raise UploadError('the chunk goes past the announced size of the document', 413)
+
+        # local filesystem storage: chunks are appended in place, nothing is buffered in memory
+        path = default_storage.path(upload.part_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # whatever happens to this chunk, the running hash stops matching the file until it is committed
+        cached = _hashers.pop(upload.id, None)
+        if offset == 0:
+            hasher = hashlib.sha256()
+        else:
+            hasher = cached[1] if cached and cached[0] == offset else None
+        written = 0
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+            part.seek(offset)
+            part.truncate()
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                part.write(block)
+                if hasher is not None:
+                    hasher.update(block)
+                written += len(block)
+
+        if written != length:
+            raise UploadError('the chunk was cut short, resume from the current offset', 400)
+
+        ClaimDocumentUpload.objects.filter(pk=upload.pk).update(received=offset + length, updated_at=timezone.now())
+        upload.received = offset + length
+
+    if hasher is not None:
+        _remember_hasher(upload.id, offset + length, hasher)
+    return offset + length
+
+
+def upload_digest(upload):
+    """SHA-256 of the uploaded bytes, from the running hash when this process saw every chunk"""
+    cached = _hashers.pop(upload.id, None)
+    if cached and cached[0] == upload.size:
+        return cached[1].hexdigest()
+
+    hasher = hashlib.sha256()
+    with default_storage.open(upload.part_name, 'rb') as part:
+        for block in iter(lambda: part.read(BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def complete_upload(upload):
+    """
+    turn a fully received upload into a ClaimDocument: the part file is renamed into its blob,
+    never copied, or dropped if the same content is already stored. the caller holds a lock on the upload row
+    """
+    if upload.received != upload.size:
+        raise UploadError(f'{upload.size - upload.received} bytes are still missing', 409)
+
+    digest = upload_digest(upload)
+    if upload.sha256 and digest != upload.sha256.lower():
+        upload.delete()
+        raise UploadError('the uploaded content does not match the announced sha256, start a new upload', 400)
+
+    sha256, name = store_local_file(default_storage.path(upload.part_name), digest, upload.size, upload.filename)
+    document = ClaimDocument.objects.create(
+        claim=upload.claim,
+        document_type=upload.document_type,
+        file=name,
+        blob_id=sha256,
+        uploaded_by=upload.uploaded_by,
+        description=upload.description,
+    )
+    ClaimDocumentUpload.objects.filter(pk=upload.pk).delete()
+    return document
@@ -7,10 +7,27 @@ urlpatterns = [
 
     path('claims/<int:claim_id>/assign/',view=views.assign_claim),
     path('claims/<int:claim_id>/update-status/',view=views.update_claim_status),
+    path('claims/bulk-update-status/',view=views.bulk_update_claim_status),
+    path('claims/auto-assign/',view=views.auto_assign_claims),
+    path('claims/reassign-from/<str:user_id>/',view=views.reassign_user_claims),
+    path('claims/summary/',view=views.claims_summary),
+    path('claims/search/',view=views.search_claims_view),
+    path('claims/export/',view=views.export_claims),
+    path('claims/reviews/',view=views.claim_review_queue),
+    path('claims/reviews/<int:review_id>/resolve/',view=views.resolve_claim_review),
+    path('claims/events/',view=views.claim_events),
+    path('claims/status-metrics/',view=views.status_metrics),
+    path('claims/status-metrics/adjusters/',view=views.adjuster_status_metrics),
 
     path('claims/<int:claim_id>/add-note/',view=views.add_note),
     path('notes/<int:note_id>/',view=views.NoteDetails.as_view()),
 
     path('claims/<int:claim_id>/add-document/',view=views.add_document),
+    path('claims/<int:claim_id>/documents.zip',view=views.claim_documents_archive),
     path('documents/<int:document_id>/',view=views.documentDetails.as_view()),
+    path('documents/<int:document_id>/renditions/<str:kind>/',view=views.document_rendition,name='document_rendition'),
+
+    path('claims/<int:claim_id>/uploads/',view=views.start_document_upload),
+    path('uploads/<uuid:upload_id>/',view=views.DocumentUploadDetails.as_view()),
+    path('uploads/<uuid:upload_id>/complete/',view=views.complete_document_upload),
 ]
\ No newline at end of file
@@ -1,12 +1,28 @@
-import random
+from django.db import connection, models, transaction
+from datetime import date
+from django.utils import timezone
+from mlt_ins.sequences import BlockAllocator
+from .models import Claim, ClaimStatusChange, ClaimCounter, ClaimNote, ClaimDocument
+from .events import publish_claim_events, status_change_events
+from .ledger import apply_coverage_deltas, claims_within_coverage, contribution
+from policies.models import Policy
+from collections import Counter
 
-def generate_claim_number(length=4,repeat=3):
-    digs = '0123456789'
-    rslt = ''
-    for _ in range(repeat):
-        rslt += ''.join(random.choice(digs) for i in range(length))
-        rslt +='-'
-    return 'CLM-'+rslt[:-2]    #to get rid of the last -
+# backed by the per-tenant claims_claim_number_seq sequence (see migrations/0004_claim_number_sequence.py), INCREMENT BY must match
+claim_number_allocator = BlockAllocator('claims_claim_number_seq', block_size=50)
+
+
+def format_claim_number(value):
+    return f'CLM-{value:010d}'
+
+
+def generate_claim_numbers(count):
+    """allocate `count` unique claim numbers in at most one database round trip"""
+    return [format_claim_number(value) for value in claim_number_allocator.allocate(count)]
+
+
+def generate_claim_number():
+    return generate_claim_numbers(1)[0]
 
 import uuid
 def is_valid_uuid4(value):
@@ -18,18 +34,365 @@ def is_valid_uuid4(value):
     
 
 
+ALLOWED_TRANSITIONS = {
+    'reported': ['assigned', 'denied'],
+    'assigned': ['under_review', 'documents_requested', 'denied'],
+    'under_review': ['investigation', 'documents_requested'],
+    'investigation': ['waiting_approval', 'documents_requested'],
+    'documents_requested': ['investigation', 'waiting_approval'],
+    'waiting_approval': ['approved', 'denied'],
+    'approved': ['payment_processing'],
+    'payment_processing': ['paid'],
+    'paid': ['closed'],
+    'denied': ['closed'],
+}
+
+
 def is_valid_status_transition(current_status, new_status):
-    allowed_transitions = {
-        'reported': ['assigned', 'denied'],
-        'assigned': ['under_review', 'documents_requested', 'denied'],
-        'under_review': ['investigation', 'documents_requested'],
-        'investigation': ['waiting_approval', 'documents_requested'],
-        'documents_requested': ['investigation', 'waiting_approval'],
-        'waiting_approval': ['approved', 'denied'],
-        'approved': ['payment_processing'],
-        'payment_processing': ['paid'],
-        'paid': ['closed'],
-        'denied': ['closed'],
-    }
-    
-    return new_status in allowed_transitions.get(current_status, [])
\ No newline at end of file
+    return new_status in ALLOWED_TRANSITIONS.get(current_status, [])
+
+
+def allowed_predecessors(new_status):
+    """statuses a claim may move to `new_status` from"""
+    return [status for status, targets in ALLOWED_TRANSITIONS.items() if new_status in targets]
+
+
+def transition_claims(claim_ids, new_status, changed_by=None):
+    """
+    move every claim in `claim_ids` whose current status allows it to `new_status`
+    in a single compare-and-set UPDATE; claims in any other status are left untouched.
+    the moves are logged to the status history and the policies' coverage ledger in the same transaction.
+    an approval also fills an empty approved_amount with the claim_amount, and leaves out the
+    claims that would take their policy past its coverage (see claims/ledger.py)
+
+    returns a list of (claim_id, previous_status) for the claims that moved
+    """
+    predecessors = allowed_predecessors(new_status)
+    if not claim_ids or not predecessors:
+        return []
+
+    table = connection.ops.quote_name(Claim._meta.db_table)
+    policy_table = connection.ops.quote_name(Policy._meta.db_table)
+    now = timezone.now()
+    approving = new_status == 'approved'
+    with transaction.atomic():
+        if approving:
+            claim_ids = claims_within_coverage(claim_ids, predecessors)
+            if not claim_ids:
+                return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} AS claim
+                SET status = %s, updated_at = %s, version = claim.version + 1,
+                    approved_amount = CASE WHEN %s THEN coalesce(claim.approved_amount, claim.claim_amount) ELSE claim.approved_amount END
+                FROM (
+                    SELECT c.id, c.status, p.policy_type FROM {table} c
+                    JOIN {policy_table} p ON p.id = c.policy_id
+                    WHERE c.id = ANY(%s) AND c.status = ANY(%s)
+                    FOR UPDATE OF c
+                ) AS previous
+                WHERE claim.id = previous.id
+                RETURNING claim.id, previous.status, claim.assigned_to_id, claim.tenant_id, previous.policy_type,
+                          claim.policy_id, claim.claim_amount, claim.approved_amount
+                """,
+                [new_status, now, approving, list(claim_ids), predecessors],
+            )
+            rows = cursor.fetchall()
+
+        deltas = Counter()
+        coverage = {}
+        for _, previous_status, assigned_to_id, tenant_id, policy_type, policy_id, claim_amount, approved_amount in rows:
+            deltas[(tenant_id, previous_status, assigned_to_id, policy_type)] -= 1
+            deltas[(tenant_id, new_status, assigned_to_id, policy_type)] += 1
+            # no status before approval counts approved_amount, so the value after the update does for both sides
+            before = contribution(previous_status, claim_amount, approved_amount)
+            after = contribution(new_status, claim_amount, approved_amount)
+            total = coverage.get(policy_id, (0, 0, 0))
+            coverage[policy_id] = tuple(t + a - b for t, a, b in zip(total, after, before))
+        apply_counter_deltas(deltas)
+        apply_coverage_deltas(coverage, enforce=approving)
+
+        record_status_changes([
+            ClaimStatusChange(
+                claim_id=claim_id,
+                previous_status=previous_status,
+                status=new_status,
+                assigned_to_id=assigned_to_id,
+                changed_by=changed_by,
+                changed_at=now,
+            )
+            for claim_id, previous_status, assigned_to_id, *_ in rows
+        ])
+    return [(claim_id, previous_status) for claim_id, previous_status, *_ in rows]
+
+
+def claim_validators(claim_id):
+    """
+    what the full representation of a claim is built from, in one indexed lookup: (version,
+    updated_at, assigned_to_id, policy version, policy updated_at, digest of the notes' versions,
+    digest of the documents' updates), None when the claim does not exist
+    """
+    table = connection.ops.quote_name(Claim._meta.db_table)
+    policy_table = connection.ops.quote_name(Policy._meta.db_table)
+    note_table = connection.ops.quote_name(ClaimNote._meta.db_table)
+    document_table = connection.ops.quote_name(ClaimDocument._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT c.version, c.updated_at, c.assigned_to_id, p.version, p.updated_at,
+                   (SELECT md5(coalesce(string_agg(n.id || '.' || n.version, ',' ORDER BY n.id), ''))
+                    FROM {note_table} n WHERE n.claim_id = c.id),
+                   (SELECT md5(coalesce(string_agg(d.id || '.' || d.updated_at, ',' ORDER BY d.id), ''))
+                    FROM {document_table} d WHERE d.claim_id = c.id)
+            FROM {table} c JOIN {policy_table} p ON p.id = c.policy_id
+            WHERE c.id = %s
+            """,
+            [claim_id],
+        )
+        return cursor.fetchone()
+
+
+def record_status_changes(changes):
+    """append ClaimStatusChange rows to the (partitioned) status history and publish them as live events"""
+    if changes:
+        ClaimStatusChange.objects.bulk_create(changes)
+        publish_claim_events(status_change_events(changes))
+
+
+def record_claim_state(claim, changed_by=None, previous_status=None):
+    """log the current status and assignee of `claim`, used on creation and reassignment"""
+    record_status_changes([
+        ClaimStatusChange(
+            claim=claim,
+            previous_status=previous_status,
+            status=claim.status,
+            assigned_to_id=claim.assigned_to_id,
+            changed_by=changed_by,
+        )
+    ])
+
+
+def claim_counter_key(claim):
+    """the ClaimCounter row a claim is counted in"""
+    return (claim.tenant_id, claim.status, claim.assigned_to_id, claim.policy.policy_type)
+
+
+def apply_counter_deltas(deltas):
+    """
+    add `deltas` ({(tenant_id, status, assigned_to_id, policy_type): change}) to the claim counters
+    with a single upsert; rows are written in key order so concurrent updates cannot deadlock
+    """
+    rows = sorted(
+        ((key, change) for key, change in deltas.items() if change),
+        key=lambda item: tuple(str(part) for part in item[0]),
+    )
+    if not rows:
+        return
+
+    table = connection.ops.quote_name(ClaimCounter._meta.db_table)
+    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))
+    params = [value for key, change in rows for value in (*key, change)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS counter (tenant_id, status, assigned_to_id, policy_type, count)
+            VALUES {values}
+            ON CONFLICT ON CONSTRAINT claim_counter_key
+            DO UPDATE SET count = counter.count + EXCLUDED.count
+            """,
+            params,
+        )
+
+
+def track_claim_change(claim, previous_key=None, changed_by=None):
+    """
+    keep the status history and the counters in line with a claim that was just created
+    (`previous_key` None) or whose status or assignee changed from `previous_key` (see claim_counter_key).
+    must run in the transaction that saved the claim
+    """
+    deltas = Counter({claim_counter_key(claim): 1})
+    if previous_key is not None:
+        deltas[previous_key] -= 1
+    apply_counter_deltas(deltas)
+    record_claim_state(claim, changed_by, previous_status=previous_key[1] if previous_key else None)
+
+
+def track_claim_deletion(claim):
+    apply_counter_deltas({claim_counter_key(claim): -1})
+
+
+def policy_claim_counts(policy_id):
+    """
+    {(tenant_id, status, assigned_to_id): count} of the claims of a policy. the claims stay locked
+    until the transaction ends, so none of them changes counter between the count and its use
+    """
+    claims = Claim.objects.select_for_update().filter(policy_id=policy_id).order_by('id')
+    return Counter(claims.values_list('tenant_id', 'status', 'assigned_to_id'))
+
+
+def track_policy_type_change(policy_id, previous_type, policy_type):
+    """move the claims of a policy from the counters of its previous type to those of the new one"""
+    deltas = Counter()
+    for (tenant_id, status, assigned_to_id), count in policy_claim_counts(policy_id).items():
+        deltas[(tenant_id, status, assigned_to_id, previous_type)] -= count
+        deltas[(tenant_id, status, assigned_to_id, policy_type)] += count
+    apply_counter_deltas(deltas)
+
+
+def track_policy_deletion(policy_id, policy_type):
+    """uncount the claims the deletion of a policy cascades to"""
+    apply_counter_deltas({
+        (tenant_id, status, assigned_to_id, policy_type): -count
+        for (tenant_id, status, assigned_to_id), count in policy_claim_counts(policy_id).items()
+    })
+
+
+def count_claims_by_key():
+    """recount the claims of the current schema, {(tenant_id, status, assigned_to_id, policy_type): count}"""
+    rows = (
+        Claim.objects.values_list('tenant_id', 'status', 'assigned_to_id', 'policy__policy_type')
+        .annotate(total=models.Count('id'))
+        .order_by()
+    )
+    return {(tenant_id, status, assigned_to_id, policy_type): total for tenant_id, status, assigned_to_id, policy_type, total in rows}
+
+
+def rebuild_claim_counters(fix=True):
+    """
+    compare the counters with a fresh count of the claims and, if `fix`, replace them.
+    returns the drift as {key: (counted, stored)}
+    """
+    table = connection.ops.quote_name(ClaimCounter._meta.db_table)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # lock before counting: a claim change committing in between would otherwise look like
+            # drift and be applied a second time by the fix. a table lock rather than FOR UPDATE,
+            # which would not hold back the first counter row of a new key
+            cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+        stored = {
+            (tenant_id, status, assigned_to_id, policy_type): count
+            for tenant_id, status, assigned_to_id, policy_type, count in ClaimCounter.objects
+            .values_list('tenant_id', 'status', 'assigned_to_id', 'policy_type', 'count')
+        }
+        actual = count_claims_by_key()
+        drift = {
+            key: (actual.get(key, 0), stored.get(key, 0))
+            for key in set(stored) | set(actual)
+            if actual.get(key, 0) != stored.get(key, 0)
+        }
+        if fix and drift:
+            ClaimCounter.objects.all().delete()
+            ClaimCounter.objects.bulk_create([
+                ClaimCounter(tenant_id=tenant_id, status=status, assigned_to_id=assigned_to_id, policy_type=policy_type, count=count)
+                for (tenant_id, status, assigned_to_id, policy_type), count in actual.items()
+            ])
+    return drift
+
+
+def _month_start(year, month):
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return date(year, month, 1)
+
+
+def create_status_history_partitions(months_ahead=3):
+    """
+    make sure the status history has a partition for the current month and the next `months_ahead`.
+    rows that already landed in the default partition for one of those months are moved
+    into the new partition before it is attached. returns the names of the partitions created
+    """
+    today = timezone.now().date()
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            start = _month_start(today.year, today.month + offset)
+            end = _month_start(start.year, start.month + 1)
+            name = f'claims_claimstatuschange_y{start.year}m{start.month:02d}'
+
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is not None:
+                continue
+
+            with transaction.atomic():
+                cursor.execute(
+                    f'CREATE TABLE {name} (LIKE claims_claimstatuschange INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+                )
+                cursor.execute(
+                    f"""
+                    WITH moved AS (
+                        DELETE FROM claims_claimstatuschange_default
+                        WHERE changed_at >= %s AND changed_at < %s
+                        RETURNING *
+                    )
+                    INSERT INTO {name} SELECT * FROM moved
+                    """,
+                    [start, end],
+                )
+                cursor.execute(
+                    f"ALTER TABLE claims_claimstatuschange ATTACH PARTITION {name} "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                )
+            created.append(name)
+    return created
+
+
+def time_in_status(start, end, by_assignee=False):
+    """
+    time claims spent in each status (optionally per assignee) for the stays that began in [start, end).
+
+    every history row opens a stay that the claim's next row closes; only history from `start`
+    onwards is read, so partitions before the window are pruned and the window ordering is served
+    by the (claim_id, changed_at) index. stays still open are only counted.
+    """
+    group = 'assigned_to_id, status' if by_assignee else 'status'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH stays AS (
+                SELECT
+                    status,
+                    assigned_to_id,
+                    changed_at,
+                    LEAD(changed_at) OVER (PARTITION BY claim_id ORDER BY changed_at, id) AS left_at
+                FROM claims_claimstatuschange
+                WHERE changed_at >= %s
+            ),
+            durations AS (
+                SELECT status, assigned_to_id, EXTRACT(EPOCH FROM left_at - changed_at) AS seconds
+                FROM stays
+                WHERE changed_at < %s
+            )
+            SELECT
+                {group},
+                COUNT(seconds),
+                COUNT(*) - COUNT(seconds),
+                AVG(seconds),
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY seconds),
+                PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY seconds),
+                MAX(seconds)
+            FROM durations
+            GROUP BY {group}
+            ORDER BY {group}
+            """,
+            [start, end],
+        )
+        rows = cursor.fetchall()
+
+    metrics = []
+    for row in rows:
+        if by_assignee:
+            assigned_to_id, row = row[0], row[1:]
+        status, completed, still_open, average, median, p90, longest = row
+        entry = {
+            'status': status,
+            'completed_stays': completed,
+            'open_stays': still_open,
+            'average_seconds': float(average) if average is not None else None,
+            'median_seconds': median,
+            'p90_seconds': p90,
+            'max_seconds': float(longest) if longest is not None else None,
+        }
+        if by_assignee:
+            entry = {'assigned_to': str(assigned_to_id) if assigned_to_id else None, **entry}
+        metrics.append(entry)
+    return metrics
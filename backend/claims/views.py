@@ -1,21 +1,50 @@
 from django.shortcuts import render
 from rest_framework.decorators import api_view,APIView,permission_classes
 from rest_framework.response import Response
-from .models import Claim, ClaimDocument, ClaimNote
+from .models import Claim, ClaimDocument, ClaimNote, ClaimCounter, ClaimDocumentUpload, DocumentBlob, ClaimReview, STATUS_CHOICES, REVIEW_STATUS_CHOICES
 from users.models import User
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
-from .serializers import ClaimSerializer, ClaimNoteSerializer, ClaimDocumentSerializer
+from .serializers import ClaimSerializer, ClaimNoteSerializer, ClaimDocumentSerializer, ClaimDocumentUploadSerializer, ClaimReviewSerializer
+from .uploads import write_chunk, complete_upload, max_document_size, UploadError
+from .renditions import schedule_renditions, ensure_rendition
+from django.core.files.storage import default_storage
+from django.http import FileResponse, StreamingHttpResponse
+from .archives import DocumentArchive, parse_range
+from functools import partial
+from django.conf import settings
 from rest_framework.permissions import IsAuthenticated
 from policies.models import Policy
 from django.shortcuts import get_object_or_404
-from .utils import generate_claim_number, is_valid_uuid4, is_valid_status_transition
+from .utils import generate_claim_number, is_valid_uuid4, is_valid_status_transition, transition_claims, time_in_status, claim_counter_key, track_claim_change, track_claim_deletion, claim_validators
 from rest_framework.request import Request
-from .permissions import ClaimCreationPermission, ClaimPermissions, AssignClaimPermission, CreateClaimNotePermission, CreateClaimDocumentPermission, ClaimNotePermissions, ClaimDocumentPermissions, UpdateClaimStatusPermission
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from datetime import datetime, timedelta
+from mlt_ins.pagination import OptionalKeysetPagination, KeysetPagination, RankedCursorPagination
+from .search import search_claims, search_highlights
+from .events import get_backend, publish_claim_events, note_event, document_event
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, HttpResponseNotAllowed
+from django_tenants.utils import tenant_context
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+import json
+from .assignment import auto_assign, reassign_open_claims, AUTO_ASSIGN_LIMIT
+from .permissions import ClaimCreationPermission, ClaimPermissions, AssignClaimPermission, CreateClaimNotePermission, CreateClaimDocumentPermission, ClaimNotePermissions, ClaimDocumentPermissions, UpdateClaimStatusPermission, ClaimMetricsPermission, ClaimExportPermission, ClaimReviewPermission
+from .intake import screen_claim
+from .ledger import claim_contribution, track_claim_amounts, track_claim_removal, remaining_coverage, CoverageExceeded
+from rest_framework.exceptions import ValidationError
+from mlt_ins.exports import EXPORT_FORMATS, export_response, parse_export_columns
+from mlt_ins.streaming import streaming_content, is_asgi
+from mlt_ins.concurrency import VersionedObjectMixin, StaleVersion, expect_request_version, version_etag, PreconditionFailed
+from mlt_ins.conditional import ConditionalGetMixin, Validators
+from mlt_ins.access import scope_queryset, access_filter
 # Create your views here.
 
 
 
-class ListCreateClaim(ListCreateAPIView):
+class ListCreateClaim(ConditionalGetMixin, ListCreateAPIView):
     """
     List and create claims for a specific policy
     
@@ -31,13 +60,32 @@ class ListCreateClaim(ListCreateAPIView):
         "incident_date": "2024-01-15"
     }
     
+    Query Parameters (GET):
+    - fields: comma separated fields to return, e.g. claim_number,status,claim_amount (optional)
+    - expand: comma separated relations to nest among policy, assigned_to, documents, notes
+      (optional, defaults to policy,assigned_to)
+    
     Response:
     - GET 200: [ClaimSerializer objects]
-    - POST 201: ClaimSerializer object with auto-generated claim_number
+    - POST 201: ClaimSerializer object with auto-generated claim_number, plus
+      "intake_review": [reasons] when the claim was queued for review as a likely duplicate
+      ({"kind": "duplicate", "claim_ids": [...]}) or an outlying amount for its policy type
+      ({"kind": "amount_outlier", "score": "5.12", "median": "...", "mad": "..."})
     - POST 400: {"field_name": ["error message"]}
+
+    Pagination (GET):
+    - default: ?limit=&offset=
+    - keyset: ?pagination=cursor[&page_size=], then follow the returned next/previous links
+      (newest first, ordered on created_at, id)
+
+    Conditional GET:
+    - the response carries an ETag covering the policy's claims and the nested policy;
+      If-None-Match with it answers 304 while none of them changed (not with ?expand=documents/notes)
     """
     serializer_class = ClaimSerializer
     permission_classes = [IsAuthenticated, ClaimCreationPermission]
+    pagination_class = OptionalKeysetPagination
+    keyset_ordering = ('-created_at', '-id')
 
     def get_policy(self):
         policy_id = self.kwargs['policy_id']
@@ -49,19 +97,52 @@ class ListCreateClaim(ListCreateAPIView):
     
     def get_queryset(self):
         policy = self.get_policy()
-        return Claim.objects.filter(policy=policy)
+        claims = scope_queryset(Claim.objects.filter(policy=policy), self.request.user, 'view', 'claim')
+        return ClaimSerializer.setup_eager_loading(claims, self.request, many=True)
+
+    def get_validators(self):
+        _, expand = ClaimSerializer.parse_fieldsets(self.request, many=True)
+        if expand & {'documents', 'notes'}:
+            # nested collections are not covered by the count and latest update of the claims
+            return None
+        policy = (
+            Policy.objects.filter(id=self.kwargs['policy_id'], tenant=self.request.user.tenant)
+            .values_list('version', 'updated_at')
+            .first()
+        )
+        if policy is None:
+            return None
+        claims = (
+            scope_queryset(Claim.objects.filter(policy_id=self.kwargs['policy_id']), self.request.user, 'view', 'claim')
+            .aggregate(count=Count('id'), updated_at=Max('updated_at'))
+        )
+        # a deletion leaves the latest update as it was, so no Last-Modified for a collection
+        return Validators([claims['count'], claims['updated_at'], *policy])
     
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        if self.intake_review:
+            response.data['intake_review'] = self.intake_review
+        return response
+
     def perform_create(self, serializer):
         policy = self.get_policy()
         number = generate_claim_number()
-        serializer.save(
-            policy=policy,
-            tenant=self.request.tenant,
-            claim_number = number
-        )
+        with transaction.atomic():
+            claim = serializer.save(
+                policy=policy,
+                tenant=self.request.tenant,
+                claim_number = number
+            )
+            track_claim_change(claim, changed_by=self.request.user)
+            try:
+                track_claim_amounts(claim)
+            except CoverageExceeded as e:
+                raise ValidationError({'detail':'the claim exceeds the remaining coverage of the policy','remaining_coverage':str(e.remaining)})
+            self.intake_review = screen_claim(claim)
 
 
-class GetEditDeleteClaim(RetrieveUpdateDestroyAPIView):
+class GetEditDeleteClaim(ConditionalGetMixin, VersionedObjectMixin, RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a specific claim
     
@@ -77,11 +158,27 @@ class GetEditDeleteClaim(RetrieveUpdateDestroyAPIView):
         "approved_amount": 6000.00
     }
     
+    Query Parameters (GET):
+    - fields: comma separated fields to return (optional)
+    - expand: comma separated relations to nest among policy, assigned_to, documents, notes
+      (optional, defaults to all of them)
+    
+    Headers (PUT/PATCH):
+    - If-Match: the ETag of the claim, the update only goes through if nobody changed it since
+      (optional unless REQUIRE_IF_MATCH is set)
+    
+    Headers (GET):
+    - If-None-Match: the ETag of a previous GET, answered with 304 while neither the claim nor its
+      policy, notes or documents changed
+
     Response:
-    - GET 200: ClaimSerializer object
-    - PUT/PATCH 200: Updated ClaimSerializer object
+    - GET 200: ClaimSerializer object, ETag header starting with the version of the claim
+    - GET 304: Not modified
+    - PUT/PATCH 200: Updated ClaimSerializer object, ETag header with the new version
     - DELETE 204: No content
     - 404: Claim not found
+    - 412: the claim has been changed since the version in If-Match (or since it was read)
+    - 428: If-Match missing while REQUIRE_IF_MATCH is set
     """
     serializer_class = ClaimSerializer
     queryset = Claim.objects.all()
@@ -90,11 +187,47 @@ class GetEditDeleteClaim(RetrieveUpdateDestroyAPIView):
 
     def get_object(self):
         claim_id = self.kwargs.get('claim_id',None)
-        return get_object_or_404(Claim,pk=claim_id)
+        claims = scope_queryset(Claim.objects.all(), self.request.user, 'view', 'claim')
+        claim = get_object_or_404(ClaimSerializer.setup_eager_loading(claims, self.request),pk=claim_id)
+        self.check_object_permissions(self.request, claim)
+        return claim
+
+    def check_not_modified(self):
+        # get_object without loading the policy, documents and notes a 304 does not send
+        claims = scope_queryset(Claim.objects.only('id', 'status', 'assigned_to_id'), self.request.user, 'view', 'claim')
+        self.check_object_permissions(self.request, get_object_or_404(claims, pk=self.kwargs['claim_id']))
+
+    def get_validators(self):
+        row = claim_validators(self.kwargs['claim_id'])
+        if row is None:
+            return None
+        # the nested assignee is followed by id: a change to their profile alone keeps the ETag
+        return Validators(list(row), version=row[0])
     
     def update(self, request, *args, **kwargs):
         kwargs['partial'] = True
         return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        previous_key = claim_counter_key(serializer.instance)
+        previous_amounts = claim_contribution(serializer.instance)
+        with transaction.atomic():
+            claim = serializer.save()
+            if claim_counter_key(claim) != previous_key:
+                track_claim_change(claim, previous_key, changed_by=self.request.user)
+            try:
+                track_claim_amounts(claim, previous_amounts)
+            except CoverageExceeded as e:
+                raise ValidationError({'detail':'the approved amount exceeds the remaining coverage of the policy','remaining_coverage':str(e.remaining)})
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            track_claim_deletion(instance)
+            track_claim_removal(instance)
+            # the documents go with the claim through the cascade, drop their blob references
+            blob_ids = list(instance.documents.exclude(blob=None).values_list('blob_id', flat=True))
+            instance.delete()
+            DocumentBlob.release(blob_ids)
     
 
 @api_view(['POST'])
@@ -104,26 +237,35 @@ def assign_claim(request:Request,claim_id:int):
     Assign a claim to a specific user
     
     Goal: Assign claim to adjuster, senior adjuster, or manager
-    Path: POST /claims/{claim_id}/assign/?user_id={uuid}
+    Path: POST /claims/{claim_id}/assign/?user_id={uuid|auto}
     Authentication: JWT required, AssignClaimPermission
     
     Query Parameters:
-    - user_id: UUID4 of the user to assign claim to
+    - user_id: UUID4 of the user to assign claim to, or "auto" to pick the least loaded adjuster
     
     Response:
     - 200: Updated ClaimSerializer object with assigned_to field
-    - 400: {"error": "no user was provided"} or {"error": "please provide a valid uuid4 user_id"}
+    - 400: {"error": "no user was provided"}, {"error": "please provide a valid uuid4 user_id"} or
+      {"error": "no adjuster is available for this claim"}
     - 404: Claim or User not found
     """
     claim = get_object_or_404(Claim,pk=claim_id)
     user_id = request.GET.get('user_id',None)
     if not user_id:
         return Response({'error':'no user was provided'},status=400)
+    if user_id == 'auto':
+        if not auto_assign([claim.id], changed_by=request.user):
+            return Response({'error':'no adjuster is available for this claim'},status=400)
+        claim.refresh_from_db()
+        return Response(ClaimSerializer(claim).data)
     if not is_valid_uuid4(user_id):
         return Response({'error':'please provide a valid uuid4 user_id'},status=400)
     user = get_object_or_404(User,pk=user_id)
+    previous_key = claim_counter_key(claim)
     claim.assigned_to = user
-    claim.save()
+    with transaction.atomic():
+        claim.save()
+        track_claim_change(claim, previous_key, changed_by=request.user)
     return Response(ClaimSerializer(claim).data)
 
 
@@ -148,10 +290,11 @@ def add_note(request:Request,claim_id:int):
     - 400: Validation errors
     - 404: Claim not found
     """
-    claim = get_object_or_404(Claim,pk=claim_id)
+    claim = get_object_or_404(scope_queryset(Claim.objects.all(), request.user, 'view', 'claim'),pk=claim_id)
     note_ser = ClaimNoteSerializer(data=request.data)
     if note_ser.is_valid():
         note = note_ser.save(author=request.user, claim=claim)
+        publish_claim_events([note_event(note)])
         return Response(ClaimNoteSerializer(note).data,201)
     return Response(note_ser.errors,400)
 
@@ -170,27 +313,40 @@ class NoteDetails(APIView):
         "is_internal": false
     }
     
+    Headers (PUT):
+    - If-Match: the ETag of the note, the update only goes through if nobody changed it since
+      (optional unless REQUIRE_IF_MATCH is set)
+    
     Response:
-    - GET 200: ClaimNoteSerializer object
-    - PUT 201: Updated ClaimNoteSerializer object
+    - GET 200: ClaimNoteSerializer object, ETag header with the version of the note
+    - PUT 201: Updated ClaimNoteSerializer object, ETag header with the new version
     - DELETE 200: {"detail": "the note has been deleted successfully"}
     - 404: Note not found
+    - 412: the note has been changed since the version in If-Match (or since it was read)
+    - 428: If-Match missing while REQUIRE_IF_MATCH is set
     """
     permission_classes = [IsAuthenticated, ClaimNotePermissions]
 
     def fetch_note(self,note_id:int):
-        return get_object_or_404(ClaimNote,pk=note_id)
+        notes = scope_queryset(ClaimNote.objects.all(), self.request.user, 'view', 'note')
+        note = get_object_or_404(notes,pk=note_id)
+        self.check_object_permissions(self.request, note)
+        return note
     
     def get(self,request,note_id:int):
         note = self.fetch_note(note_id)
-        return Response(ClaimNoteSerializer(note).data,200)
+        return Response(ClaimNoteSerializer(note).data,200,headers={'ETag':version_etag(note)})
 
     def put(self,request,note_id:int):
         note = self.fetch_note(note_id)
+        expect_request_version(request, note)
         note_ser = ClaimNoteSerializer(note, data=request.data, partial = True)
         if note_ser.is_valid():
-            note = note_ser.save()
-            return Response(ClaimNoteSerializer(note).data,201)
+            try:
+                note = note_ser.save()
+            except StaleVersion:
+                raise PreconditionFailed()
+            return Response(ClaimNoteSerializer(note).data,201,headers={'ETag':version_etag(note)})
         return Response(note_ser.errors,400)
     
     def delete(self,request,note_id:int):
@@ -222,14 +378,139 @@ def add_document(request:Request,claim_id:int):
     - 400: Validation errors
     - 404: Claim not found
     """
-    claim = get_object_or_404(Claim,pk=claim_id)
+    claim = get_object_or_404(scope_queryset(Claim.objects.all(), request.user, 'view', 'claim'),pk=claim_id)
     note_ser = ClaimDocumentSerializer(data=request.data)
     if note_ser.is_valid():
         note = note_ser.save(uploaded_by=request.user, claim=claim)
+        transaction.on_commit(partial(schedule_renditions, note))
+        publish_claim_events([document_event(note)])
         return Response(ClaimDocumentSerializer(note).data,201)
     return Response(note_ser.errors,400)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, CreateClaimDocumentPermission])
+def start_document_upload(request:Request,claim_id:int):
+    """
+    Start a chunked, resumable document upload
+    
+    Goal: Announce a document so it can be sent in chunks (large files, flaky connections)
+    Path: POST /claims/{claim_id}/uploads/
+    Authentication: JWT required, CreateClaimDocumentPermission
+    
+    Request Body:
+    {
+        "document_type": "photo|police_report|estimate|medical_bill|invoice|other",
+        "description": "Optional description",
+        "filename": "report.pdf",
+        "size": 73400320,
+        "sha256": "optional hex digest checked on completion"
+    }
+    
+    Then send the bytes with PUT /uploads/{upload_id}/ and finish with POST /uploads/{upload_id}/complete/
+    
+    Response:
+    - 201: ClaimDocumentUploadSerializer object + "chunk_size" (suggested chunk size in bytes)
+    - 400: Validation errors
+    - 404: Claim not found
+    - 413: {"error": "documents are limited to N bytes on your plan"}
+    """
+    claim = get_object_or_404(scope_queryset(Claim.objects.all(), request.user, 'view', 'claim'),pk=claim_id)
+    upload_ser = ClaimDocumentUploadSerializer(data=request.data)
+    if not upload_ser.is_valid():
+        return Response(upload_ser.errors,400)
+    limit = max_document_size(request.tenant)
+    if upload_ser.validated_data['size'] > limit:
+        return Response({'error':f'documents are limited to {limit} bytes on your plan'},413)
+    upload = upload_ser.save(claim=claim, uploaded_by=request.user)
+    return Response({**ClaimDocumentUploadSerializer(upload).data, 'chunk_size': settings.CLAIM_UPLOAD_CHUNK_SIZE},201)
+
+
+class DocumentUploadDetails(APIView):
+    """
+    Send the chunks of a document upload, check its progress or cancel it
+    
+    Goal: Stream one chunk straight to storage, resume after a failure from the stored offset
+    Path: GET/PUT/DELETE /uploads/{upload_id}/
+    Authentication: JWT required, only the user who started the upload
+    
+    PUT headers:
+    - Upload-Offset: offset of the chunk in the document, must equal the current offset
+    - Content-Length: size of the chunk
+    PUT body: the raw bytes of the chunk (application/octet-stream)
+    
+    Response:
+    - GET 200: ClaimDocumentUploadSerializer object, "received" is the offset to resume from
+    - PUT 200: {"received": new offset, "size": total size}, also sent as the Upload-Offset header
+    - PUT 400: {"error": "..."} missing headers, empty or truncated chunk
+    - PUT 409: {"error": "expected offset N"}, the client should resume from N
+    - PUT 413: {"error": "the chunk goes past the announced size of the document"}
+    A PUT holds the upload for as long as its chunk is written, a concurrent PUT waits for it
+    and is answered from the offset it left.
+    - DELETE 200: {"detail": "the upload has been cancelled"}
+    - 404: Upload not found
+    """
+    permission_classes = [IsAuthenticated, CreateClaimDocumentPermission]
+
+    def fetch_upload(self,request,upload_id):
+        return get_object_or_404(ClaimDocumentUpload,pk=upload_id,uploaded_by=request.user)
+
+    def get(self,request,upload_id):
+        upload = self.fetch_upload(request,upload_id)
+        return Response(ClaimDocumentUploadSerializer(upload).data,200,headers={'Upload-Offset': str(upload.received)})
+
+    def put(self,request,upload_id):
+        upload = self.fetch_upload(request,upload_id)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({'error':'Upload-Offset and Content-Length headers are required'},400)
+
+        # everything is checked against the headers before a single byte of the body is read
+        try:
+            received = write_chunk(upload, offset, length, request.stream)
+        except UploadError as e:
+            return Response({'error':e.detail},e.status,headers={'Upload-Offset': str(upload.received)})
+        return Response({'received': received, 'size': upload.size},200,headers={'Upload-Offset': str(received)})
+
+    def delete(self,request,upload_id):
+        upload = self.fetch_upload(request,upload_id)
+        upload.delete()
+        return Response({'detail':'the upload has been cancelled'},200)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, CreateClaimDocumentPermission])
+def complete_document_upload(request:Request,upload_id:str):
+    """
+    Finish a chunked upload
+    
+    Goal: Check the upload is complete (and matches its sha256) and attach it to the claim
+    Path: POST /uploads/{upload_id}/complete/
+    Authentication: JWT required, only the user who started the upload
+    
+    Response:
+    - 201: Created ClaimDocumentSerializer object
+    - 400: {"error": "the uploaded content does not match the announced sha256, start a new upload"}
+    - 404: Upload not found
+    - 409: {"error": "N bytes are still missing"}
+    """
+    with transaction.atomic():
+        upload = get_object_or_404(
+            ClaimDocumentUpload.objects.select_for_update().select_related('claim'),
+            pk=upload_id,
+            uploaded_by=request.user,
+        )
+        try:
+            document = complete_upload(upload)
+        except UploadError as e:
+            return Response({'error':e.detail},e.status)
+        transaction.on_commit(partial(schedule_renditions, document))
+        publish_claim_events([document_event(document)])
+    return Response(ClaimDocumentSerializer(document).data,201)
+
+
 class documentDetails(APIView):
     """
     Retrieve, update or delete a specific claim document
@@ -253,7 +534,10 @@ class documentDetails(APIView):
     permission_classes = [IsAuthenticated, ClaimDocumentPermissions]
 
     def fetch_document(self,document_id:int):
-        return get_object_or_404(ClaimDocument,pk=document_id)
+        documents = scope_queryset(ClaimDocument.objects.all(), self.request.user, 'view', 'document')
+        document = get_object_or_404(documents,pk=document_id)
+        self.check_object_permissions(self.request, document)
+        return document
     
     def get(self,request,document_id:int):
         document = self.fetch_document(document_id)
@@ -264,6 +548,8 @@ class documentDetails(APIView):
         document_ser = ClaimDocumentSerializer(document, data=request.data, partial = True)
         if document_ser.is_valid():
             document = document_ser.save()
+            if 'file' in request.data:
+                transaction.on_commit(partial(schedule_renditions, document))
             return Response(ClaimDocumentSerializer(document).data,201)
         return Response(document_ser.errors,400)
     
@@ -272,6 +558,283 @@ class documentDetails(APIView):
         document.delete()
         return Response({'detail':'the hote has been deleted successfully'},200)
     
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, ClaimDocumentPermissions])
+def document_rendition(request:Request,document_id:int,kind:str):
+    """
+    Thumbnail or preview of a claim document
+    
+    Goal: Serve a small rendition instead of the full resolution file
+    Path: GET /documents/{document_id}/renditions/{kind}/
+    Authentication: JWT required, ClaimDocumentPermissions
+    
+    Path Parameters:
+    - kind: thumbnail|web for images, preview|thumbnail for PDFs (first page)
+    
+    Renditions are made in the background after upload; a missing one is queued and the request
+    answers 202 right away, the client asks again after Retry-After.
+    
+    Response:
+    - 200: image/jpeg
+    - 202: The rendition is being made
+    - 404: Document not found or no such rendition for this document
+    """
+    document = get_object_or_404(scope_queryset(ClaimDocument.objects.all(), request.user, 'view', 'document'),pk=document_id)
+    rendition = ensure_rendition(document, kind)
+    if rendition is None:
+        return Response({'detail':'this document has no such rendition'},404)
+    name, ready = rendition
+    if not ready:
+        return Response({'detail':'the rendition is being made, try again shortly'},202,headers={'Retry-After':'2'})
+    response = FileResponse(default_storage.open(name,'rb'), content_type='image/jpeg')
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+@api_view(['GET','HEAD'])
+@permission_classes([IsAuthenticated, ClaimDocumentPermissions])
+def claim_documents_archive(request:Request,claim_id:int):
+    """
+    Download every document of a claim as one ZIP archive
+    
+    Goal: Replace downloading the documents of a claim one by one
+    Path: GET /claims/{claim_id}/documents.zip
+    Authentication: JWT required, ClaimDocumentPermissions
+    
+    The archive is streamed as it is built from the stored files: nothing is buffered or written
+    to a temp file, under WSGI and ASGI alike. Its size is known up front, so it supports `Range: bytes=start-end` (with
+    `If-Range` on the ETag) to resume an interrupted download.
+    
+    Response:
+    - 200: application/zip, the whole archive
+    - 206: application/zip, the requested range
+    - 404: Claim not found
+    - 416: Range not satisfiable
+    """
+    claim = get_object_or_404(scope_queryset(Claim.objects.all(), request.user, 'view', 'claim'),pk=claim_id)
+    documents = (
+        ClaimDocument.objects.filter(claim=claim)
+        .select_related('blob')
+        .only('id','document_type','file','uploaded_at','blob__size','blob__crc32')
+        .order_by('id')
+    )
+    archive = DocumentArchive(documents)
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or if_range == archive.etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), archive.size)
+        except ValueError:
+            response = Response({'detail':'range not satisfiable'},416)
+            response['Content-Range'] = f'bytes */{archive.size}'
+            return response
+
+    start, end = byte_range or (0, archive.size)
+    stream = streaming_content(request, archive.iter_bytes(start, end) if request.method == 'GET' else iter(()))
+    response = StreamingHttpResponse(stream, status=206 if byte_range else 200, content_type='application/zip')
+    response['Content-Length'] = str(end - start)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end - 1}/{archive.size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = archive.etag
+    response['Content-Disposition'] = f'attachment; filename="{claim.claim_number}-documents.zip"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, ClaimPermissions])
+def search_claims_view(request:Request):
+    """
+    Full-text search of the claims
+    
+    Goal: Find a claim from what it is about instead of scrolling through policies
+    Path: GET /claims/search/?q=flooded basement
+    Authentication: JWT required, ClaimPermissions
+    
+    Query Parameters:
+    - q: words to look for in the claim title and description, its notes and its document
+      descriptions. "quoted phrases", `or` and -excluded words are supported
+    - page_size: results per page (default 25, at most 100)
+    - cursor: the `next` link of the previous page
+    
+    Response:
+    - 200: {"next": url|null, "previous": null, "results": [{"rank": 0.6, "claim": ClaimSerializer object,
+      "highlights": {"title": "...<mark>flooded</mark>...", "note": {"id": 3, "snippet": "..."}}}]}
+      best match first, highlights are HTML escaped
+    - 400: q missing
+    """
+    text = request.query_params.get('q','').strip()
+    if not text:
+        return Response({'error':'q is required'},400)
+
+    # restricted roles only search the claims they can see
+    visible = None
+    if access_filter(request.user, 'view', 'claim') is not None:
+        visible = scope_queryset(Claim.objects.all(), request.user, 'view', 'claim')
+    paginator = RankedCursorPagination()
+    rows = paginator.paginate_ranked(
+        lambda after, limit: search_claims(text, after=after, limit=limit, claims=visible),
+        request,
+    )
+    claim_ids = [claim_id for _, claim_id in rows]
+    queryset = ClaimSerializer.setup_eager_loading(Claim.objects.filter(id__in=claim_ids), request, many=True)
+    claims = {claim.id: claim for claim in queryset}
+    highlights = search_highlights(text, claim_ids)
+
+    # a claim deleted between the two queries is left out
+    rows = [(rank, claim_id) for rank, claim_id in rows if claim_id in claims]
+    data = ClaimSerializer([claims[claim_id] for _, claim_id in rows], many=True, context={'request':request}).data
+    results = [
+        {'rank': rank, 'claim': claim, 'highlights': highlights[claim_id]}
+        for (rank, claim_id), claim in zip(rows, data)
+    ]
+    return paginator.get_paginated_response(results)
+
+
+# columns of claims/export, {name: lookup}
+CLAIM_EXPORT_COLUMNS = {
+    'id': 'id',
+    'claim_number': 'claim_number',
+    'status': 'status',
+    'policy': 'policy_id',
+    'policy_number': 'policy__policy_number',
+    'policy_type': 'policy__policy_type',
+    'title': 'title',
+    'description': 'description',
+    'claim_amount': 'claim_amount',
+    'approved_amount': 'approved_amount',
+    'assigned_to': 'assigned_to_id',
+    'incident_date': 'incident_date',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, ClaimExportPermission])
+def export_claims(request:Request):
+    """
+    Export the claims as CSV or NDJSON
+    
+    Goal: Full claim extracts for finance without paging through the JSON API
+    Path: GET /claims/export/?export_format=csv|ndjson
+    Authentication: JWT required, ClaimExportPermission (admin, manager)
+    
+    Query Parameters:
+    - export_format: csv (default) or ndjson
+    - fields: comma separated columns, among id, claim_number, status, policy, policy_number, policy_type,
+      title, description, claim_amount, approved_amount, assigned_to, incident_date, created_at, updated_at
+    - policy: only the claims of this policy, as /policy/{policy_id}/claims/
+    - status: comma separated statuses
+    - assigned_to: user id
+    - created_after, created_before: YYYY-MM-DD, inclusive
+    
+    The rows are streamed from a server-side cursor as they are read, in id order.
+    
+    Response:
+    - 200: text/csv or application/x-ndjson attachment
+    - 400: unknown format, field, status or malformed filter
+    """
+    export_format = request.query_params.get('export_format','csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response({'error':f'export_format must be one of {", ".join(EXPORT_FORMATS)}'},400)
+    try:
+        columns = parse_export_columns(request, CLAIM_EXPORT_COLUMNS)
+    except ValueError as e:
+        return Response({'error':str(e)},400)
+
+    claims = scope_queryset(Claim.objects.all(), request.user, 'export', 'claim')
+    params = request.query_params
+    if params.get('policy'):
+        if not params['policy'].isdigit():
+            return Response({'error':'policy must be a policy id'},400)
+        claims = claims.filter(policy_id=int(params['policy']))
+    if params.get('status'):
+        statuses = [status.strip() for status in params['status'].split(',')]
+        unknown = set(statuses) - {choice for choice, _ in STATUS_CHOICES}
+        if unknown:
+            return Response({'error':f'unknown status: {", ".join(sorted(unknown))}'},400)
+        claims = claims.filter(status__in=statuses)
+    if params.get('assigned_to'):
+        if not is_valid_uuid4(params['assigned_to']):
+            return Response({'error':'assigned_to must be a user id'},400)
+        claims = claims.filter(assigned_to_id=params['assigned_to'])
+    try:
+        if params.get('created_after'):
+            claims = claims.filter(created_at__date__gte=datetime.strptime(params['created_after'],'%Y-%m-%d').date())
+        if params.get('created_before'):
+            claims = claims.filter(created_at__date__lte=datetime.strptime(params['created_before'],'%Y-%m-%d').date())
+    except ValueError:
+        return Response({'error':'created_after and created_before must be YYYY-MM-DD'},400)
+
+    filename = f'claims-{timezone.now():%Y%m%d-%H%M%S}'
+    return export_response(request, claims.order_by('id'), columns, export_format, filename)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, ClaimReviewPermission])
+def claim_review_queue(request:Request):
+    """
+    Claims flagged at intake, waiting for review
+    
+    Goal: Let managers look at likely duplicates and outlying amounts before they are worked on
+    Path: GET /claims/reviews/
+    Authentication: JWT required, ClaimReviewPermission (admin, manager, senior_adjuster)
+    
+    Query Parameters:
+    - status: pending (default), cleared, confirmed
+    - page_size: reviews per page (optional)
+    - cursor: the `next`/`previous` link of another page
+    
+    Response:
+    - 200: {"next": url, "previous": url, "results": [ClaimReviewSerializer objects]}, oldest first
+    - 400: invalid status
+    """
+    status = request.query_params.get('status','pending')
+    if status not in dict(REVIEW_STATUS_CHOICES):
+        return Response({'error':'status must be pending, cleared or confirmed'},400)
+    reviews = ClaimReview.objects.filter(status=status).select_related('claim')
+    paginator = KeysetPagination()
+    paginator.ordering = ('created_at','id')
+    page = paginator.paginate_queryset(reviews, request)
+    return paginator.get_paginated_response(ClaimReviewSerializer(page,many=True).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, ClaimReviewPermission])
+def resolve_claim_review(request:Request,review_id:int):
+    """
+    Close the review of a flagged claim
+    
+    Goal: Record the decision on a claim flagged at intake
+    Path: POST /claims/reviews/{review_id}/resolve/
+    Authentication: JWT required, ClaimReviewPermission
+    
+    Request Body:
+    {
+        "status": "cleared|confirmed"
+    }
+    
+    Response:
+    - 200: ClaimReviewSerializer object
+    - 400: invalid status
+    - 404: Review not found
+    - 409: The review was already resolved
+    """
+    status = request.data.get('status')
+    if status not in ('cleared','confirmed'):
+        return Response({'error':'status must be cleared or confirmed'},400)
+    review = get_object_or_404(ClaimReview,pk=review_id)
+    resolved = ClaimReview.objects.filter(pk=review_id, status='pending').update(
+        status=status, reviewed_by=request.user, reviewed_at=timezone.now(),
+    )
+    review.refresh_from_db()
+    if not resolved:
+        return Response({'error':f'the review is already {review.status}'},409)
+    return Response(ClaimReviewSerializer(review).data,200)
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated, UpdateClaimStatusPermission])
 def update_claim_status(request:Request,claim_id:int):
@@ -291,9 +854,12 @@ def update_claim_status(request:Request,claim_id:int):
     - 200: Updated ClaimSerializer object with new status
     - 400: {"detail": "no status query parameter has been provided"} or 
       {"detail": "the transition to the new status you have provided is not approved"}
+    - 400 (approved): {"detail": "approving this claim would exceed the remaining coverage of its policy",
+      "remaining_coverage": "1200.00"}
     - 404: Claim not found
+    - 409: {"detail": "the claim status has been changed by someone else, please reload the claim"}
     """
-    claim = get_object_or_404(Claim,pk=claim_id)
+    claim = get_object_or_404(scope_queryset(Claim.objects.all(), request.user, 'change_status', 'claim'),pk=claim_id)
     new_status = request.GET.get('new_status',None)
     if not new_status:
         return Response({'detail':'no status query parameter has been provided'},400)
@@ -301,9 +867,318 @@ def update_claim_status(request:Request,claim_id:int):
     if not is_valid_status_transition(claim.status, new_status):
         return Response({'detail':'the transition to the new status you have provided is not approved'},400)
     
-    #update the status
-    claim.status = new_status
-    claim.save()
+    #update the status only if it is still one the transition is allowed from
+    if not transition_claims([claim.id], new_status, changed_by=request.user):
+        if new_status == 'approved' and Claim.objects.filter(pk=claim.pk, status=claim.status).exists():
+            return Response({
+                'detail':'approving this claim would exceed the remaining coverage of its policy',
+                'remaining_coverage':str(remaining_coverage(claim.policy_id)),
+            },400)
+        return Response({'detail':'the claim status has been changed by someone else, please reload the claim'},409)
+    claim.refresh_from_db()
     return Response(ClaimSerializer(claim).data,200)
 
 
+BULK_TRANSITION_LIMIT = 10000
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, UpdateClaimStatusPermission])
+def bulk_update_claim_status(request:Request):
+    """
+    Move many claims to a new status at once
+    
+    Goal: Apply one status transition to a batch of claims in a single statement
+    Path: POST /claims/bulk-update-status/
+    Authentication: JWT required, UpdateClaimStatusPermission
+    
+    Request Body:
+    {
+        "claim_ids": [1, 2, 3],
+        "new_status": "payment_processing"
+    }
+    
+    Only claims whose current status allows the transition are moved, the others are left untouched.
+    An approval also leaves out the claims that would take their policy past its coverage
+    (rejected with "reason": "coverage"). Adjusters only move the claims assigned to them, the
+    others are reported as not found.
+    
+    Response:
+    - 200: {"new_status": "payment_processing", "moved": [1, 2],
+            "rejected": [{"id": 3, "status": "paid"}], "not_found": [4]}
+    - 400: {"detail": "claim_ids must be a non empty list of claim ids"},
+      {"detail": "at most 10000 claims can be updated at once"} or
+      {"detail": "the status you have provided is not valid"}
+    """
+    claim_ids = request.data.get('claim_ids',None)
+    new_status = request.data.get('new_status',None)
+    if not isinstance(claim_ids, list) or not claim_ids:
+        return Response({'detail':'claim_ids must be a non empty list of claim ids'},400)
+    try:
+        claim_ids = list(dict.fromkeys(int(claim_id) for claim_id in claim_ids))
+    except (TypeError, ValueError):
+        return Response({'detail':'claim_ids must be a non empty list of claim ids'},400)
+    if len(claim_ids) > BULK_TRANSITION_LIMIT:
+        return Response({'detail':f'at most {BULK_TRANSITION_LIMIT} claims can be updated at once'},400)
+    if new_status not in dict(STATUS_CHOICES):
+        return Response({'detail':'the status you have provided is not valid'},400)
+
+    # claims outside the user's scope are reported as not found
+    requested = claim_ids
+    claims = scope_queryset(Claim.objects.all(), request.user, 'change_status', 'claim')
+    if access_filter(request.user, 'change_status', 'claim') is not None:
+        claim_ids = list(claims.filter(pk__in=claim_ids).values_list('id', flat=True))
+
+    moved = [claim_id for claim_id, _ in transition_claims(claim_ids, new_status, changed_by=request.user)]
+    moved_set = set(moved)
+    rejected = list(
+        claims.filter(pk__in=[claim_id for claim_id in claim_ids if claim_id not in moved_set])
+        .order_by('id').values('id','status')
+    )
+    if new_status == 'approved':
+        for claim in rejected:
+            if is_valid_status_transition(claim['status'], new_status):
+                claim['reason'] = 'coverage'
+    found = moved_set | {claim['id'] for claim in rejected}
+    return Response({
+        'new_status': new_status,
+        'moved': sorted(moved),
+        'rejected': rejected,
+        'not_found': [claim_id for claim_id in requested if claim_id not in found],
+    },200)
+
+
+def parse_metrics_window(request:Request):
+    """read the ?from=&to= (YYYY-MM-DD) window of the metrics endpoints, defaults to the last 90 days"""
+    today = timezone.now().date()
+    start = request.GET.get('from',None)
+    end = request.GET.get('to',None)
+    start = datetime.strptime(start, "%Y-%m-%d").date() if start else today - timedelta(days=90)
+    end = datetime.strptime(end, "%Y-%m-%d").date() if end else today + timedelta(days=1)
+    return start, end
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, ClaimMetricsPermission])
+def status_metrics(request:Request):
+    """
+    Time spent by claims in each status
+    
+    Goal: Distribution of the time claims of the tenant spend in each status
+    Path: GET /claims/status-metrics/?from={date}&to={date}
+    Authentication: JWT required, ClaimMetricsPermission
+    
+    Query Parameters:
+    - from, to: YYYY-MM-DD window the stays started in (optional, defaults to the last 90 days)
+    
+    Response:
+    - 200: {"from": date, "to": date, "statuses": [{"status": "investigation", "completed_stays": 12,
+            "open_stays": 3, "average_seconds": 5400.0, "median_seconds": 3600.0,
+            "p90_seconds": 9000.0, "max_seconds": 12000.0}]}
+    - 400: {"error": "dates must be in YYYY-MM-DD format"}
+    """
+    try:
+        start, end = parse_metrics_window(request)
+    except ValueError:
+        return Response({'error': 'dates must be in YYYY-MM-DD format'}, status=400)
+    return Response({'from': start, 'to': end, 'statuses': time_in_status(start, end)},200)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, ClaimMetricsPermission])
+def adjuster_status_metrics(request:Request):
+    """
+    Time spent by claims in each status per assignee
+    
+    Goal: Same distribution as status-metrics, broken down by the user the claim was assigned to
+    Path: GET /claims/status-metrics/adjusters/?from={date}&to={date}
+    Authentication: JWT required, ClaimMetricsPermission
+    
+    Query Parameters:
+    - from, to: YYYY-MM-DD window the stays started in (optional, defaults to the last 90 days)
+    
+    Response:
+    - 200: {"from": date, "to": date, "statuses": [{"assigned_to": uuid|null, "status": ..., ...}]}
+    - 400: {"error": "dates must be in YYYY-MM-DD format"}
+    """
+    try:
+        start, end = parse_metrics_window(request)
+    except ValueError:
+        return Response({'error': 'dates must be in YYYY-MM-DD format'}, status=400)
+    return Response({'from': start, 'to': end, 'statuses': time_in_status(start, end, by_assignee=True)},200)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, ClaimMetricsPermission])
+def claims_summary(request:Request):
+    """
+    Claim counts for dashboards
+    
+    Goal: Number of claims per status, assignee and policy type, read from the maintained counters
+    Path: GET /claims/summary/
+    Authentication: JWT required, ClaimMetricsPermission
+    
+    Response:
+    - 200: {"total": 120, "by_status": {"reported": 10, ...}, "by_assignee": {"<uuid>|unassigned": 4, ...},
+            "by_policy_type": {"auto": 80, ...},
+            "counters": [{"status": ..., "assigned_to": uuid|null, "policy_type": ..., "count": 3}]}
+    """
+    counters = ClaimCounter.objects.filter(count__gt=0).values_list('status','assigned_to_id','policy_type','count')
+    by_status, by_assignee, by_policy_type, rows = {}, {}, {}, []
+    for status, assigned_to_id, policy_type, count in counters:
+        assignee = str(assigned_to_id) if assigned_to_id else None
+        by_status[status] = by_status.get(status, 0) + count
+        by_assignee[assignee or 'unassigned'] = by_assignee.get(assignee or 'unassigned', 0) + count
+        by_policy_type[policy_type] = by_policy_type.get(policy_type, 0) + count
+        rows.append({'status': status, 'assigned_to': assignee, 'policy_type': policy_type, 'count': count})
+    return Response({
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'by_assignee': by_assignee,
+        'by_policy_type': by_policy_type,
+        'counters': rows,
+    },200)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, AssignClaimPermission])
+def auto_assign_claims(request:Request):
+    """
+    Assign a batch of claims to the least loaded adjusters
+    
+    Goal: Balance claims over active adjusters and senior adjusters, weighting open claims by amount
+    Path: POST /claims/auto-assign/
+    Authentication: JWT required, AssignClaimPermission
+    
+    Request Body (optional):
+    {
+        "claim_ids": [1, 2, 3],
+        "limit": 500
+    }
+    Without claim_ids the oldest unassigned reported claims are assigned, up to limit (max 5000).
+    
+    Response:
+    - 200: {"assigned": [{"claim_id": 1, "user_id": uuid}], "count": 1}
+    - 400: {"detail": "claim_ids must be a list of claim ids"} or {"detail": "limit must be a positive integer"}
+    """
+    claim_ids = request.data.get('claim_ids',None)
+    if claim_ids is not None:
+        try:
+            claim_ids = [int(claim_id) for claim_id in claim_ids]
+        except (TypeError, ValueError):
+            return Response({'detail':'claim_ids must be a list of claim ids'},400)
+    try:
+        limit = min(int(request.data.get('limit',AUTO_ASSIGN_LIMIT)), AUTO_ASSIGN_LIMIT)
+    except (TypeError, ValueError):
+        limit = 0
+    if limit <= 0:
+        return Response({'detail':'limit must be a positive integer'},400)
+
+    plan = auto_assign(claim_ids, limit=limit, changed_by=request.user)
+    return Response({
+        'assigned': [{'claim_id': claim_id, 'user_id': user_id} for claim_id, user_id in plan.items()],
+        'count': len(plan),
+    },200)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, AssignClaimPermission])
+def reassign_user_claims(request:Request,user_id:str):
+    """
+    Hand the open claims of a user over to the other adjusters
+    
+    Goal: Redistribute everything a leaving user owns, balanced by workload
+    Path: POST /claims/reassign-from/{user_id}/
+    Authentication: JWT required, AssignClaimPermission
+    
+    Response:
+    - 200: {"assigned": [{"claim_id": 1, "user_id": uuid}], "count": 1}
+    - 400: {"error": "please provide a valid uuid4 user_id"}
+    - 404: User not found
+    """
+    if not is_valid_uuid4(user_id):
+        return Response({'error':'please provide a valid uuid4 user_id'},status=400)
+    user = get_object_or_404(User,pk=user_id)
+    plan = reassign_open_claims(user.id, changed_by=request.user)
+    return Response({
+        'assigned': [{'claim_id': claim_id, 'user_id': assignee_id} for claim_id, assignee_id in plan.items()],
+        'count': len(plan),
+    },200)
+
+
+def authenticate_event_stream(request):
+    """the user of the JWT access token of the request, None if it has none or an invalid one"""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        # EventSource cannot set headers, browsers pass the token in the query string
+        raw_token = request.GET.get('token','').encode() or None
+    if raw_token is None:
+        return None
+    try:
+        with tenant_context(request.tenant):
+            return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def claim_events(request):
+    """
+    Live events of the tenant's claims (Server-Sent Events)
+    
+    Goal: Push claim changes to the UIs instead of having them poll claim details
+    Path: GET /claims/events/
+    Authentication: JWT required, as a Bearer header or ?token= (EventSource cannot send headers)
+    
+    Query Parameters:
+    - claim: only send the events of this claim (claim detail pages)
+    
+    Served as text/event-stream, one SSE event per change, named after its type:
+    - claim_created, status_changed, claim_assigned: {"claim_id", "status", "previous_status", "assigned_to", "changed_by", "at"}
+    - note_added: {"claim_id", "assigned_to", "note_id", "author", "is_internal", "at"}
+    - document_added: {"claim_id", "assigned_to", "document_id", "document_type", "uploaded_by", "at"}
+    - resync: the client fell behind and events were dropped, reload what is displayed
+    A user only receives the events of the claims they may view (adjusters: the claims assigned to them).
+    A comment is sent every CLAIM_EVENTS_HEARTBEAT seconds to keep proxies from closing the connection.
+    The stream holds a connection open: it needs the ASGI entry point (mlt_ins/asgi.py).
+    
+    Response:
+    - 200: text/event-stream
+    - 400: claim is not an integer
+    - 401: missing or invalid token
+    - 501: served through WSGI, which would buffer the endless stream instead of sending it
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not is_asgi(request):
+        return JsonResponse({'error':'live events need the ASGI server, run uvicorn mlt_ins.asgi:application'},status=501)
+    user = await sync_to_async(authenticate_event_stream)(request)
+    if user is None or not user.is_active:
+        return JsonResponse({'detail':'Authentication credentials were not provided or are invalid'},status=401)
+    claim_id = request.GET.get('claim')
+    if claim_id is not None:
+        if not claim_id.isdigit():
+            return JsonResponse({'error':'claim must be a claim id'},status=400)
+        claim_id = int(claim_id)
+    channel = request.tenant.schema_name
+    # adjusters only hear of the claims assigned to them, the others of every claim
+    restricted = access_filter(user, 'view', 'claim') is not None
+
+    async def stream():
+        subscription = get_backend().subscribe(channel, claim_id, user if restricted else None)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = await subscription.get(timeout=settings.CLAIM_EVENTS_HEARTBEAT)
+                if event is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,261 @@
+"""
+Role based access control: one declarative matrix of role x action x resource.
+
+PERMISSION_MATRIX gives, for each action on each resource, the roles allowed and, per role, the
+objects they are allowed on: ANY, or a rule on the object such as OwnedBy('author') (adjusters
+edit only their own notes). The matrix is compiled once at import:
+
+- the roles allowed on every object and the roles allowed on some objects become two bitsets,
+  so a role check is a bitwise AND and an object check only evaluates a rule for restricted roles
+- every rule also compiles to a Q, so list views filter their queryset in SQL (scope_queryset)
+  instead of fetching rows and checking them one at a time
+
+The DRF permission classes of the apps (claims/permissions.py, policies/permissions.py) are
+MatrixPermission subclasses naming their resource and, when not derived from the HTTP method,
+their action. `python manage.py benchmark_permissions` measures what the checks cost a request.
+"""
+from collections import namedtuple
+
+from django.db.models import Q
+from rest_framework.permissions import BasePermission
+
+from users.models import User
+
+
+class Rule:
+    """a condition on an object, both as a python test and as a queryset filter"""
+
+    def test(self, obj, user):
+        raise NotImplementedError
+
+    def q(self, user):
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+def _follow(obj, path):
+    """the value at `path` ('claim__assigned_to') of `obj`, foreign keys read as their id without a query"""
+    *relations, name = path.split('__')
+    for relation in relations:
+        obj = getattr(obj, relation)
+    field = obj._meta.get_field(name)
+    return getattr(obj, field.attname)
+
+
+class Anything(Rule):
+    def test(self, obj, user):
+        return True
+
+    def q(self, user):
+        return Q()
+
+
+class OwnedBy(Rule):
+    """the user at `path` (a foreign key to User) is the one acting"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def test(self, obj, user):
+        return _follow(obj, self.path) == user.pk
+
+    def q(self, user):
+        return Q(**{self.path: user.pk})
+
+
+class FieldIn(Rule):
+    def __init__(self, path, values):
+        self.path = path
+        self.values = frozenset(values)
+
+    def test(self, obj, user):
+        return _follow(obj, self.path) in self.values
+
+    def q(self, user):
+        return Q(**{f'{self.path}__in': sorted(self.values)})
+
+
+class AllOf(Rule):
+    def __init__(self, *rules):
+        self.rules = rules
+
+    def test(self, obj, user):
+        return all(rule.test(obj, user) for rule in self.rules)
+
+    def q(self, user):
+        condition = Q()
+        for rule in self.rules:
+            condition &= rule.q(user)
+        return condition
+
+
+class Not(Rule):
+    def __init__(self, rule):
+        self.rule = rule
+
+    def test(self, obj, user):
+        return not self.rule.test(obj, user)
+
+    def q(self, user):
+        return ~self.rule.q(user)
+
+
+ANY = Anything()
+ROLES = [role for role, _ in User.ROLE_CHOICES]
+STAFF = ROLES
+ADJUSTERS = ['adjuster', 'senior_adjuster']
+MANAGEMENT = ['admin', 'manager']
+
+
+def roles(names, rule=ANY):
+    return {name: rule for name in names}
+
+
+# {resource: {action: {role: ANY | Rule}}}, a role missing from an action is denied it
+PERMISSION_MATRIX = {
+    'policy': {
+        'view': roles(STAFF),
+        'create': roles(STAFF),
+        'change': roles(MANAGEMENT),
+        'delete': roles(MANAGEMENT),
+        'export': roles(MANAGEMENT),
+        'import': roles(MANAGEMENT),
+        'renew': roles(MANAGEMENT),
+        'portfolio': roles(MANAGEMENT),
+    },
+    'claim': {
+        # adjusters work the claims assigned to them
+        'view': {**roles(['call_center', 'senior_adjuster', *MANAGEMENT]), 'adjuster': OwnedBy('assigned_to')},
+        'create': roles(['call_center', *MANAGEMENT]),
+        # a reported claim belongs to the call center until it is picked up
+        'change': {
+            **roles(MANAGEMENT),
+            'call_center': FieldIn('status', ['reported']),
+            'senior_adjuster': ~FieldIn('status', ['reported']),
+            'adjuster': OwnedBy('assigned_to') & ~FieldIn('status', ['reported']),
+        },
+        'delete': {
+            **roles(MANAGEMENT),
+            'call_center': FieldIn('status', ['reported']),
+            'senior_adjuster': ~FieldIn('status', ['reported']),
+            'adjuster': OwnedBy('assigned_to') & ~FieldIn('status', ['reported']),
+        },
+        'assign': roles(['call_center', *MANAGEMENT]),
+        'change_status': {**roles(['senior_adjuster', *MANAGEMENT]), 'adjuster': OwnedBy('assigned_to')},
+        'export': roles(MANAGEMENT),
+        'metrics': roles(['senior_adjuster', *MANAGEMENT]),
+        'review': roles(['senior_adjuster', *MANAGEMENT]),
+    },
+    'note': {
+        'view': {**roles(['call_center', 'senior_adjuster', *MANAGEMENT]), 'adjuster': OwnedBy('claim__assigned_to')},
+        'create': roles([*ADJUSTERS, *MANAGEMENT]),
+        'change': {**roles(MANAGEMENT), **roles(ADJUSTERS, OwnedBy('author'))},
+        'delete': {**roles(MANAGEMENT), **roles(ADJUSTERS, OwnedBy('author'))},
+    },
+    'document': {
+        'view': {**roles(['call_center', 'senior_adjuster', *MANAGEMENT]), 'adjuster': OwnedBy('claim__assigned_to')},
+        'create': roles([*ADJUSTERS, *MANAGEMENT]),
+        'change': {**roles(MANAGEMENT), **roles(ADJUSTERS, OwnedBy('uploaded_by'))},
+        'delete': {**roles(MANAGEMENT), **roles(ADJUSTERS, OwnedBy('uploaded_by'))},
+    },
+}
+
+
+ROLE_BITS = {role: 1 << position for position, role in enumerate(ROLES)}
+
+# unrestricted: bitset of the roles allowed on every object, restricted: of the roles allowed on
+# the objects passing rules[role]
+Grant = namedtuple('Grant', ['unrestricted', 'restricted', 'rules'])
+
+
+def compile_matrix(matrix):
+    """{(resource, action): Grant}"""
+    compiled = {}
+    for resource, actions in matrix.items():
+        for action, grants in actions.items():
+            unknown = set(grants) - set(ROLE_BITS)
+            if unknown:
+                raise ValueError(f'{resource}.{action}: unknown roles {", ".join(sorted(unknown))}')
+            unrestricted = restricted = 0
+            rules = {}
+            for role, rule in grants.items():
+                if rule is ANY:
+                    unrestricted |= ROLE_BITS[role]
+                else:
+                    restricted |= ROLE_BITS[role]
+                    rules[role] = rule
+            compiled[(resource, action)] = Grant(unrestricted, restricted, rules)
+    return compiled
+
+
+GRANTS = compile_matrix(PERMISSION_MATRIX)
+
+
+def role_bit(user):
+    if not user or not user.is_authenticated:
+        return 0
+    return ROLE_BITS.get(user.role, 0)
+
+
+def has_access(user, action, resource):
+    """may `user` `action` at least some `resource`s (the check before any object is read)"""
+    grant = GRANTS[(resource, action)]
+    return bool((grant.unrestricted | grant.restricted) & role_bit(user))
+
+
+def has_object_access(user, action, resource, obj):
+    grant = GRANTS[(resource, action)]
+    bit = role_bit(user)
+    if grant.unrestricted & bit:
+        return True
+    if grant.restricted & bit:
+        return grant.rules[user.role].test(obj, user)
+    return False
+
+
+def access_filter(user, action, resource):
+    """the Q selecting the `resource`s `user` may `action`, None when they may act on all of them"""
+    grant = GRANTS[(resource, action)]
+    bit = role_bit(user)
+    if grant.unrestricted & bit:
+        return None
+    if grant.restricted & bit:
+        return grant.rules[user.role].q(user)
+    return Q(pk__in=[])
+
+
+def scope_queryset(queryset, user, action, resource):
+    condition = access_filter(user, action, resource)
+    return queryset if condition is None else queryset.filter(condition)
+
+
+class MatrixPermission(BasePermission):
+    """
+    checks `resource` against the permission matrix. the action is `action` when set, for
+    endpoints doing one thing whatever the method, otherwise it follows the HTTP method
+    """
+    resource = None
+    action = None
+    METHOD_ACTIONS = {
+        'GET': 'view',
+        'HEAD': 'view',
+        'OPTIONS': 'view',
+        'POST': 'create',
+        'PUT': 'change',
+        'PATCH': 'change',
+        'DELETE': 'delete',
+    }
+
+    def get_action(self, request):
+        return self.action or self.METHOD_ACTIONS[request.method]
+
+    def has_permission(self, request, view):
+        return has_access(request.user, self.get_action(request), self.resource)
+
+    def has_object_permission(self, request, view, obj):
+        return has_object_access(request.user, self.get_action(request), self.resource, obj)
@@ -0,0 +1,140 @@
+"""
+Optimistic concurrency control.
+
+A VersionedModel carries a `version` bumped by every write, exposed to clients as the ETag of the
+object. An update sent with `If-Match: "<version>"` is written by a single conditional
+UPDATE ... WHERE id = %s AND version = %s: when another write got there first no row matches and
+the client gets a 412 instead of silently overwriting it. Without If-Match the update is still
+checked against the version read at the start of the request, unless REQUIRE_IF_MATCH makes the
+header mandatory (428).
+"""
+from django.conf import settings
+from django.db import models
+from django.db.models import F
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class StaleVersion(Exception):
+    """the row is no longer at the version the update expected"""
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'the object has been changed by someone else, please reload it'
+    default_code = 'precondition_failed'
+
+
+class PreconditionRequired(APIException):
+    status_code = status.HTTP_428_PRECONDITION_REQUIRED
+    default_detail = 'the If-Match header is required, send the ETag of the object'
+    default_code = 'precondition_required'
+
+
+class VersionedModel(models.Model):
+    """
+    saving an instance after `expect_version()` is a compare-and-set on its version, raising
+    StaleVersion when the row moved on. any other save bumps the version unconditionally
+    (version = version + 1), the new value is read back on next access
+    """
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        abstract = True
+
+    _expected_version = None
+
+    def expect_version(self, version=None):
+        """make the next save only go through if the row is still at `version` (the loaded one by default)"""
+        self._expected_version = self.version if version is None else version
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        expected = self._expected_version
+        self.version = F('version') + 1 if expected is None else expected + 1
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            # deferred: read back from the row on next access
+            del self.version
+            raise
+        finally:
+            self._expected_version = None
+        if expected is None:
+            del self.version
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected = self._expected_version
+        if expected is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if not base_qs.filter(pk=pk_val, version=expected)._update(values):
+            # changed or deleted since, never fall back to an INSERT
+            raise StaleVersion()
+        return True
+
+
+def version_etag(instance):
+    return f'"{instance.version}"'
+
+
+def etag_version(tag):
+    """the version an ETag was issued for: "<version>" after an update, "<version>-<digest>" from a GET (mlt_ins/conditional.py)"""
+    return tag.strip('"').split('-', 1)[0]
+
+
+def parse_if_match(request):
+    """the entity tags of the If-Match header, None without it ('*' stays '*')"""
+    header = request.headers.get('If-Match')
+    if header is None:
+        return None
+    if header.strip() == '*':
+        return '*'
+    # weak tags never match for If-Match (RFC 9110, strong comparison)
+    return {tag.strip() for tag in header.split(',') if tag.strip() and not tag.strip().startswith('W/')}
+
+
+def expect_request_version(request, instance):
+    """
+    check the If-Match of `request` against `instance` (raises PreconditionFailed or
+    PreconditionRequired) and make its next save conditional on the version it was read at
+    """
+    tags = parse_if_match(request)
+    if tags is None and getattr(settings, 'REQUIRE_IF_MATCH', False):
+        raise PreconditionRequired()
+    if tags is not None and tags != '*' and str(instance.version) not in {etag_version(tag) for tag in tags}:
+        raise PreconditionFailed()
+    instance.expect_version()
+
+
+class VersionedObjectMixin:
+    """
+    retrieve/update for RetrieveUpdateDestroyAPIView subclasses over a VersionedModel:
+    GET answers the ETag, PUT/PATCH honour If-Match and answer the new ETag
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data, 200, headers={'ETag': version_etag(instance)})
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        expect_request_version(request, instance)
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        try:
+            self.perform_update(serializer)
+        except StaleVersion:
+            raise PreconditionFailed()
+
+        if getattr(instance, '_prefetched_objects_cache', None):
+            # the update may have changed the prefetched relations
+            instance._prefetched_objects_cache = {}
+        return Response(serializer.data, 200, headers={'ETag': version_etag(instance)})
@@ -0,0 +1,80 @@
+"""
+Conditional GET.
+
+A view lists the validators of its response, read from indexed columns with a query much cheaper
+than loading and serializing what it returns: the version or updated_at of a row, the count and
+latest updated_at of a collection. When the If-None-Match / If-Modified-Since of the client still
+match, the answer is a 304 without a body; otherwise the usual response goes out with its ETag
+and Last-Modified.
+
+The ETag also digests the query string and the negotiated media type, since ?fields=, ?expand=
+and the pagination parameters change the representation. The ETag of a versioned object starts
+with its version ("<version>-<digest>"), so it can be sent back as the If-Match of an update
+(mlt_ins/concurrency.py).
+"""
+import hashlib
+from collections import namedtuple
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+# parts: values that change whenever the response does; last_modified: the latest update among
+# the rows behind the response, None when some of them carry no timestamp; version: of the object
+Validators = namedtuple('Validators', ['parts', 'last_modified', 'version'], defaults=[None, None])
+
+
+def response_etag(request, validators):
+    key = '|'.join([
+        *(str(part) for part in validators.parts),
+        request.accepted_media_type or '',
+        '&'.join(sorted(f'{name}={value}' for name, values in request.query_params.lists() for value in values)),
+    ])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+    if validators.version is None:
+        return f'"{digest}"'
+    return f'"{validators.version}-{digest}"'
+
+
+class ConditionalGetMixin:
+    """
+    conditional GET for generic views: `get_validators()` returns the Validators of the response
+    about to be built, or None when it cannot be validated cheaply (the request is then served as usual).
+    a 304 goes through `check_not_modified()` first, so it is never sent to a user the full
+    response would have been refused to
+    """
+
+    def get_validators(self):
+        return None
+
+    def check_not_modified(self):
+        """
+        the access checks of the response a 304 stands for. a detail view runs get_object(): a 404
+        out of the user's scope and check_object_permissions. list views have nothing to check,
+        their validators only cover what the user may see. views override it with a lighter lookup
+        """
+        if (self.lookup_url_kwarg or self.lookup_field) in self.kwargs:
+            self.get_object()
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+
+        etag = response_etag(request, validators)
+        last_modified = validators.last_modified
+        response = get_conditional_response(
+            request._request,
+            etag=etag,
+            last_modified=last_modified.timestamp() if last_modified else None,
+        )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        else:
+            self.check_not_modified()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+            # cached by the client only, and revalidated before every reuse
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,95 @@
+"""
+Streaming CSV / NDJSON exports.
+
+Rows are read with values_list().iterator(chunk_size=...) (a server-side cursor on Postgres) and
+encoded straight to bytes: no model or serializer instance is built and at most one chunk of rows
+is held in memory, whatever the size of the export. Under ASGI the chunks are read through
+sync_to_async (mlt_ins/streaming.py), which Django streams instead of buffering.
+"""
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from django.http import StreamingHttpResponse
+
+from .streaming import streaming_content
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _LineBuffer:
+    """the file csv.writer writes to: hands back what it was given instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def parse_export_columns(request, columns):
+    """
+    the {name: lookup} of `columns` selected by ?fields= (all of them without it).
+    raises ValueError naming the unknown fields
+    """
+    requested = request.query_params.get('fields')
+    if not requested:
+        return dict(columns)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ValueError(f'unknown fields: {", ".join(unknown)}')
+    return {name: columns[name] for name in names}
+
+
+def iter_csv(rows, names):
+    writer = csv.writer(_LineBuffer())
+    # the byte order mark makes Excel read the file as UTF-8
+    yield ('\ufeff' + writer.writerow(names)).encode('utf-8')
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow(row))
+        if len(batch) == 500:
+            yield ''.join(batch).encode('utf-8')
+            batch = []
+    if batch:
+        yield ''.join(batch).encode('utf-8')
+
+
+def iter_ndjson(rows, names):
+    encoder = json.JSONEncoder(default=_json_value, ensure_ascii=False)
+    batch = []
+    for row in rows:
+        batch.append(encoder.encode(dict(zip(names, row))))
+        if len(batch) == 500:
+            yield ('\n'.join(batch) + '\n').encode('utf-8')
+            batch = []
+    if batch:
+        yield ('\n'.join(batch) + '\n').encode('utf-8')
+
+
+def export_response(request, queryset, columns, export_format, filename):
+    """
+    stream `queryset` as `export_format` ('csv' or 'ndjson') with one column per entry of
+    `columns` ({name: lookup}), in queryset order, the way the handler of `request` streams
+    """
+    names = list(columns)
+    rows = queryset.values_list(*columns.values()).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    encode = iter_csv if export_format == 'csv' else iter_ndjson
+    response = StreamingHttpResponse(
+        streaming_content(request, encode(rows, names)), content_type=EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,107 @@
+import json
+from base64 import b64decode, b64encode
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination: every page is an index range scan from the last seen key,
+    so page N costs the same as page 1 and no COUNT(*) is issued
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class OptionalKeysetPagination(LimitOffsetPagination):
+    """
+    Keeps the default limit/offset behaviour and switches to keyset pagination when the client
+    asks for it with ?pagination=cursor (or follows a link that already carries a ?cursor=).
+
+    The keyset ordering is read from the view's `keyset_ordering` attribute and must be backed
+    by an index on the model.
+    """
+    keyset_class = KeysetPagination
+    keyset_query_param = 'pagination'
+
+    @classmethod
+    def is_keyset_request(cls, request):
+        return (
+            request.query_params.get(cls.keyset_query_param) == 'cursor'
+            or cls.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if not self.is_keyset_request(request):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = self.keyset_class()
+        self.keyset.ordering = getattr(view, 'keyset_ordering', self.keyset_class.ordering)
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RankedCursorPagination(BasePagination):
+    """
+    Cursor pagination of ranked results (search), ordered by (rank DESC, id DESC).
+
+    A rank is computed per query, so it cannot be an ORDER BY over an index like KeysetPagination's
+    ordering: the view hands `paginate_ranked` a `fetch(after, limit)` callable returning rows
+    `(rank, id, ...)` best first, `after` being the (rank, id) of the last row already sent.
+    The cursor carries that position, pages never repeat or skip a row and no COUNT(*) is issued.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            rank, pk = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            return float(rank), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        encoded = b64encode(json.dumps(list(position)).encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def paginate_ranked(self, fetch, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        rows = fetch(self.decode_cursor(request), page_size + 1)
+        self.next_position = tuple(rows[page_size - 1][:2]) if len(rows) > page_size else None
+        return rows[:page_size]
+
+    def get_next_link(self):
+        return self.encode_cursor(self.next_position) if self.next_position else None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
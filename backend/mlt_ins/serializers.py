@@ -0,0 +1,102 @@
+from rest_framework import serializers
+
+
+class SparseFieldsetMixin:
+    """
+    ModelSerializer mixin adding sparse fieldsets and on-demand expansion.
+
+    - ?fields=a,b      only the listed fields are rendered (and loaded, see `setup_eager_loading`)
+    - ?expand=x,y      only the listed `expandable_fields` are rendered nested; the others collapse
+                       to their primary key (single relations) or are dropped (collections)
+
+    Without ?expand, list serializers expand `list_expand` and single objects expand everything.
+    The query parameters are only read by the top-level serializer; the same values can be passed
+    explicitly with the `fields=` / `expand=` keyword arguments.
+    """
+    expandable_fields = ()
+    list_expand = ()
+    # columns selected even when not requested (primary key, pagination keys)
+    always_load = ('id',)
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self._requested_fields = fields
+        self._requested_expand = expand
+        super().__init__(*args, **kwargs)
+
+    @staticmethod
+    def _split(value):
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    @classmethod
+    def parse_fieldsets(cls, request=None, many=False, fields=None, expand=None):
+        """
+        return (fields, expand): the requested field names (None means all of them)
+        and the names of the expandable fields to render nested
+        """
+        params = request.query_params if request is not None else {}
+        if fields is None and params.get('fields'):
+            fields = cls._split(params['fields'])
+        if expand is None and 'expand' in params:
+            expand = cls._split(params['expand'])
+        if expand is None:
+            expand = cls.list_expand if many else cls.expandable_fields
+
+        expand = set(expand) & set(cls.expandable_fields)
+        if fields is not None:
+            fields = set(fields)
+            expand &= fields
+        return fields, expand
+
+    def _is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._is_root():
+            return fields
+
+        many = isinstance(self.parent, serializers.ListSerializer)
+        requested, expand = self.parse_fieldsets(
+            self.context.get('request'), many, self._requested_fields, self._requested_expand,
+        )
+
+        for name in self.expandable_fields:
+            if name in expand or name not in fields:
+                continue
+            field = fields[name]
+            if isinstance(field, serializers.ListSerializer):
+                fields.pop(name)
+            else:
+                fields[name] = serializers.PrimaryKeyRelatedField(source=field.source, read_only=True)
+
+        if requested is not None:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None, many=False, fields=None, expand=None):
+        """
+        restrict the SELECT to the columns behind the requested fields;
+        serializers with relations extend this with their select_related/prefetch plan
+        """
+        fields, expand = cls.parse_fieldsets(request, many, fields, expand)
+        if fields is None:
+            return queryset
+
+        model_fields = {f.name for f in queryset.model._meta.concrete_fields}
+        columns = set(cls.always_load)
+        for name in fields:
+            source = cls._declared_source(name)
+            if source in model_fields:
+                columns.add(source)
+        return queryset.only(*columns)
+
+    @classmethod
+    def _declared_source(cls, name):
+        field = cls._declared_fields.get(name)
+        if field is not None and field.source:
+            return field.source
+        return name
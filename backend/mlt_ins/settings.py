@@ -177,6 +177,34 @@ SIMPLE_JWT = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# chunked claim document uploads: suggested chunk size and largest document per subscription plan
+CLAIM_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+CLAIM_DOCUMENT_MAX_SIZE = {
+    'basic': 50 * 1024 * 1024,
+    'pro': 500 * 1024 * 1024,
+}
+
+# processes rendering thumbnails and previews of claim documents
+CLAIM_RENDITION_WORKERS = int(os.getenv('CLAIM_RENDITION_WORKERS', 2))
+
+# bulk policy imports (policies/imports.py): records validated and loaded per transaction, background import threads
+POLICY_IMPORT_BATCH_SIZE = int(os.getenv('POLICY_IMPORT_BATCH_SIZE', 5000))
+POLICY_IMPORT_WORKERS = int(os.getenv('POLICY_IMPORT_WORKERS', 1))
+
+# days ahead process_expiring_policies and /policies/expiring/ look for policies about to expire
+POLICY_EXPIRY_WINDOW_DAYS = int(os.getenv('POLICY_EXPIRY_WINDOW_DAYS', 30))
+# expiry notices to policyholders (policies/expiry.py), printed to the console unless a backend is configured
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'no-reply@localhost')
+
+# live claim events (claims/events.py): LocalBackend for a single node, PostgresBackend (LISTEN/NOTIFY) for several
+CLAIM_EVENTS_BACKEND = os.getenv('CLAIM_EVENTS_BACKEND', 'claims.events.LocalBackend')
+# seconds between keepalive comments on idle event streams
+CLAIM_EVENTS_HEARTBEAT = 15
+
+# optimistic concurrency (mlt_ins/concurrency.py): make PUT/PATCH on claims, policies and notes answer 428 without If-Match
+REQUIRE_IF_MATCH = os.getenv('REQUIRE_IF_MATCH', 'false').lower() == 'true'
+
 
 AUTH_USER_MODEL = 'users.User'
 
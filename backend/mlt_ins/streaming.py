@@ -0,0 +1,45 @@
+"""
+Streamed response bodies that stream under both entry points.
+
+Django streams the iterator of a StreamingHttpResponse only when it matches the handler: under
+ASGI a synchronous iterator is consumed whole with sync_to_async(list) before the first byte is
+sent, under WSGI an asynchronous one is consumed whole with async_to_sync. streaming_content
+hands the handler serving the request the kind of iterator it streams, so an export or an
+archive is never built in memory.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+# what next() returns once the chunks are exhausted, StopIteration cannot cross sync_to_async
+_END = object()
+
+
+def is_asgi(request):
+    """whether `request` (an HttpRequest or a DRF Request) is served by the ASGI handler"""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+async def iter_async(chunks):
+    """
+    the items of the synchronous iterator `chunks`, each one produced through sync_to_async. the
+    calls are thread sensitive: they run in the thread that ran the view, with its database
+    connection, tenant schema and server-side cursor
+    """
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, _END)
+            if chunk is _END:
+                return
+            yield chunk
+    finally:
+        # a client gone mid-download: release the cursor or the open file in their thread
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def streaming_content(request, chunks):
+    """`chunks` (a synchronous iterator) as the StreamingHttpResponse content the handler of `request` streams"""
+    return iter_async(chunks) if is_asgi(request) else chunks
@@ -0,0 +1,159 @@
+"""
+Expiring policies: detection, notification and bulk renewal.
+
+The active policies whose end_date falls in [today, today + window] are read through the partial
+index policy_active_term_idx (end_date, start_date WHERE is_active). A daily run of
+`python manage.py process_expiring_policies` then:
+
+- queues one PolicyExpiryNotice per policy and term with a single INSERT ... SELECT ... ON CONFLICT
+  DO NOTHING, so a policy is notified once however many runs see it in the window
+- sends the queued notices in batches over one mail connection, marking each batch sent with
+  one UPDATE
+- optionally renews the policies, one set-based UPDATE ... RETURNING per batch of ids. A renewal
+  starts the day after the current end_date and runs for the same term (age(start, end)), so a
+  year stays a year across leap years. dry_run computes the same dates without writing them
+
+Renewals and previews walk the window in id order (keyset), each policy is renewed at most once
+per run even when its new term still ends inside the window.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Policy, PolicyExpiryNotice
+
+RENEWAL_BATCH_SIZE = 5000
+NOTICE_BATCH_SIZE = 500
+
+# the next term of a policy: from the day after its end, for as long as the current one
+NEXT_START_SQL = 'p.end_date + 1'
+NEXT_END_SQL = "(p.end_date + 1 + age(p.end_date + 1, p.start_date) - interval '1 day')::date"
+
+
+def expiry_window(within, today=None):
+    """(first, last) end_date of the policies expiring in the next `within` days, both included"""
+    today = today or timezone.localdate()
+    return today, today + timedelta(days=within)
+
+
+def expiring_policies(within, today=None):
+    """the active policies ending in the next `within` days, read from policy_active_term_idx"""
+    first, last = expiry_window(within, today)
+    return Policy.objects.filter(is_active=True, end_date__range=(first, last))
+
+
+def queue_expiry_notices(within, today=None):
+    """queue a notice for every expiring policy not notified for its current term yet, returns how many were queued"""
+    first, last = expiry_window(within, today)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {quote(PolicyExpiryNotice._meta.db_table)} (policy_id, end_date, created_at)
+            SELECT p.id, p.end_date, now()
+            FROM {quote(Policy._meta.db_table)} p
+            WHERE p.is_active AND p.end_date BETWEEN %s AND %s
+            ON CONFLICT (policy_id, end_date) DO NOTHING
+            """,
+            [first, last],
+        )
+        return cursor.rowcount
+
+
+def notice_message(notice, tenant):
+    policy = notice.policy
+    return EmailMessage(
+        subject=f'Your policy {policy.policy_number} expires on {policy.end_date:%Y-%m-%d}',
+        body=(
+            f'Dear {policy.policyholder_name},\n\n'
+            f'your {policy.get_policy_type_display().lower()} policy {policy.policy_number} with {tenant.name} '
+            f'expires on {policy.end_date:%Y-%m-%d}. Please contact us at {tenant.contact_email} to renew it.\n'
+        ),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[policy.policyholder_email],
+        reply_to=[tenant.contact_email],
+    )
+
+
+def send_expiry_notices(tenant, batch_size=NOTICE_BATCH_SIZE):
+    """send the queued notices in batches over one mail connection, returns how many were sent"""
+    sent = 0
+    with get_connection() as mail:
+        while True:
+            notices = list(
+                PolicyExpiryNotice.objects.filter(sent_at__isnull=True)
+                .select_related('policy')
+                .order_by('id')[:batch_size]
+            )
+            if not notices:
+                return sent
+            # a policy renewed or deactivated since it was queued is not expiring anymore
+            due = [n for n in notices if n.policy.is_active and n.policy.end_date == n.end_date]
+            mail.send_messages([notice_message(notice, tenant) for notice in due])
+            PolicyExpiryNotice.objects.filter(id__in=[notice.id for notice in due]).update(sent_at=timezone.now())
+            PolicyExpiryNotice.objects.filter(id__in=[n.id for n in notices if n not in due]).delete()
+            sent += len(due)
+
+
+def _renewal_batch(first, last, after, limit, dry_run, policy_ids=None):
+    """[(id, policy_number, start_date, end_date)] of the next batch, the dates being those of the renewed term"""
+    quote = connection.ops.quote_name
+    table = quote(Policy._meta.db_table)
+    params = [first, last, after]
+    only = ''
+    if policy_ids is not None:
+        only = 'AND e.id = ANY(%s)'
+        params.append(list(policy_ids))
+    params.append(limit)
+    batch = f"""
+        SELECT e.id FROM {table} e
+        WHERE e.is_active AND e.end_date BETWEEN %s AND %s AND e.id > %s {only}
+        ORDER BY e.id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        if dry_run:
+            cursor.execute(
+                f"""
+                SELECT p.id, p.policy_number, {NEXT_START_SQL}, {NEXT_END_SQL}
+                FROM {table} p
+                WHERE p.id IN ({batch})
+                """,
+                params,
+            )
+        else:
+            # both dates are computed from the old values of the row
+            cursor.execute(
+                f"""
+                UPDATE {table} p
+                SET start_date = {NEXT_START_SQL}, end_date = {NEXT_END_SQL},
+                    version = p.version + 1, updated_at = now()
+                WHERE p.id IN ({batch} FOR UPDATE)
+                RETURNING p.id, p.policy_number, p.start_date, p.end_date
+                """,
+                params,
+            )
+        return sorted(cursor.fetchall())
+
+
+def renew_expiring_policies(within, today=None, dry_run=False, batch_size=RENEWAL_BATCH_SIZE, limit=None, policy_ids=None):
+    """
+    renew the active policies ending in the next `within` days, one UPDATE and one transaction
+    per batch. `policy_ids` restricts the renewal to these policies, `limit` caps the number of
+    renewals. yields the batches: [(id, policy_number, new start_date, new end_date)]
+    """
+    first, last = expiry_window(within, today)
+    after = 0
+    done = 0
+    while limit is None or done < limit:
+        size = batch_size if limit is None else min(batch_size, limit - done)
+        with transaction.atomic():
+            rows = _renewal_batch(first, last, after, size, dry_run, policy_ids)
+        if not rows:
+            return
+        yield rows
+        done += len(rows)
+        after = rows[-1][0]
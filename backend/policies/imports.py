@@ -0,0 +1,258 @@
+"""
+Bulk policy imports (onboarding the existing book of a new insurer).
+
+The uploaded CSV or NDJSON file is stored, then read as a stream in batches of
+POLICY_IMPORT_BATCH_SIZE records. A batch is validated one column at a time with the validators of
+the Policy model fields, the valid records get their policy numbers in one allocation
+(generate_policy_numbers) and are loaded with a single COPY, and the invalid ones are written to
+the error report (PolicyImportError, one row per invalid field). The batch commits together with
+the progress of the job, so an interrupted import resumes at the first record not committed
+and never loads a record twice.
+
+Imports run on a thread pool of the web process (schedule_import) or in the foreground with
+`python manage.py import_policies`, which also resumes jobs.
+"""
+import csv
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import connection, models, transaction
+from django.utils import timezone
+from django_tenants.utils import schema_context
+
+from .models import Policy, PolicyImport, PolicyImportError
+from .utils import generate_policy_numbers
+
+logger = logging.getLogger(__name__)
+
+# columns read from the file, anything else (an id, a legacy policy number) is ignored
+IMPORT_FIELDS = [
+    'policyholder_name',
+    'policyholder_email',
+    'policy_type',
+    'coverage_amount',
+    'premium',
+    'start_date',
+    'end_date',
+    'is_active',
+]
+REQUIRED_FIELDS = [name for name in IMPORT_FIELDS if not Policy._meta.get_field(name).has_default()]
+
+# format of the files named with these extensions
+FORMAT_EXTENSIONS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+# spellings of booleans in exported spreadsheets the model field does not take ('t', '1', 'True'...)
+BOOLEAN_STRINGS = {'true': True, 'false': False, 'yes': True, 'no': False}
+
+# stands for a NDJSON line that does not parse
+INVALID_JSON = object()
+
+
+class ImportFileError(Exception):
+    """the file as a whole cannot be imported (missing columns, not UTF-8)"""
+
+
+class ImportTakenOver(Exception):
+    """another run of the same job committed a batch first"""
+
+
+def detect_format(filename, requested=None):
+    """'csv' or 'ndjson', from `requested` or else the extension of `filename`. raises ValueError"""
+    if requested:
+        if requested not in dict(PolicyImport.FORMAT_CHOICES):
+            raise ValueError(f'import_format must be one of {", ".join(dict(PolicyImport.FORMAT_CHOICES))}')
+        return requested
+    for extension, import_format in FORMAT_EXTENSIONS.items():
+        if filename.lower().endswith(extension):
+            return import_format
+    raise ValueError(f'cannot tell the format of {filename}, name it {", ".join(FORMAT_EXTENSIONS)} or pass import_format')
+
+
+def read_records(job):
+    """the records of the job file, in file order: dicts, or INVALID_JSON for a NDJSON line that does not parse"""
+    with default_storage.open(job.file_name, 'rb') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        try:
+            if job.import_format == 'csv':
+                reader = csv.DictReader(text)
+                missing = [name for name in REQUIRED_FIELDS if name not in (reader.fieldnames or [])]
+                if missing:
+                    raise ImportFileError(f'missing columns: {", ".join(missing)}')
+                yield from reader
+            else:
+                for line in text:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield INVALID_JSON
+        except UnicodeDecodeError:
+            raise ImportFileError('the file is not UTF-8 encoded')
+
+
+def validate_records(records, first_row):
+    """
+    ([{field: cleaned value}] of the valid records, [(row, field, message)] of the invalid ones).
+    `first_row` is the number of the first record in the file
+    """
+    errors = []
+    bad_rows = set()
+    for offset, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append((first_row + offset, 'record', 'invalid JSON' if record is INVALID_JSON else 'not a JSON object'))
+            bad_rows.add(offset)
+
+    columns = {}
+    for name in IMPORT_FIELDS:
+        field = Policy._meta.get_field(name)
+        values = []
+        for offset, record in enumerate(records):
+            if not isinstance(record, dict):
+                values.append(None)
+                continue
+            value = record.get(name)
+            if value is None or value == '':
+                if field.has_default():
+                    values.append(field.get_default())
+                    continue
+                errors.append((first_row + offset, name, 'This field is required.'))
+                bad_rows.add(offset)
+                values.append(None)
+                continue
+            if isinstance(field, models.BooleanField) and isinstance(value, str):
+                value = BOOLEAN_STRINGS.get(value.strip().lower(), value)
+            try:
+                values.append(field.clean(value, None))
+            except ValidationError as e:
+                errors.extend((first_row + offset, name, message) for message in e.messages)
+                bad_rows.add(offset)
+                values.append(None)
+        columns[name] = values
+
+    valid = [
+        {name: columns[name][offset] for name in IMPORT_FIELDS}
+        for offset in range(len(records))
+        if offset not in bad_rows
+    ]
+    errors.sort(key=lambda error: error[0])
+    return valid, errors
+
+
+def copy_policies(rows, tenant_id):
+    """insert `rows` ({field: cleaned value}) with one COPY, numbering them in one allocation"""
+    if not rows:
+        return
+    numbers = generate_policy_numbers(len(rows))
+    now = timezone.now().isoformat()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for number, row in zip(numbers, rows):
+        # a COPY bypasses save(): the defaults of version and updated_at are written here
+        writer.writerow([number, tenant_id, *(row[name] for name in IMPORT_FIELDS), now, 1])
+    buffer.seek(0)
+
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(name) for name in ['policy_number', 'tenant_id', *IMPORT_FIELDS, 'updated_at', 'version'])
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {quote(Policy._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def import_batch(job_id, start, records):
+    """load `records`, the ones after the first `start` of the file, and record the progress; returns the job"""
+    with transaction.atomic():
+        job = PolicyImport.objects.select_for_update().get(pk=job_id)
+        if job.rows_done != start:
+            raise ImportTakenOver()
+        valid, errors = validate_records(records, start + 1)
+        copy_policies(valid, job.tenant_id)
+        PolicyImportError.objects.bulk_create(
+            [PolicyImportError(job=job, row=row, field=field, message=message) for row, field, message in errors],
+            batch_size=1000,
+        )
+        job.rows_done += len(records)
+        job.imported += len(valid)
+        job.rejected += len(records) - len(valid)
+        job.save(update_fields=['rows_done', 'imported', 'rejected', 'updated_at'])
+    return job
+
+
+def _finish(job_id, status, error=''):
+    PolicyImport.objects.filter(pk=job_id).update(
+        status=status, error=error, finished_at=timezone.now(), updated_at=timezone.now(),
+    )
+
+
+def run_import(job_id, batch_size=None, progress=None):
+    """
+    import the records of the job not imported yet, calling `progress(job)` after every batch.
+    returns the job as left: completed, failed (see its error) or running when another run took over
+    """
+    batch_size = batch_size or settings.POLICY_IMPORT_BATCH_SIZE
+    with transaction.atomic():
+        job = PolicyImport.objects.select_for_update().get(pk=job_id)
+        if job.status == 'completed':
+            return job
+        job.status = 'running'
+        job.error = ''
+        job.save(update_fields=['status', 'error', 'updated_at'])
+
+    try:
+        records = islice(read_records(job), job.rows_done, None)
+        start = job.rows_done
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            job = import_batch(job_id, start, batch)
+            start = job.rows_done
+            if progress:
+                progress(job)
+    except ImportTakenOver:
+        pass
+    except ImportFileError as e:
+        _finish(job_id, 'failed', str(e))
+    except Exception as e:
+        logger.exception('policy import %s failed', job_id)
+        _finish(job_id, 'failed', f'{type(e).__name__}: {e}')
+    else:
+        _finish(job_id, 'completed')
+    return PolicyImport.objects.get(pk=job_id)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """the threads running imports in the web process, started on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.POLICY_IMPORT_WORKERS, thread_name_prefix='policy-import')
+        return _executor
+
+
+def _run_in_schema(schema_name, job_id):
+    try:
+        with schema_context(schema_name):
+            run_import(job_id)
+    finally:
+        # threads outside the request cycle close their own connection
+        connection.close()
+
+
+def schedule_import(job):
+    """run `job` in the background in the current tenant schema"""
+    return get_executor().submit(_run_in_schema, connection.schema_name, job.pk)
@@ -0,0 +1,58 @@
+import os
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django_tenants.utils import get_tenant_model, schema_context
+from policies.imports import detect_format, run_import
+from policies.models import PolicyImport
+
+
+class Command(BaseCommand):
+    help = 'Import the policies of a CSV or NDJSON file into a tenant, or resume an interrupted import'
+
+    def add_arguments(self, parser):
+        parser.add_argument('schema', help='schema name of the tenant')
+        parser.add_argument('file', nargs='?', help='CSV or NDJSON file of policies')
+        parser.add_argument('--import-format', choices=[name for name, _ in PolicyImport.FORMAT_CHOICES])
+        parser.add_argument('--resume', metavar='IMPORT_ID', help='resume this import instead of starting one')
+        parser.add_argument('--batch-size', type=int, help='records per transaction (POLICY_IMPORT_BATCH_SIZE by default)')
+
+    def handle(self, *args, **options):
+        tenant = get_tenant_model().objects.filter(schema_name=options['schema']).first()
+        if tenant is None:
+            raise CommandError(f'no tenant with schema {options["schema"]}')
+        if bool(options['file']) == bool(options['resume']):
+            raise CommandError('give either a file or --resume')
+
+        with schema_context(tenant.schema_name):
+            if options['resume']:
+                job = PolicyImport.objects.filter(pk=options['resume']).first()
+                if job is None:
+                    raise CommandError(f'no import {options["resume"]} in {tenant.schema_name}')
+            else:
+                path = options['file']
+                try:
+                    import_format = detect_format(path, options['import_format'])
+                except ValueError as e:
+                    raise CommandError(str(e))
+                job = PolicyImport(tenant=tenant, filename=os.path.basename(path), import_format=import_format)
+                with open(path, 'rb') as source:
+                    default_storage.save(job.file_name, File(source))
+                job.save()
+                self.stdout.write(f'import {job.id} started, resume it with --resume {job.id}')
+
+            job = run_import(job.pk, batch_size=options['batch_size'], progress=self.report)
+
+        self.report(job)
+        if job.status == 'completed':
+            self.stdout.write(self.style.SUCCESS(f'import {job.id} completed'))
+        elif job.status == 'failed':
+            raise CommandError(f'import {job.id} failed: {job.error}')
+        else:
+            self.stdout.write(self.style.WARNING(f'import {job.id} is {job.status}, carried on by another run'))
+        if job.rejected:
+            self.stdout.write(f'rejected records: GET /policies/imports/{job.id}/errors/')
+
+    def report(self, job):
+        self.stdout.write(f'{job.rows_done} records read, {job.imported} imported, {job.rejected} rejected')
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_tenant_model, get_public_schema_name, schema_context
+from policies.expiry import expiring_policies, queue_expiry_notices, send_expiry_notices, renew_expiring_policies, RENEWAL_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Notify the holders of the policies about to expire and optionally renew them (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--within', type=int, default=settings.POLICY_EXPIRY_WINDOW_DAYS, help='days ahead to look for expiring policies')
+        parser.add_argument('--renew', action='store_true', help='also renew the expiring policies for the same term')
+        parser.add_argument('--dry-run', action='store_true', help='only report what would be notified and renewed, write nothing')
+        parser.add_argument('--batch-size', type=int, default=RENEWAL_BATCH_SIZE, help='policies renewed per UPDATE')
+        parser.add_argument('--schema', help='only this tenant')
+
+    def handle(self, *args, **options):
+        within = options['within']
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            tenants = tenants.filter(schema_name=options['schema'])
+        for tenant in tenants:
+            with schema_context(tenant.schema_name):
+                if options['dry_run']:
+                    expiring = expiring_policies(within).count()
+                    self.stdout.write(f'{tenant.schema_name}: {expiring} policies expire in the next {within} days')
+                else:
+                    queued = queue_expiry_notices(within)
+                    sent = send_expiry_notices(tenant)
+                    self.stdout.write(f'{tenant.schema_name}: {queued} notices queued, {sent} sent')
+                if options['renew']:
+                    self.renew(tenant, within, options['dry_run'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('expiring policies processed' + (' (dry run)' if options['dry_run'] else '')))
+
+    def renew(self, tenant, within, dry_run, batch_size):
+        renewed = 0
+        for rows in renew_expiring_policies(within, dry_run=dry_run, batch_size=batch_size):
+            renewed += len(rows)
+            if self.verbosity > 1:
+                for _, policy_number, start_date, end_date in rows:
+                    self.stdout.write(f'  {policy_number}: {start_date} -> {end_date}')
+        verb = 'would be renewed' if dry_run else 'renewed'
+        self.stdout.write(f'{tenant.schema_name}: {renewed} policies {verb}')
@@ -0,0 +1,33 @@
+from django.db import models
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils import timezone
+
+
+def validity_q(as_of=None, prefix=''):
+    """
+    the Q of the policies in force on `as_of` (today by default): active, started and not ended.
+    `prefix` reaches them through a relation, e.g. validity_q(prefix='policy__') on claims
+    """
+    as_of = as_of or timezone.localdate()
+    return Q(**{
+        f'{prefix}is_active': True,
+        f'{prefix}start_date__lte': as_of,
+        f'{prefix}end_date__gte': as_of,
+    })
+
+
+class PolicyQuerySet(models.QuerySet):
+    """
+    policy validity evaluated by the database instead of Policy.is_valid row by row. valid()
+    is an index range scan of policy_active_term_idx (end_date, start_date WHERE is_active)
+    """
+
+    def valid(self, as_of=None):
+        return self.filter(validity_q(as_of))
+
+    def invalid(self, as_of=None):
+        return self.exclude(validity_q(as_of))
+
+    def with_validity(self, as_of=None):
+        """annotate `valid`: whether the policy is in force on `as_of`"""
+        return self.annotate(valid=ExpressionWrapper(validity_q(as_of), output_field=BooleanField()))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:57
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0001_initial'),
+    ]
+
+    # created in every tenant schema; each nextval() reserves a block of 50 numbers
+    # (must match the block_size of the allocator using it)
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE SEQUENCE IF NOT EXISTS policies_policy_number_seq INCREMENT BY 50 START WITH 1 MINVALUE 1',
+            reverse_sql='DROP SEQUENCE IF EXISTS policies_policy_number_seq',
+        ),
+    ]
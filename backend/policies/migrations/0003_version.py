@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0002_policy_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='policy',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
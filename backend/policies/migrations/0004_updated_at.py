@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0003_version'),
+        ('tenants_manager', '0003_admin_username'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='policy',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='policy',
+            index=models.Index(fields=['updated_at'], name='policy_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:30
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0004_updated_at'),
+        ('tenants_manager', '0003_admin_username'),
+    ]
+
+    # pg_trgm is installed once per database: in public, which every tenant has on its search_path,
+    # rather than in the schema of whichever tenant migrates first. left in place on reverse
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='policy',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('policyholder_name', name='gin_trgm_ops'), name='policy_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='policy',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('policyholder_email', name='gin_trgm_ops'), name='policy_email_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='policy',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('policy_number', name='gin_trgm_ops'), name='policy_number_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='policy',
+            index=models.Index(django.db.models.functions.comparison.Collate('policy_number', 'C'), name='policy_number_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='policy',
+            index=models.Index(django.db.models.functions.comparison.Collate(django.db.models.functions.text.Lower('policyholder_email'), 'C'), name='policy_email_prefix_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0006_policy_import'),
+        ('tenants_manager', '0003_admin_username'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicyExpiryNotice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('end_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='policy',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['end_date'], name='policy_active_end_idx'),
+        ),
+        migrations.AddField(
+            model_name='policyexpirynotice',
+            name='policy',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expiry_notices', to='policies.policy'),
+        ),
+        migrations.AddIndex(
+            model_name='policyexpirynotice',
+            index=models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['id'], name='policy_notice_unsent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='policyexpirynotice',
+            constraint=models.UniqueConstraint(fields=('policy', 'end_date'), name='policy_expiry_notice_unique'),
+        ),
+    ]
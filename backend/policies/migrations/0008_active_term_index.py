@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0007_expiry'),
+        ('tenants_manager', '0003_admin_username'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='policy',
+            name='policy_active_end_idx',
+        ),
+        migrations.AddIndex(
+            model_name='policy',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['end_date', 'start_date'], name='policy_active_term_idx'),
+        ),
+    ]
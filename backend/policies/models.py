@@ -1,9 +1,18 @@
+import os
+import uuid
+
 from django.db import models
+from django.core.files.storage import default_storage
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Collate, Lower
 from tenants_manager.models import InsuranceCompany
 from django.utils import timezone
+from mlt_ins.concurrency import VersionedModel
+from users.models import User
+from .managers import PolicyQuerySet
 
 # Create your models here.
-class Policy(models.Model):
+class Policy(VersionedModel):
     policy_number = models.CharField(max_length=50, unique=True)
     tenant = models.ForeignKey(InsuranceCompany, on_delete=models.CASCADE)
     policyholder_name = models.CharField(max_length=100)
@@ -28,11 +37,113 @@ class Policy(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PolicyQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # latest change of the policy list, its conditional GET validator
+            models.Index(fields=['updated_at'], name='policy_updated_idx'),
+            # the active policies in force on a date (PolicyQuerySet.valid) or about to expire
+            # (policies/expiry.py): a range on end_date, start_date checked from the index
+            models.Index(fields=['end_date', 'start_date'], name='policy_active_term_idx', condition=models.Q(is_active=True)),
+            # /policies/search/ (policies/search.py): trigram matching of names, emails and policy
+            # number digits, C-collated btrees for the prefix range scans LIKE 'POL-0001%'
+            GinIndex(OpClass('policyholder_name', name='gin_trgm_ops'), name='policy_name_trgm_idx'),
+            GinIndex(OpClass('policyholder_email', name='gin_trgm_ops'), name='policy_email_trgm_idx'),
+            GinIndex(OpClass('policy_number', name='gin_trgm_ops'), name='policy_number_trgm_idx'),
+            models.Index(Collate('policy_number', 'C'), name='policy_number_prefix_idx'),
+            models.Index(Collate(Lower('policyholder_email'), 'C'), name='policy_email_prefix_idx'),
+        ]
 
 
     @property
     def is_valid(self):
-        return self.start_date <= timezone.now().date() <= self.end_date and self.is_active
+        # same rule as PolicyQuerySet.valid(), which filters on it in SQL
+        return self.start_date <= timezone.localdate() <= self.end_date and self.is_active
+
+    def __str__(self):
+        return f'policy: {self.policy_number} - {self.policyholder_email}' 
+
+
+class PolicyExpiryNotice(models.Model):
+    """
+    a queued notification that a policy is about to expire (policies/expiry.py), one per policy
+    and term: `end_date` is the end of the term it was queued for
+    """
+    policy = models.ForeignKey(Policy, on_delete=models.CASCADE, related_name='expiry_notices')
+    end_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['policy', 'end_date'], name='policy_expiry_notice_unique'),
+        ]
+        indexes = [
+            # the queue: notices not sent yet
+            models.Index(fields=['id'], name='policy_notice_unsent_idx', condition=models.Q(sent_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f'policy-expiry-notice: {self.policy_id} - {self.end_date}'
+
+
+class PolicyImport(models.Model):
+    """
+    a bulk load of policies from a CSV or NDJSON file (policies/imports.py). the file is read in
+    batches, each committed with the progress it makes: `rows_done` records are behind it and
+    the job resumes from there after an interruption
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(InsuranceCompany, on_delete=models.CASCADE)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    import_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    rows_done = models.PositiveIntegerField(default=0)      # records read, imported or rejected
+    imported = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)                    # why the job failed as a whole
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def file_name(self):
+        return os.path.join('policy_imports', f'{self.id}.{self.import_format}')
+
+    def delete(self, *args, **kwargs):
+        # drop the uploaded file along with the job
+        default_storage.delete(self.file_name)
+        super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f'policy-import: {self.filename} ({self.status}, {self.rows_done} rows)'
+
+
+class PolicyImportError(models.Model):
+    """a rejected record of an import, one row per invalid field"""
+    job = models.ForeignKey(PolicyImport, on_delete=models.CASCADE, related_name='errors')
+    row = models.PositiveIntegerField()     # 1-based number of the record in the file
+    field = models.CharField(max_length=50)
+    message = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['job', 'row'], name='policyimporterror_row_idx'),
+        ]
 
     def __str__(self):
-        return f'policy: {self.policy_number} - {self.policyholder_email}' 
\ No newline at end of file
+        return f'policy-import-error: row {self.row} {self.field}: {self.message}'
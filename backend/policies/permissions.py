@@ -1,14 +1,27 @@
-from rest_framework.permissions import BasePermission, SAFE_METHODS
-from rest_framework.request import Request
-
-
-class PolicyPermission(BasePermission):
-    def has_object_permission(self, request: Request, view, obj):
-        if request.method in SAFE_METHODS:
-            return True
-        
-        if not request.user.is_authenticated:
-            return False
-            
-        
-        return request.user.role in ['admin', 'manager']
\ No newline at end of file
+from mlt_ins.access import MatrixPermission
+
+# who may do what is declared in mlt_ins/access.py (PERMISSION_MATRIX)
+
+
+class PolicyPermission(MatrixPermission):
+    resource = 'policy'
+
+
+class PolicyExportPermission(MatrixPermission):
+    resource = 'policy'
+    action = 'export'
+
+
+class PortfolioPermission(MatrixPermission):
+    resource = 'policy'
+    action = 'portfolio'
+
+
+class PolicyImportPermission(MatrixPermission):
+    resource = 'policy'
+    action = 'import'
+
+
+class PolicyRenewalPermission(MatrixPermission):
+    resource = 'policy'
+    action = 'renew'
@@ -0,0 +1,88 @@
+"""
+Portfolio analytics per policy type: exposure, premium earned to date and loss ratios.
+
+Everything is aggregated by the database in one GROUP BY over the policies and their coverage
+ledger (claims.models.PolicyCoverage), so a million-policy tenant sends back one row per policy
+type instead of a million rows to sum in Python, and the amounts stay exact numerics.
+
+The premium of a policy is earned pro rata over its term: on `as_of` it has earned
+premium * (days elapsed / days in the term), nothing before its start and all of it after its
+end. The loss ratios divide the approved (incurred) and paid amounts by the earned premium.
+"""
+from decimal import Decimal
+
+from django.db import connection
+from django.utils import timezone
+
+from claims.models import PolicyCoverage
+from .models import Policy
+
+CENT = Decimal('0.01')
+RATIO = Decimal('0.0001')
+
+# share of its premium a policy has earned on %(as_of)s, 0 before its start and 1 after its end
+EARNED_SHARE_SQL = """
+    LEAST(GREATEST(
+        (%(as_of)s::date - p.start_date + 1)::numeric / GREATEST(p.end_date - p.start_date + 1, 1),
+        0), 1)
+"""
+
+
+def _ratio(amount, base):
+    return (amount / base).quantize(RATIO) if base else None
+
+
+def portfolio_analytics(as_of=None, is_active=None):
+    """
+    [{policy_type, policies, coverage_amount, premium, earned_premium, claimed_amount,
+    approved_amount, paid_amount, loss_ratio, paid_loss_ratio}] by policy type, followed by the
+    totals of the portfolio (policy_type None). `is_active` restricts to active or inactive policies
+    """
+    as_of = as_of or timezone.localdate()
+    params = {'as_of': as_of}
+    where = ''
+    if is_active is not None:
+        where = 'WHERE p.is_active = %(is_active)s'
+        params['is_active'] = is_active
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        # GROUPING SETS adds the portfolio total as the row with a NULL policy_type
+        cursor.execute(
+            f"""
+            SELECT p.policy_type,
+                   count(*),
+                   sum(p.coverage_amount),
+                   sum(p.premium),
+                   sum(p.premium * {EARNED_SHARE_SQL}),
+                   coalesce(sum(c.claimed_amount), 0),
+                   coalesce(sum(c.approved_amount), 0),
+                   coalesce(sum(c.paid_amount), 0)
+            FROM {quote(Policy._meta.db_table)} p
+            LEFT JOIN {quote(PolicyCoverage._meta.db_table)} c ON c.policy_id = p.id
+            {where}
+            GROUP BY GROUPING SETS ((p.policy_type), ())
+            ORDER BY p.policy_type NULLS LAST
+            """,
+            params,
+        )
+        rows = cursor.fetchall()
+
+    results = []
+    for policy_type, policies, coverage, premium, earned, claimed, approved, paid in rows:
+        # the total row of an empty portfolio
+        if not policies:
+            continue
+        earned = earned.quantize(CENT)
+        results.append({
+            'policy_type': policy_type,
+            'policies': policies,
+            'coverage_amount': coverage,
+            'premium': premium,
+            'earned_premium': earned,
+            'claimed_amount': claimed,
+            'approved_amount': approved,
+            'paid_amount': paid,
+            'loss_ratio': _ratio(approved, earned),
+            'paid_loss_ratio': _ratio(paid, earned),
+        })
+    return results
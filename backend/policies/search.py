@@ -0,0 +1,140 @@
+"""
+Policy search (/policies/search/).
+
+The shape of the key word picks one of four paths, each answered from an index:
+
+- a policy number prefix ("POL-00000123"): range scan of the C-collated policy_number index
+- an email prefix (anything with an @): range scan of the C-collated lower(policyholder_email) index
+- digits and dashes ("1234", "0042-0017-003"): the policy numbers containing them through the
+  pg_trgm GIN index of policy_number, the exact number first (the zero padded one for bare
+  digits). this also finds the NNNN-NNNN-NNN numbers of the policies created before the POL- sequence
+- anything else: pg_trgm word similarity against the policyholder name and email (GIN
+  gin_trgm_ops indexes), ranked by the best of the two
+
+A path keeps at most MAX_RESULTS candidates (the best ranked ones, or the first ones in index
+order for prefixes) and pages through them on (rank, id) with RankedCursorPagination, so a
+request never reads more than MAX_RESULTS rows whatever the number of policies.
+"""
+import re
+
+from django.db import connection
+
+from .models import Policy
+from .utils import format_policy_number
+
+MAX_RESULTS = 1000
+# below that a word has no trigram of its own to look up
+MIN_TRIGRAM_LENGTH = 3
+
+POLICY_NUMBER_PREFIX = re.compile(r'^POL-\d*$', re.IGNORECASE)
+# at least one digit, dashes allowed anywhere: a full or partial number in either format
+NUMBER_PART = re.compile(r'^(?=.*\d)[\d-]+$')
+DIGITS = re.compile(r'^\d+$')
+
+
+def _like_prefix(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_mode(text):
+    """'number_prefix', 'email_prefix', 'number_part' or 'similarity', None when too short to search"""
+    if POLICY_NUMBER_PREFIX.match(text):
+        return 'number_prefix'
+    if '@' in text:
+        return 'email_prefix'
+    if NUMBER_PART.match(text):
+        return 'number_part'
+    if len(text) >= MIN_TRIGRAM_LENGTH:
+        return 'similarity'
+    return None
+
+
+def _candidates(mode, text, table):
+    """(sql, params) of the at most MAX_RESULTS (id, rank) rows `text` matches"""
+    if mode == 'number_prefix':
+        number = text.upper()
+        return (
+            f"""
+            SELECT p.id, (CASE WHEN p.policy_number = %s THEN 1 ELSE 0.5 END)::real AS rank
+            FROM {table} p
+            WHERE p.policy_number COLLATE "C" LIKE %s {{scope}}
+            ORDER BY p.policy_number COLLATE "C"
+            LIMIT %s
+            """,
+            [number, _like_prefix(number)],
+        )
+    if mode == 'email_prefix':
+        email = text.lower()
+        return (
+            f"""
+            SELECT p.id, (CASE WHEN lower(p.policyholder_email) = %s THEN 1 ELSE 0.5 END)::real AS rank
+            FROM {table} p
+            WHERE lower(p.policyholder_email) COLLATE "C" LIKE %s {{scope}}
+            ORDER BY lower(p.policyholder_email) COLLATE "C"
+            LIMIT %s
+            """,
+            [email, _like_prefix(email)],
+        )
+    if mode == 'number_part':
+        exact = format_policy_number(int(text)) if DIGITS.match(text) else text
+        if len(text) < MIN_TRIGRAM_LENGTH:
+            return (
+                f'SELECT p.id, 1::real AS rank FROM {table} p WHERE p.policy_number = %s {{scope}} LIMIT %s',
+                [exact],
+            )
+        return (
+            f"""
+            SELECT p.id, (CASE WHEN p.policy_number = %s THEN 1 ELSE similarity(p.policy_number, %s) END)::real AS rank
+            FROM {table} p
+            WHERE p.policy_number LIKE %s {{scope}}
+            ORDER BY rank DESC, p.id DESC
+            LIMIT %s
+            """,
+            [exact, text, '%' + _like_prefix(text)],
+        )
+    return (
+        f"""
+        SELECT p.id, greatest(word_similarity(%s, p.policyholder_name), word_similarity(%s, p.policyholder_email)) AS rank
+        FROM {table} p
+        WHERE (%s <%% p.policyholder_name OR %s <%% p.policyholder_email) {{scope}}
+        ORDER BY rank DESC, p.id DESC
+        LIMIT %s
+        """,
+        [text, text, text, text],
+    )
+
+
+def search_policies(text, after=None, limit=25, policies=None):
+    """
+    [(rank, policy_id)] of the policies matching `text`, best first (see search_mode for what it
+    can be). `after` is the (rank, policy_id) of the last row of the previous page, `policies` a
+    Policy queryset the results are restricted to. raises ValueError when `text` is too short
+    """
+    mode = search_mode(text)
+    if mode is None:
+        raise ValueError(f'search for at least {MIN_TRIGRAM_LENGTH} characters, a policy number or an email')
+
+    sql, params = _candidates(mode, text, connection.ops.quote_name(Policy._meta.db_table))
+    scope = ''
+    if policies is not None:
+        scope_sql, scope_params = policies.values('id').query.sql_with_params()
+        scope = f'AND p.id IN ({scope_sql})'
+        params.extend(scope_params)
+    params.append(MAX_RESULTS)
+
+    page = ''
+    if after is not None:
+        page = 'WHERE (rank, id) < (%s::real, %s)'
+        params.extend(after)
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH candidates AS ({sql.format(scope=scope)})
+            SELECT rank, id FROM candidates {page}
+            ORDER BY rank DESC, id DESC
+            LIMIT %s
+            """,
+            params,
+        )
+        return cursor.fetchall()
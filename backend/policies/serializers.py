@@ -1,19 +1,61 @@
 from rest_framework import serializers
-from .models import Policy
+from .models import Policy, PolicyImport
 from .utils import generate_policy_number
+from mlt_ins.serializers import SparseFieldsetMixin
+
+class PolicySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    supports ?fields= to render (and select) only some columns.
+    `coverage` is read from the policy's coverage ledger (claims.models.PolicyCoverage), never from its claims
+    """
+    # version: the ETag of the policy (mlt_ins/concurrency.py)
+    always_load = ('id', 'version')
+    coverage = serializers.SerializerMethodField()
 
-class PolicySerializer(serializers.ModelSerializer):
     class Meta:
         model = Policy
-        fields = ['id','policy_number','policyholder_name','policyholder_email','policy_type','coverage_amount','premium','start_date','end_date','is_active','tenant']
+        fields = ['id','policy_number','policyholder_name','policyholder_email','policy_type','coverage_amount','premium','start_date','end_date','is_active','tenant','updated_at','version','coverage']
         read_only_fields = ['policy_number', 'tenant']
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # nested in a claim the ledger would cost a query per claim
+        if not self._is_root():
+            fields.pop('coverage', None)
+        return fields
+
+    def get_coverage(self, policy):
+        ledger = getattr(policy, 'coverage', None)
+        claimed, approved, paid = (
+            (ledger.claimed_amount, ledger.approved_amount, ledger.paid_amount) if ledger else (0, 0, 0)
+        )
+        return {
+            'claimed_amount': str(claimed),
+            'approved_amount': str(approved),
+            'paid_amount': str(paid),
+            'remaining_coverage': str(policy.coverage_amount - approved),
+        }
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None, many=False, fields=None, expand=None):
+        fields, expand = cls.parse_fieldsets(request, many, fields, expand)
+        if fields is not None and 'coverage' in fields:
+            # remaining coverage is computed from coverage_amount
+            fields = fields | {'coverage_amount'}
+        queryset = super().setup_eager_loading(queryset, fields=fields, expand=expand)
+        if fields is None or 'coverage' in fields:
+            # a prefetch rather than a join, it works with the only() of a ?fields= selection
+            queryset = queryset.prefetch_related('coverage')
+        return queryset
+
     
     def create(self, validated_data):
-        number = generate_policy_number()
-        #ensure uniqueness
-        while Policy.objects.filter(policy_number=number).exists():   
-            number = generate_policy_number()
+        validated_data['policy_number'] = generate_policy_number()
+        return Policy.objects.create(**validated_data)
+
 
-        validated_data['policy_number'] = number
-        return Policy.objects.create(**validated_data)
\ No newline at end of file
+class PolicyImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PolicyImport
+        fields = ['id','filename','import_format','status','rows_done','imported','rejected','error','created_by','created_at','updated_at','finished_at']
+        read_only_fields = fields
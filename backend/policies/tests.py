@@ -1,3 +1,377 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, override_settings
+from django_tenants.test.cases import TenantTestCase
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from mlt_ins.concurrency import StaleVersion, PreconditionFailed, PreconditionRequired, expect_request_version, parse_if_match
+from mlt_ins.streaming import streaming_content
+
+from users.models import User
+from .expiry import expiry_window, queue_expiry_notices, renew_expiring_policies
+from .imports import validate_records, detect_format, INVALID_JSON
+from .models import Policy, PolicyExpiryNotice
+from .search import search_mode, search_policies, _like_prefix
+from .views import filter_validity, GetEditDeletePolicy, renew_policy
+
+
+def setup_test_tenant(tenant):
+    """the fields an insurer needs, for the setup_tenant() of the TenantTestCases"""
+    tenant.name = 'Test Insurance'
+    tenant.code = 'TST'
+    tenant.business_type = 'auto'
+    tenant.contact_email = 'contact@test.com'
+    tenant.contact_phone = '0000000000'
+
+
+def create_policy(tenant, **overrides):
+    """an active auto policy of `tenant` in force from 2024 to 2030, `overrides` replace any of its fields"""
+    fields = {
+        'policy_number': '0000-0000-000',
+        'policyholder_name': 'John Doe',
+        'policyholder_email': 'john@example.com',
+        'policy_type': 'auto',
+        'coverage_amount': 50000,
+        'premium': 1200,
+        'start_date': date(2024, 1, 1),
+        'end_date': date(2030, 12, 31),
+        **overrides,
+    }
+    return Policy.objects.create(tenant=tenant, **fields)
+
+class PolicySearchModeTest(SimpleTestCase):
+    def test_modes(self):
+        self.assertEqual(search_mode('POL-000001'), 'number_prefix')
+        self.assertEqual(search_mode('pol-'), 'number_prefix')
+        self.assertEqual(search_mode('jane.doe@'), 'email_prefix')
+        self.assertEqual(search_mode('1234'), 'number_part')
+        self.assertEqual(search_mode('12'), 'number_part')
+        self.assertEqual(search_mode('0042-0017-003'), 'number_part')
+        self.assertEqual(search_mode('0017-0'), 'number_part')
+        self.assertEqual(search_mode('---'), 'similarity')
+        self.assertEqual(search_mode('jane'), 'similarity')
+        self.assertIsNone(search_mode('ja'))
+
+    def test_like_prefix_escapes_wildcards(self):
+        self.assertEqual(_like_prefix('a_b%c\\'), 'a\\_b\\%c\\\\%')
+
+
+class PolicySearchTest(TenantTestCase):
+    @classmethod
+    def setup_tenant(cls, tenant):
+        setup_test_tenant(tenant)
+
+    def setUp(self):
+        self.legacy = create_policy(self.tenant, policy_number='0042-0017-003')
+        self.other = create_policy(self.tenant, policy_number='0042-0018-001', policyholder_email='jane@example.com')
+        self.current = create_policy(self.tenant, policy_number='POL-0000001234', policyholder_email='joe@example.com')
+
+    def found(self, text):
+        return [policy_id for _, policy_id in search_policies(text)]
+
+    def test_legacy_numbers(self):
+        self.assertEqual(self.found('0042-0017-003'), [self.legacy.id])
+        self.assertEqual(self.found('0017-00'), [self.legacy.id])
+        self.assertEqual(set(self.found('0042-')), {self.legacy.id, self.other.id})
+
+    def test_current_numbers(self):
+        self.assertEqual(self.found('1234'), [self.current.id])
+        self.assertEqual(self.found('POL-00000012'), [self.current.id])
+
+
+class PolicyImportValidationTest(SimpleTestCase):
+    record = {
+        'policyholder_name': 'Jane Doe',
+        'policyholder_email': 'jane@example.com',
+        'policy_type': 'auto',
+        'coverage_amount': '50000.00',
+        'premium': '1200.50',
+        'start_date': '2024-01-01',
+        'end_date': '2024-12-31',
+    }
+
+    def test_valid_record_is_cleaned(self):
+        valid, errors = validate_records([self.record], 1)
+        self.assertEqual(errors, [])
+        self.assertEqual(valid[0]['coverage_amount'], Decimal('50000.00'))
+        self.assertEqual(valid[0]['start_date'], date(2024, 1, 1))
+        self.assertIs(valid[0]['is_active'], True)
+
+    def test_invalid_records_are_reported_per_field(self):
+        records = [
+            self.record,
+            {**self.record, 'policy_type': 'boat', 'premium': ''},
+            INVALID_JSON,
+            {**self.record, 'is_active': 'false'},
+        ]
+        valid, errors = validate_records(records, 101)
+        self.assertEqual(len(valid), 2)
+        self.assertIs(valid[1]['is_active'], False)
+        self.assertEqual([(row, field) for row, field, _ in errors], [(102, 'policy_type'), (102, 'premium'), (103, 'record')])
+
+    def test_detect_format(self):
+        self.assertEqual(detect_format('book.CSV'), 'csv')
+        self.assertEqual(detect_format('book.jsonl'), 'ndjson')
+        self.assertEqual(detect_format('book.txt', 'csv'), 'csv')
+        with self.assertRaises(ValueError):
+            detect_format('book.xlsx')
+
+
+class ExpiryWindowTest(SimpleTestCase):
+    def test_window_includes_both_ends(self):
+        self.assertEqual(expiry_window(30, today=date(2024, 2, 15)), (date(2024, 2, 15), date(2024, 3, 16)))
+        self.assertEqual(expiry_window(0, today=date(2024, 2, 15)), (date(2024, 2, 15), date(2024, 2, 15)))
+
+
+class PolicyRenewalTest(TenantTestCase):
+    """renewals keep the length of the term across leap years, notices go out once per term"""
+    today = date(2024, 2, 15)  # the window runs to 2024-03-16
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        setup_test_tenant(tenant)
+
+    def setUp(self):
+        self.leap_year = self.create(1, date(2023, 3, 1), date(2024, 2, 29))
+        self.half_year = self.create(2, date(2023, 9, 1), date(2024, 2, 29))
+        self.year = self.create(3, date(2023, 3, 11), date(2024, 3, 10))
+        # a 20 day term, renewed into a term that still ends inside the window
+        self.short = self.create(4, date(2024, 2, 1), date(2024, 2, 20))
+        self.create(5, date(2023, 7, 1), date(2024, 6, 30))
+        self.create(6, date(2023, 3, 1), date(2024, 2, 29), is_active=False)
+
+    def create(self, number, start_date, end_date, **overrides):
+        return create_policy(
+            self.tenant, policy_number=f'POL-000000000{number}', start_date=start_date, end_date=end_date, **overrides,
+        )
+
+    def renew(self, **options):
+        return [row for rows in renew_expiring_policies(30, today=self.today, **options) for row in rows]
+
+    def expected(self):
+        return [
+            (self.leap_year.id, 'POL-0000000001', date(2024, 3, 1), date(2025, 2, 28)),
+            (self.half_year.id, 'POL-0000000002', date(2024, 3, 1), date(2024, 8, 31)),
+            (self.year.id, 'POL-0000000003', date(2024, 3, 11), date(2025, 3, 10)),
+            (self.short.id, 'POL-0000000004', date(2024, 2, 21), date(2024, 3, 11)),
+        ]
+
+    def test_next_terms(self):
+        version = Policy.objects.get(pk=self.leap_year.pk).version
+        self.assertEqual(self.renew(), self.expected())
+        self.leap_year.refresh_from_db()
+        self.assertEqual((self.leap_year.start_date, self.leap_year.end_date), (date(2024, 3, 1), date(2025, 2, 28)))
+        self.assertEqual(self.leap_year.version, version + 1)
+
+    def test_dry_run_writes_nothing(self):
+        version = Policy.objects.get(pk=self.leap_year.pk).version
+        self.assertEqual(self.renew(dry_run=True), self.expected())
+        self.leap_year.refresh_from_db()
+        self.assertEqual((self.leap_year.end_date, self.leap_year.version), (date(2024, 2, 29), version))
+
+    def test_batches_and_limit(self):
+        batches = list(renew_expiring_policies(30, today=self.today, batch_size=1, limit=2))
+        self.assertEqual(batches, [[row] for row in self.expected()[:2]])
+        self.year.refresh_from_db()
+        self.assertEqual(self.year.end_date, date(2024, 3, 10))
+
+        # the next run picks up the rest, then the short policy, whose new term ends in the window again
+        self.assertEqual(self.renew(), self.expected()[2:])
+        self.assertEqual(self.renew(policy_ids=[self.short.id]), [
+            (self.short.id, 'POL-0000000004', date(2024, 3, 12), date(2024, 3, 31)),
+        ])
+
+    def test_one_notice_per_term(self):
+        self.assertEqual(queue_expiry_notices(30, today=self.today), 4)
+        self.assertEqual(queue_expiry_notices(30, today=self.today), 0)
+
+        self.renew(policy_ids=[self.short.id])
+        self.assertEqual(queue_expiry_notices(30, today=self.today), 1)
+        self.assertEqual(
+            list(PolicyExpiryNotice.objects.filter(policy=self.short).order_by('end_date').values_list('end_date', flat=True)),
+            [date(2024, 2, 20), date(2024, 3, 11)],
+        )
+
+
+class PolicyValidityTest(SimpleTestCase):
+    def test_valid_matches_is_valid(self):
+        as_of = date(2024, 6, 1)
+        sql = str(Policy.objects.valid(as_of).query)
+        self.assertIn('"policies_policy"."is_active"', sql)
+        self.assertIn('"policies_policy"."start_date" <= 2024-06-01', sql)
+        self.assertIn('"policies_policy"."end_date" >= 2024-06-01', sql)
+        self.assertIn('NOT', str(Policy.objects.invalid(as_of).query))
+
+    def test_filter_validity_params(self):
+        policies = Policy.objects.all()
+        self.assertEqual(filter_validity(policies, {}), (policies, None))
+        _, as_of = filter_validity(policies, {'as_of': '2024-06-01'})
+        self.assertEqual(as_of, date(2024, 6, 1))
+        with self.assertRaises(ValidationError):
+            filter_validity(policies, {'valid': 'yes'})
+        with self.assertRaises(ValidationError):
+            filter_validity(policies, {'valid': 'true', 'as_of': '06/01/2024'})
+
+
+class StreamingContentTest(SimpleTestCase):
+    """exports are streamed chunk by chunk by both handlers instead of being buffered by the other one"""
+
+    def chunks(self, closed):
+        try:
+            yield b'id\r\n'
+            yield b'1\r\n'
+        finally:
+            closed.append(True)
+
+    def test_wsgi_keeps_the_iterator(self):
+        chunks = self.chunks([])
+        self.assertIs(streaming_content(RequestFactory().get('/policies/export/'), chunks), chunks)
+
+    def test_asgi_gets_an_async_iterator(self):
+        closed = []
+        content = streaming_content(AsyncRequestFactory().get('/policies/export/'), self.chunks(closed))
+
+        async def consume():
+            return [chunk async for chunk in content]
+
+        self.assertEqual(async_to_sync(consume)(), [b'id\r\n', b'1\r\n'])
+        self.assertEqual(closed, [True])
+
+    def test_asgi_closes_the_iterator_of_an_interrupted_download(self):
+        closed = []
+        content = streaming_content(AsyncRequestFactory().get('/policies/export/'), self.chunks(closed))
+
+        async def first_chunk():
+            chunk = await content.__anext__()
+            await content.aclose()
+            return chunk
+
+        self.assertEqual(async_to_sync(first_chunk)(), b'id\r\n')
+        self.assertEqual(closed, [True])
+
+
+class IfMatchTest(SimpleTestCase):
+    """If-Match is compared strongly with the version of the object, and required when REQUIRE_IF_MATCH is set"""
+
+    def request(self, if_match=None):
+        headers = {} if if_match is None else {'If-Match': if_match}
+        return RequestFactory().patch('/policies/1/', headers=headers)
+
+    def test_parse(self):
+        self.assertIsNone(parse_if_match(self.request()))
+        self.assertEqual(parse_if_match(self.request('*')), '*')
+        self.assertEqual(parse_if_match(self.request('"3", W/"4"')), {'"3"'})
+
+    def test_matching_version(self):
+        for tag in ('"3"', '"3-5d41402a"', '"2", "3"', '*'):
+            policy = Policy(id=1, version=3)
+            expect_request_version(self.request(tag), policy)
+            self.assertEqual(policy._expected_version, 3)
+
+    def test_stale_version(self):
+        with self.assertRaises(PreconditionFailed) as raised:
+            expect_request_version(self.request('"2"'), Policy(id=1, version=3))
+        self.assertEqual(raised.exception.status_code, 412)
+
+    def test_weak_tags_never_match(self):
+        with self.assertRaises(PreconditionFailed):
+            expect_request_version(self.request('W/"3"'), Policy(id=1, version=3))
+
+    def test_missing_if_match(self):
+        policy = Policy(id=1, version=3)
+        expect_request_version(self.request(), policy)
+        # still checked against the version the request read
+        self.assertEqual(policy._expected_version, 3)
+
+    @override_settings(REQUIRE_IF_MATCH=True)
+    def test_required_if_match(self):
+        with self.assertRaises(PreconditionRequired) as raised:
+            expect_request_version(self.request(), Policy(id=1, version=3))
+        self.assertEqual(raised.exception.status_code, 428)
+        expect_request_version(self.request('"3"'), Policy(id=1, version=3))
+
+
+class VersionedSaveTest(TenantTestCase):
+    """a save after expect_version() is a compare-and-set on the version of the row"""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        setup_test_tenant(tenant)
+
+    def setUp(self):
+        self.policy = create_policy(self.tenant)
+        self.manager = User.objects.create_user(
+            email='manager@test.com',
+            username='manager',
+            phone_number='0000000001',
+            password='password',
+            role='manager',
+            tenant=self.tenant,
+        )
+
+    def test_saves_bump_the_version(self):
+        self.policy.premium = 1300
+        self.policy.save()
+        self.assertEqual(self.policy.version, 2)
+        self.policy.expect_version()
+        self.policy.save()
+        self.assertEqual(self.policy.version, 3)
+        self.assertEqual(Policy.objects.get(pk=self.policy.pk).version, 3)
+
+    def test_stale_save_raises(self):
+        stale = Policy.objects.get(pk=self.policy.pk)
+        self.policy.save()
+        stale.expect_version()
+        stale.premium = 1300
+        with self.assertRaises(StaleVersion):
+            stale.save()
+        self.assertEqual(Policy.objects.get(pk=self.policy.pk).premium, 1200)
+
+    def patch(self, if_match=None):
+        headers = {} if if_match is None else {'If-Match': if_match}
+        request = APIRequestFactory().patch(f'/policies/{self.policy.pk}/', {'premium': '1300.00'}, format='json', headers=headers)
+        request.tenant = self.tenant
+        force_authenticate(request, user=self.manager)
+        return GetEditDeletePolicy.as_view()(request, policy_id=self.policy.pk)
+
+    def test_update_answers_412_on_a_stale_if_match(self):
+        self.policy.save()
+        response = self.patch('"1"')
+        self.assertEqual(response.status_code, 412)
+        response = self.patch('"2"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"3"')
+
+    @override_settings(REQUIRE_IF_MATCH=True)
+    def test_update_answers_428_without_if_match(self):
+        self.assertEqual(self.patch().status_code, 428)
+
+    def renew(self, user, if_match=None):
+        headers = {} if if_match is None else {'If-Match': if_match}
+        request = APIRequestFactory().put(
+            f'/policies/{self.policy.pk}/renew/', {'new_start_date': '2031-01-01', 'new_end_date': '2031-12-31'},
+            format='json', headers=headers,
+        )
+        request.tenant = self.tenant
+        force_authenticate(request, user=user)
+        return renew_policy(request, policy_id=self.policy.pk)
+
+    def test_renewal_is_for_management_and_checks_if_match(self):
+        adjuster = User.objects.create_user(
+            email='adjuster@test.com',
+            username='adjuster',
+            phone_number='0000000002',
+            password='password',
+            role='adjuster',
+            tenant=self.tenant,
+        )
+        self.assertEqual(self.renew(adjuster).status_code, 403)
+        self.policy.save()
+        self.assertEqual(self.renew(self.manager, '"1"').status_code, 412)
+        response = self.renew(self.manager, '"2"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"3"')
+        self.assertEqual(Policy.objects.get(pk=self.policy.pk).end_date, date(2031, 12, 31))
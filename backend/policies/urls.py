@@ -7,4 +7,13 @@ urlpatterns = [
     path('<int:policy_id>/',view=views.GetEditDeletePolicy.as_view()),
     path('<int:policy_id>/renew/',view=views.renew_policy),
     path('search/',view=views.search_policy),
+    path('export/',view=views.export_policies),
+    path('portfolio/coverage/',view=views.portfolio_coverage),
+    path('portfolio/analytics/',view=views.portfolio_analytics_view),
+    path('expiring/',view=views.expiring_policies_view),
+    path('renewals/',view=views.bulk_renew_policies),
+    path('imports/',view=views.import_policies),
+    path('imports/<uuid:import_id>/',view=views.policy_import_details),
+    path('imports/<uuid:import_id>/errors/',view=views.policy_import_errors),
+    path('imports/<uuid:import_id>/resume/',view=views.resume_policy_import),
 ]
\ No newline at end of file
@@ -1,11 +1,17 @@
-import random
+from mlt_ins.sequences import BlockAllocator
 
-def generate_policy_number(length=4,repeat=3):
-    digs = '0123456789'
-    rslt = ''
-    for _ in range(repeat):
-        rslt += ''.join(random.choice(digs) for i in range(length))
-        rslt +='-'
-    return rslt[:-2]    #to get rid of the last -
+# backed by the per-tenant policies_policy_number_seq sequence (see migrations/0002_policy_number_sequence.py), INCREMENT BY must match
+policy_number_allocator = BlockAllocator('policies_policy_number_seq', block_size=50)
 
 
+def format_policy_number(value):
+    return f'POL-{value:010d}'
+
+
+def generate_policy_numbers(count):
+    """allocate `count` unique policy numbers in at most one database round trip"""
+    return [format_policy_number(value) for value in policy_number_allocator.allocate(count)]
+
+
+def generate_policy_number():
+    return generate_policy_numbers(1)[0]
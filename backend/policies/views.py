@@ -2,20 +2,62 @@ from django.shortcuts import render
 from rest_framework.decorators import api_view,APIView,permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
-from .models import Policy
+from .models import Policy, PolicyImport, PolicyImportError
 from users.models import User
-from .serializers import PolicySerializer
+from .serializers import PolicySerializer, PolicyImportSerializer
 from django.shortcuts import get_object_or_404
 from rest_framework.request import Request
 from datetime import datetime
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from django.db.models import Q
-from .permissions import PolicyPermission
+from .permissions import PolicyPermission, PolicyExportPermission, PortfolioPermission, PolicyImportPermission, PolicyRenewalPermission
+from django.db.models import Count, Sum, Value, Max
+from django.db.models.functions import Coalesce
+from mlt_ins.pagination import OptionalKeysetPagination, KeysetPagination, RankedCursorPagination
+from mlt_ins.exports import EXPORT_FORMATS, export_response, parse_export_columns
+from mlt_ins.concurrency import VersionedObjectMixin, StaleVersion, PreconditionFailed, expect_request_version, version_etag
+from mlt_ins.conditional import ConditionalGetMixin, Validators
+from mlt_ins.access import scope_queryset, access_filter
+from .search import search_policies, search_mode, MIN_TRIGRAM_LENGTH
+from .imports import detect_format, schedule_import
+from .expiry import expiring_policies, renew_expiring_policies
+from .portfolio import portfolio_analytics
+from claims.models import ClaimDocument, DocumentBlob
+from claims.utils import track_policy_type_change, track_policy_deletion
+from decimal import Decimal
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from functools import partial
+from django.utils import timezone
 # Create your views here.
 
 
 
-class ListCreatePolicy(ListCreateAPIView):
+
+def filter_validity(policies, params):
+    """
+    (`policies` narrowed by ?valid=true|false and ?as_of=YYYY-MM-DD, the date validity was checked
+    on or None when not filtered). a policy is valid when it is active and in force on as_of, today
+    by default; as_of alone means valid=true. raises ValidationError
+    """
+    valid = params.get('valid')
+    as_of = params.get('as_of')
+    if valid is None and as_of is None:
+        return policies, None
+    if valid not in (None, 'true', 'false'):
+        raise ValidationError({'valid': 'must be true or false'})
+    try:
+        as_of = datetime.strptime(as_of, "%Y-%m-%d").date() if as_of else timezone.localdate()
+    except ValueError:
+        raise ValidationError({'as_of': 'dates must be in YYYY-MM-DD format'})
+    if valid == 'false':
+        return policies.invalid(as_of), as_of
+    return policies.valid(as_of), as_of
+
+
+class ListCreatePolicy(ConditionalGetMixin, ListCreateAPIView):
     """
     List and create insurance policies
     
@@ -35,14 +77,46 @@ class ListCreatePolicy(ListCreateAPIView):
         "end_date": "2024-12-31"
     }
     
+    Query Parameters (GET):
+    - fields: comma separated fields to return, e.g. policy_number,policy_type (optional)
+    - valid: true for the policies in force (active, started and not ended), false for the others (optional)
+    - as_of: YYYY-MM-DD, the day validity is checked on (default today, alone it means valid=true)
+    
     Response:
     - GET 200: [PolicySerializer objects]
     - POST 201: PolicySerializer object
+    - GET 400: {"valid": "..."} or {"as_of": "..."}
     - POST 400: Validation errors
+
+    Pagination (GET):
+    - default: ?limit=&offset=
+    - keyset: ?pagination=cursor[&page_size=], then follow the returned next/previous links
+      (newest first, ordered on the primary key)
+
+    Conditional GET:
+    - the response carries an ETag covering the policies and their coverage ledger;
+      If-None-Match with it answers 304 while none of them changed
     """
     serializer_class = PolicySerializer
     permission_classes = [IsAuthenticated,PolicyPermission]
     queryset = Policy.objects.all()
+    pagination_class = OptionalKeysetPagination
+    keyset_ordering = ('-id',)
+
+    def get_queryset(self):
+        policies = scope_queryset(Policy.objects.all(), self.request.user, 'view', 'policy')
+        policies, _ = filter_validity(policies, self.request.query_params)
+        return PolicySerializer.setup_eager_loading(policies, self.request, many=True)
+
+    def get_validators(self):
+        policies = scope_queryset(Policy.objects.all(), self.request.user, 'view', 'policy')
+        policies, as_of = filter_validity(policies, self.request.query_params)
+        policies = policies.aggregate(
+            count=Count('id'), updated_at=Max('updated_at'), coverage_updated_at=Max('coverage__updated_at'),
+        )
+        # a deletion leaves the latest update as it was, so no Last-Modified for a collection.
+        # validity also changes with the date alone, the day it was checked on is part of the ETag
+        return Validators([policies['count'], policies['updated_at'], policies['coverage_updated_at'], as_of])
     
 
     def perform_create(self, serializer):
@@ -50,7 +124,7 @@ class ListCreatePolicy(ListCreateAPIView):
         return serializer.save(tenant=self.request.tenant)
     
 
-class GetEditDeletePolicy(RetrieveUpdateDestroyAPIView):
+class GetEditDeletePolicy(ConditionalGetMixin, VersionedObjectMixin, RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a specific policy
     
@@ -67,11 +141,22 @@ class GetEditDeletePolicy(RetrieveUpdateDestroyAPIView):
         "is_active": true
     }
     
+    Headers (PUT/PATCH):
+    - If-Match: the ETag of the policy, the update only goes through if nobody changed it since
+      (optional unless REQUIRE_IF_MATCH is set)
+    
+    Headers (GET):
+    - If-None-Match / If-Modified-Since: the ETag / Last-Modified of a previous GET, answered with
+      304 while neither the policy nor its coverage ledger changed
+
     Response:
-    - GET 200: PolicySerializer object
-    - PUT/PATCH 200: Updated PolicySerializer object
+    - GET 200: PolicySerializer object, ETag header starting with the version of the policy, Last-Modified
+    - GET 304: Not modified
+    - PUT/PATCH 200: Updated PolicySerializer object, ETag header with the new version
     - DELETE 204: No content
     - 404: Policy not found
+    - 412: the policy has been changed since the version in If-Match (or since it was read)
+    - 428: If-Match missing while REQUIRE_IF_MATCH is set
     """
     serializer_class = PolicySerializer
     permission_classes = [IsAuthenticated,PolicyPermission]
@@ -80,22 +165,52 @@ class GetEditDeletePolicy(RetrieveUpdateDestroyAPIView):
 
     def get_object(self):
         policy_id = self.kwargs.get('policy_id',None)
-        return get_object_or_404(Policy,pk=policy_id)
+        policies = scope_queryset(Policy.objects.all(), self.request.user, 'view', 'policy')
+        policy = get_object_or_404(PolicySerializer.setup_eager_loading(policies, self.request),pk=policy_id)
+        self.check_object_permissions(self.request, policy)
+        return policy
+
+    def get_validators(self):
+        row = Policy.objects.filter(pk=self.kwargs['policy_id']).values_list('version', 'updated_at', 'coverage__updated_at').first()
+        if row is None:
+            return None
+        version, updated_at, coverage_updated_at = row
+        return Validators(list(row), max(filter(None, [updated_at, coverage_updated_at])), version)
     
     def update(self, request, *args, **kwargs):
         kwargs['partial'] = True
         return super().update(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # the row lock keeps claims from being filed on the policy while its claims are recounted
+            previous_type = Policy.objects.select_for_update().values_list('policy_type', flat=True).get(pk=serializer.instance.pk)
+            policy = serializer.save()
+            # the claim counters are keyed on the policy type
+            if policy.policy_type != previous_type:
+                track_policy_type_change(policy.pk, previous_type, policy.policy_type)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            policy_type = Policy.objects.select_for_update().values_list('policy_type', flat=True).get(pk=instance.pk)
+            track_policy_deletion(instance.pk, policy_type)
+            # the claims and their documents go with the policy through the cascade, drop their blob references
+            blob_ids = list(
+                ClaimDocument.objects.filter(claim__policy=instance).exclude(blob=None).values_list('blob_id', flat=True)
+            )
+            instance.delete()
+            DocumentBlob.release(blob_ids)
+
 
 @api_view(['PUT', 'PATCH'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, PolicyRenewalPermission])
 def renew_policy(request: Request, policy_id: int):
     """
     Renew policy by updating start and end dates
     
     Goal: Extend policy coverage period with new dates
     Path: PUT/PATCH /policies/{policy_id}/renew/
-    Authentication: JWT required
+    Authentication: JWT required, PolicyRenewalPermission (admin, manager)
     
     Request Body:
     {
@@ -103,10 +218,16 @@ def renew_policy(request: Request, policy_id: int):
         "new_end_date": "2025-12-31"
     }
     
+    Headers:
+    - If-Match: the ETag of the policy, the renewal only goes through if nobody changed it since
+      (optional unless REQUIRE_IF_MATCH is set)
+    
     Response:
-    - 200: {"detail": "the policy has been renewed successfully", "policy": PolicySerializer object}
+    - 200: {"detail": "the policy has been renewed successfully", "policy": PolicySerializer object}, ETag header with the new version
     - 400: {"error": "please provide both start and end dates"}, {"error": "dates must be in YYYY-MM-DD format"}, or {"error": "start date must be earlier than end date"}
     - 404: Policy not found
+    - 412: the policy has been changed since the version in If-Match (or since it was read)
+    - 428: If-Match missing while REQUIRE_IF_MATCH is set
     """
     policy = get_object_or_404(Policy, pk=policy_id)
     new_start_date_str = request.data.get('new_start_date')
@@ -127,44 +248,459 @@ def renew_policy(request: Request, policy_id: int):
         return Response({'error': 'start date must be earlier than end date'}, status=400)
 
     # Update policy
+    expect_request_version(request, policy)
     policy.start_date = new_start_date
     policy.end_date = new_end_date
-    policy.save()
+    try:
+        policy.save()
+    except StaleVersion:
+        raise PreconditionFailed()
 
     return Response(
         {
             'detail': 'the policy has been renewed successfully',
             'policy': PolicySerializer(policy).data
         },
-        status=200
+        status=200,
+        headers={'ETag': version_etag(policy)},
     )
 
 
+# entries listed in the response of a bulk renewal, the rest is only counted
+RENEWAL_RESPONSE_LIMIT = 1000
+
+
+def parse_within(value):
+    """the expiry window in days from a query or body value, settings.POLICY_EXPIRY_WINDOW_DAYS by default. raises ValueError"""
+    if value in (None, ''):
+        return settings.POLICY_EXPIRY_WINDOW_DAYS
+    within = int(value)
+    if not 0 <= within <= 366:
+        raise ValueError
+    return within
+
+
 @api_view(['GET'])
+@permission_classes([IsAuthenticated, PolicyPermission])
+def expiring_policies_view(request:Request):
+    """
+    Policies about to expire
+    
+    Goal: See which active policies lapse soon, to contact their holders or renew them
+    Path: GET /policies/expiring/?within=30
+    Authentication: JWT required, PolicyPermission
+    
+    Query Parameters:
+    - within: days ahead, the policies ending between today and today + within (default 30, at most 366)
+    - page_size: page size (optional)
+    - fields: comma separated fields to return (optional)
+    
+    Response:
+    - 200: {"next": url, "previous": url, "results": [PolicySerializer objects]} soonest first
+    - 400: {"error": "within must be a number of days between 0 and 366"}
+    """
+    try:
+        within = parse_within(request.query_params.get('within'))
+    except ValueError:
+        return Response({'error':'within must be a number of days between 0 and 366'},400)
+    policies = scope_queryset(expiring_policies(within), request.user, 'view', 'policy')
+    paginator = KeysetPagination()
+    paginator.ordering = ('end_date', 'id')
+    page = paginator.paginate_queryset(PolicySerializer.setup_eager_loading(policies, request, many=True), request)
+    return paginator.get_paginated_response(PolicySerializer(page,many=True,context={'request':request}).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, PolicyRenewalPermission])
+def bulk_renew_policies(request:Request):
+    """
+    Renew the policies about to expire in bulk
+    
+    Goal: Renew a whole window of expiring policies in one call, with a preview first
+    Path: POST /policies/renewals/
+    Authentication: JWT required, PolicyRenewalPermission (admin, manager)
+    
+    Request Body:
+    {
+        "within": 30,             # days ahead, default 30
+        "policy_ids": [1, 2, 3],  # optional, only these policies (those outside the window are skipped)
+        "dry_run": true           # optional, compute the new terms without saving them
+    }
+    
+    Each policy starts a new term the day after its current end_date, as long as the current
+    term (a year stays a year). Policies are renewed in batches, one UPDATE per batch.
+    
+    Response:
+    - 200: {"dry_run": bool, "count": renewed policies, "policies": [{"id": 1, "policy_number": "...",
+      "start_date": "...", "end_date": "..."}] the first 1000 of them with their new term}
+    - 400: {"error": "..."} invalid within or policy_ids
+    """
+    try:
+        within = parse_within(request.data.get('within'))
+    except (TypeError, ValueError):
+        return Response({'error':'within must be a number of days between 0 and 366'},400)
+    policy_ids = request.data.get('policy_ids')
+    if policy_ids is not None:
+        if not isinstance(policy_ids, list) or not all(isinstance(policy_id, int) for policy_id in policy_ids):
+            return Response({'error':'policy_ids must be a list of policy ids'},400)
+    dry_run = request.data.get('dry_run') in (True, 'true')
+
+    count = 0
+    renewed = []
+    for rows in renew_expiring_policies(within, dry_run=dry_run, policy_ids=policy_ids):
+        count += len(rows)
+        renewed.extend(rows[:RENEWAL_RESPONSE_LIMIT - len(renewed)])
+    return Response({
+        'dry_run': dry_run,
+        'count': count,
+        'policies': [
+            {'id': policy_id, 'policy_number': policy_number, 'start_date': start_date, 'end_date': end_date}
+            for policy_id, policy_number, start_date, end_date in renewed
+        ],
+    },200)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, PolicyPermission])
 def search_policy(request:Request):
     """
     Search policies by keyword
     
     Goal: Find policies matching search criteria
     Path: GET /policies/search/?key_word={keyword}
-    Authentication: Not required
+    Authentication: JWT required, PolicyPermission
     
     Query Parameters:
-    - key_word: Search term to match against policy_number, policyholder_name, or policyholder_email (optional)
+    - key_word: what to look for (optional), see policies/search.py:
+      - a policy number or its start ("POL-00000123"), an email or its start ("jane.doe@"): prefix match
+      - digits and dashes ("1234", "0042-0017-003"): policy numbers containing them, the exact number first
+      - anything else, at least 3 characters: similarity with the policyholder name and email
+    - page_size: results per page (default 25, at most 100)
+    - cursor: the `next` link of the previous page
+    - fields: comma separated fields to return (optional)
+    - valid, as_of: only the policies in force (or not) on a day, as for GET /policies/
+    
+    Results are always paginated and a search returns at most the 1000 best matches.
     
     Response:
-    - 200: [PolicySerializer objects] - List of matching policies
-    - If no key_word provided: Returns all policies
+    - 200: {"next": url|null, "previous": null, "results": [{"rank": 0.8, "policy": PolicySerializer object}]}
+      best match first
+    - 200 (no key_word): {"next": url, "previous": url, "results": [PolicySerializer objects]} newest first
+    - 400: key_word too short, invalid valid or as_of
     """
-    key_word = request.GET.get('key_word',None)
+    key_word = request.query_params.get('key_word','').strip()
+    policies = scope_queryset(Policy.objects.all(), request.user, 'view', 'policy')
+    policies, as_of = filter_validity(policies, request.query_params)
     if not key_word:
-        policies = Policy.objects.all()
-    else:
-        policies = Policy.objects.filter(
+        paginator = KeysetPagination()
+        paginator.ordering = ('-id',)
+        page = paginator.paginate_queryset(PolicySerializer.setup_eager_loading(policies, request, many=True), request)
+        return paginator.get_paginated_response(PolicySerializer(page,many=True,context={'request':request}).data)
+
+    if search_mode(key_word) is None:
+        return Response({'error':f'key_word must be at least {MIN_TRIGRAM_LENGTH} characters, a policy number or an email'},400)
+    # restricted roles only search the policies they can see
+    restricted = access_filter(request.user, 'view', 'policy') is not None
+    visible = policies if restricted or as_of is not None else None
+    paginator = RankedCursorPagination()
+    rows = paginator.paginate_ranked(
+        lambda after, limit: search_policies(key_word, after=after, limit=limit, policies=visible),
+        request,
+    )
+    queryset = PolicySerializer.setup_eager_loading(
+        Policy.objects.filter(id__in=[policy_id for _, policy_id in rows]), request, many=True
+    )
+    found = {policy.id: policy for policy in queryset}
+
+    # a policy deleted between the two queries is left out
+    rows = [(rank, policy_id) for rank, policy_id in rows if policy_id in found]
+    data = PolicySerializer([found[policy_id] for _, policy_id in rows], many=True, context={'request':request}).data
+    return paginator.get_paginated_response([
+        {'rank': rank, 'policy': policy} for (rank, _), policy in zip(rows, data)
+    ])
+
+
+# columns of policies/export, {name: lookup}
+POLICY_EXPORT_COLUMNS = {
+    'id': 'id',
+    'policy_number': 'policy_number',
+    'policyholder_name': 'policyholder_name',
+    'policyholder_email': 'policyholder_email',
+    'policy_type': 'policy_type',
+    'coverage_amount': 'coverage_amount',
+    'premium': 'premium',
+    'start_date': 'start_date',
+    'end_date': 'end_date',
+    'is_active': 'is_active',
+    'tenant': 'tenant_id',
+}
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, PolicyExportPermission])
+def export_policies(request:Request):
+    """
+    Export the policies as CSV or NDJSON
+    
+    Goal: Full policy extracts for finance without paging through the JSON API
+    Path: GET /policies/export/?export_format=csv|ndjson
+    Authentication: JWT required, PolicyExportPermission (admin, manager)
+    
+    Query Parameters:
+    - export_format: csv (default) or ndjson
+    - fields: comma separated columns, same names as the PolicySerializer fields
+    - key_word: substring of the policy_number, policyholder_name or policyholder_email
+    - policy_type: comma separated policy types
+    - is_active: true or false
+    - valid, as_of: only the policies in force (or not) on a day, as for GET /policies/
+    
+    The rows are streamed from a server-side cursor as they are read, in id order.
+    
+    Response:
+    - 200: text/csv or application/x-ndjson attachment
+    - 400: unknown format, field or policy type, invalid valid or as_of
+    """
+    export_format = request.query_params.get('export_format','csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response({'error':f'export_format must be one of {", ".join(EXPORT_FORMATS)}'},400)
+    try:
+        columns = parse_export_columns(request, POLICY_EXPORT_COLUMNS)
+    except ValueError as e:
+        return Response({'error':str(e)},400)
+
+    policies = scope_queryset(Policy.objects.all(), request.user, 'export', 'policy')
+    params = request.query_params
+    key_word = params.get('key_word')
+    if key_word:
+        policies = policies.filter(
             Q(policy_number__icontains=key_word) |
             Q(policyholder_name__icontains=key_word) |
             Q(policyholder_email__icontains=key_word)
         )
-    return Response(PolicySerializer(policies,many=True).data,200)
+    if params.get('policy_type'):
+        policy_types = [policy_type.strip() for policy_type in params['policy_type'].split(',')]
+        unknown = set(policy_types) - {choice for choice, _ in Policy.POLICY_TYPE_CHOICES}
+        if unknown:
+            return Response({'error':f'unknown policy type: {", ".join(sorted(unknown))}'},400)
+        policies = policies.filter(policy_type__in=policy_types)
+    if params.get('is_active') in ('true', 'false'):
+        policies = policies.filter(is_active=params['is_active'] == 'true')
+    policies, _ = filter_validity(policies, params)
+
+    filename = f'policies-{timezone.now():%Y%m%d-%H%M%S}'
+    return export_response(request, policies.order_by('id'), columns, export_format, filename)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, PortfolioPermission])
+def portfolio_coverage(request:Request):
+    """
+    Coverage of the policy portfolio per policy type
+    
+    Goal: Exposure and remaining coverage of the portfolio without aggregating claims
+    Path: GET /policies/portfolio/coverage/
+    Authentication: JWT required, PortfolioPermission (admin, manager)
+    
+    Query Parameters:
+    - is_active: true or false (optional, all policies by default)
+    
+    Reads one coverage ledger row per policy (see claims/ledger.py).
+    
+    Response:
+    - 200: [{"policy_type": "auto", "policies": 120, "coverage_amount": "...", "claimed_amount": "...",
+            "approved_amount": "...", "paid_amount": "...", "remaining_coverage": "..."}]
+    """
+    policies = Policy.objects.all()
+    if request.query_params.get('is_active') in ('true', 'false'):
+        policies = policies.filter(is_active=request.query_params['is_active'] == 'true')
+    zero = Value(0, output_field=Policy._meta.get_field('coverage_amount'))
+    rows = (
+        policies.values('policy_type')
+        .annotate(
+            policies=Count('id'),
+            total_coverage=Sum('coverage_amount'),
+            claimed=Sum(Coalesce('coverage__claimed_amount', zero)),
+            approved=Sum(Coalesce('coverage__approved_amount', zero)),
+            paid=Sum(Coalesce('coverage__paid_amount', zero)),
+        )
+        .order_by('policy_type')
+    )
+    return Response([
+        {
+            'policy_type': row['policy_type'],
+            'policies': row['policies'],
+            'coverage_amount': str(row['total_coverage']),
+            'claimed_amount': str(row['claimed']),
+            'approved_amount': str(row['approved']),
+            'paid_amount': str(row['paid']),
+            'remaining_coverage': str(row['total_coverage'] - row['approved']),
+        }
+        for row in rows
+    ],200)
+
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, PortfolioPermission])
+def portfolio_analytics_view(request:Request):
+    """
+    Exposure, earned premium and loss ratios of the policy portfolio per policy type
+    
+    Goal: Loss-ratio reporting without exporting the policies to a spreadsheet
+    Path: GET /policies/portfolio/analytics/
+    Authentication: JWT required, PortfolioPermission (admin, manager)
+    
+    Query Parameters:
+    - as_of: YYYY-MM-DD, the day premium is earned to (default today)
+    - is_active: true or false (optional, all policies by default)
+    
+    A policy earns its premium pro rata over its term. loss_ratio is approved / earned premium,
+    paid_loss_ratio paid / earned premium (null without earned premium). Computed by the database
+    in one query over the policies and their coverage ledger (see policies/portfolio.py).
+    
+    Response:
+    - 200: {"as_of": "2025-06-30", "policy_types": [{"policy_type": "auto", "policies": 120,
+            "coverage_amount": "...", "premium": "...", "earned_premium": "...", "claimed_amount": "...",
+            "approved_amount": "...", "paid_amount": "...", "loss_ratio": "0.4210", "paid_loss_ratio": "0.3315"}],
+            "total": {same fields, policy_type null} or null without policies}
+    - 400: {"error": "dates must be in YYYY-MM-DD format"}
+    """
+    try:
+        as_of = datetime.strptime(request.query_params['as_of'], "%Y-%m-%d").date() if request.query_params.get('as_of') else timezone.localdate()
+    except ValueError:
+        return Response({'error':'dates must be in YYYY-MM-DD format'},400)
+    is_active = None
+    if request.query_params.get('is_active') in ('true', 'false'):
+        is_active = request.query_params['is_active'] == 'true'
+
+    rows = [
+        {name: str(value) if isinstance(value, Decimal) else value for name, value in row.items()}
+        for row in portfolio_analytics(as_of, is_active)
+    ]
+    return Response({
+        'as_of': as_of,
+        'policy_types': [row for row in rows if row['policy_type'] is not None],
+        'total': next((row for row in rows if row['policy_type'] is None), None),
+    },200)
+
+# columns of the error report of an import, {name: lookup}
+POLICY_IMPORT_ERROR_COLUMNS = {
+    'row': 'row',
+    'field': 'field',
+    'message': 'message',
+}
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, PolicyImportPermission])
+def import_policies(request:Request):
+    """
+    Bulk import policies from a CSV or NDJSON file
+    
+    Goal: Load the existing policies of a new insurer in one upload instead of one POST per policy
+    Path: POST /policies/imports/
+    Authentication: JWT required, PolicyImportPermission (admin, manager)
+    
+    Request Body (multipart/form-data):
+    - file: CSV with a header row, or NDJSON (one JSON object per line), UTF-8
+      columns: policyholder_name, policyholder_email, policy_type, coverage_amount, premium,
+      start_date, end_date (YYYY-MM-DD), is_active (optional, true by default).
+      Policy numbers are allocated by the import, other columns are ignored
+    - import_format: csv or ndjson (optional, read from the file extension by default)
+    
+    The file is imported in the background in batches: follow the progress with
+    GET /policies/imports/{import_id}/, download the rejected records with
+    GET /policies/imports/{import_id}/errors/ and restart an interrupted import with
+    POST /policies/imports/{import_id}/resume/. Large files can also be loaded with
+    `python manage.py import_policies <schema> <file>`.
+    
+    Response:
+    - 202: PolicyImportSerializer object
+    - 400: {"error": "..."} no file or unknown format
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error':'file is required'},400)
+    try:
+        import_format = detect_format(upload.name, request.data.get('import_format'))
+    except ValueError as e:
+        return Response({'error':str(e)},400)
+
+    job = PolicyImport(tenant=request.tenant, created_by=request.user, filename=upload.name, import_format=import_format)
+    default_storage.save(job.file_name, upload)
+    job.save()
+    transaction.on_commit(partial(schedule_import, job))
+    return Response(PolicyImportSerializer(job).data,202)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, PolicyImportPermission])
+def policy_import_details(request:Request,import_id:str):
+    """
+    Progress of a policy import
+    
+    Goal: Follow an import started with POST /policies/imports/
+    Path: GET /policies/imports/{import_id}/
+    Authentication: JWT required, PolicyImportPermission (admin, manager)
+    
+    Response:
+    - 200: PolicyImportSerializer object, "rows_done" records of the file have been imported or
+      rejected, status is pending, running, completed or failed (with the reason in "error")
+    - 404: Import not found
+    """
+    job = get_object_or_404(PolicyImport,pk=import_id)
+    return Response(PolicyImportSerializer(job).data,200)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, PolicyImportPermission])
+def policy_import_errors(request:Request,import_id:str):
+    """
+    Rejected records of a policy import
+    
+    Goal: Get what to fix in the file, one line per invalid field of a rejected record
+    Path: GET /policies/imports/{import_id}/errors/?export_format=csv|ndjson
+    Authentication: JWT required, PolicyImportPermission (admin, manager)
+    
+    Response:
+    - 200: text/csv or application/x-ndjson attachment with the columns row (1-based number of
+      the record in the file), field and message, in file order
+    - 400: unknown format
+    - 404: Import not found
+    """
+    export_format = request.query_params.get('export_format','csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response({'error':f'export_format must be one of {", ".join(EXPORT_FORMATS)}'},400)
+    job = get_object_or_404(PolicyImport,pk=import_id)
+    return export_response(
+        request,
+        PolicyImportError.objects.filter(job=job).order_by('row','id'),
+        POLICY_IMPORT_ERROR_COLUMNS,
+        export_format,
+        f'policy-import-{job.id}-errors',
+    )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, PolicyImportPermission])
+def resume_policy_import(request:Request,import_id:str):
+    """
+    Resume an interrupted policy import
+    
+    Goal: Carry on after a failure or a restart from the first record not imported yet
+    Path: POST /policies/imports/{import_id}/resume/
+    Authentication: JWT required, PolicyImportPermission (admin, manager)
+    
+    Records already imported or rejected are not read again, whatever the status of the import;
+    resuming an import that is still running is harmless, only one of the runs carries on.
+    
+    Response:
+    - 202: PolicyImportSerializer object
+    - 404: Import not found
+    - 409: {"error": "the import is already completed"}
+    """
+    job = get_object_or_404(PolicyImport,pk=import_id)
+    if job.status == 'completed':
+        return Response({'error':'the import is already completed'},409)
+    transaction.on_commit(partial(schedule_import, job))
+    return Response(PolicyImportSerializer(job).data,202)
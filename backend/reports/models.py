@@ -13,10 +13,19 @@ class Report(models.Model):
         ('policy_type_analysis', 'Policy Type Analysis'),
     ])
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     
     # Store filter criteria used to generate the report
     filters = models.JSONField(default=dict)
     
     # Store the generated report data
-    report_data = models.JSONField(default=dict)
\ No newline at end of file
+    report_data = models.JSONField(default=dict)
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the report list
+            models.Index(fields=['created_at', 'id'], name='report_created_idx'),
+            # latest change of the report list, its conditional GET validator
+            models.Index(fields=['updated_at'], name='report_updated_idx'),
+        ]
\ No newline at end of file
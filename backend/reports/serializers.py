@@ -7,7 +7,7 @@ class ReportSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     class Meta:
         model = Report
-        fields = ['id','tenant','name','created_at','created_by','filters','report_data']
+        fields = ['id','tenant','name','created_at','updated_at','created_by','filters','report_data']
 
 
     def update(self, instance, validated_data):
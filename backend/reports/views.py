@@ -4,11 +4,14 @@ from rest_framework.permissions import IsAuthenticated
 from .serializers import ReportSerializer
 from .models import Report
 from django.shortcuts import get_object_or_404
+from mlt_ins.pagination import OptionalKeysetPagination
+from mlt_ins.conditional import ConditionalGetMixin, Validators
+from django.db.models import Count, Max
 # Create your views here.
 
 
 
-class ListCreateReport(ListCreateAPIView):
+class ListCreateReport(ConditionalGetMixin, ListCreateAPIView):
     """
     List and create insurance reports
     
@@ -29,10 +32,26 @@ class ListCreateReport(ListCreateAPIView):
     - GET 200: [ReportSerializer objects]
     - POST 201: ReportSerializer object with created_by and tenant auto-assigned
     - POST 400: Validation errors
+
+    Pagination (GET):
+    - default: ?limit=&offset=
+    - keyset: ?pagination=cursor[&page_size=], then follow the returned next/previous links
+      (newest first, ordered on created_at, id)
+
+    Conditional GET:
+    - the response carries an ETag covering all the reports; If-None-Match with it answers 304
+      while none of them changed
     """
     permission_classes = [IsAuthenticated]
     queryset = Report.objects.all()
     serializer_class = ReportSerializer
+    pagination_class = OptionalKeysetPagination
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_validators(self):
+        reports = Report.objects.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+        # a deletion leaves the latest update as it was, so no Last-Modified for a collection
+        return Validators([reports['count'], reports['updated_at']])
 
 
     def perform_create(self, serializer):
@@ -42,7 +61,7 @@ class ListCreateReport(ListCreateAPIView):
         )
 
 
-class GetUpdateDeleteReport(RetrieveUpdateDestroyAPIView):
+class GetUpdateDeleteReport(ConditionalGetMixin, RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a specific report
     
@@ -58,8 +77,13 @@ class GetUpdateDeleteReport(RetrieveUpdateDestroyAPIView):
         "status": "draft|published|archived"
     }
     
+    Headers (GET):
+    - If-None-Match / If-Modified-Since: the ETag / Last-Modified of a previous GET, answered with
+      304 while the report did not change
+
     Response:
-    - GET 200: ReportSerializer object
+    - GET 200: ReportSerializer object, ETag and Last-Modified headers
+    - GET 304: Not modified
     - PUT/PATCH 200: Updated ReportSerializer object
     - DELETE 204: No content
     - 404: Report not found
@@ -72,6 +96,12 @@ class GetUpdateDeleteReport(RetrieveUpdateDestroyAPIView):
     def get_object(self):
         report_id = self.kwargs.get('report_id',None)
         return get_object_or_404(Report,pk=report_id)
+
+    def get_validators(self):
+        updated_at = Report.objects.filter(pk=self.kwargs['report_id']).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None
+        return Validators([updated_at], updated_at)
     
     def update(self, request, *args, **kwargs):
         kwargs['partial'] = True
@@ -9,6 +9,7 @@ from claims.utils import is_valid_uuid4
 from claims.serializers import ClaimSerializer
 from claims.models import Claim
 from .serializers import UserSerializer
+from mlt_ins.access import scope_queryset
 
 # Create your views here.
 @api_view(['GET'])
@@ -47,17 +48,21 @@ def get_user_assigned_claims(request:Request,user_id:str):
     
     Path Parameters:
     - user_id: UUID4 format user identifier
+
+    Query Parameters:
+    - fields, expand: same as the claim list (optional)
     
     Response:
-    - 200: [ClaimSerializer objects] - List of assigned claims
+    - 200: [ClaimSerializer objects] - List of assigned claims (an adjuster only sees their own)
     - 400: {"error": "please provide a valid uuid4 user_id"}
     - 404: User not found
     """
     if not is_valid_uuid4(user_id):
         return Response({'error':'please provide a valid uuid4 user_id'},status=400)
     user = get_object_or_404(User,pk=user_id)
-    assigned_claims = user.assigned_claims
-    return Response(ClaimSerializer(assigned_claims,many=True).data,200)
+    assigned_claims = scope_queryset(user.assigned_claims.all(), request.user, 'view', 'claim')
+    assigned_claims = ClaimSerializer.setup_eager_loading(assigned_claims, request, many=True)
+    return Response(ClaimSerializer(assigned_claims,many=True,context={'request':request}).data,200)
 
 
 